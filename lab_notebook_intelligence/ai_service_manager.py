@@ -1,5 +1,6 @@
 # Copyright (c) Mehmet Bektas <mbektasgh@outlook.com>
 
+import asyncio
 import json
 import logging
 import os
@@ -24,6 +25,7 @@ from lab_notebook_intelligence.api import (
     MarkdownData,
     MCPServer,
     NotebookIntelligenceExtension,
+    Signal,
     TelemetryEvent,
     TelemetryListener,
     Tool,
@@ -43,6 +45,7 @@ from lab_notebook_intelligence.llm_providers.openai_compatible_llm_provider impo
     OpenAICompatibleLLMProvider,
 )
 from lab_notebook_intelligence.mcp_manager import MCPManager
+from lab_notebook_intelligence.request_runtime import run_in_new_loop
 
 log = logging.getLogger(__name__)
 
@@ -108,12 +111,16 @@ class AIServiceManager(Host):
         self.completion_context_providers: Dict[str, CompletionContextProvider] = {}
         self.telemetry_listeners: Dict[str, TelemetryListener] = {}
         self._extension_toolsets: Dict[str, list[Toolset]] = {}
+        # extension toolsets by (extension id, toolset id)
+        self._extension_toolsets_by_id: Dict[tuple, Toolset] = {}
+        self._extension_toolsets_version = 0
         self._options = options.copy()
         self._nbi_config = NBIConfig({"server_root_dir": self._options.get("server_root_dir", "")})
         self._openai_compatible_llm_provider = OpenAICompatibleLLMProvider()
         self._litellm_compatible_llm_provider = LiteLLMCompatibleLLMProvider()
         self._ollama_llm_provider = OllamaLLMProvider()
         self._extensions = []
+        self._extension_participant_ids: set[str] = set()
         self.initialize()
 
     @property
@@ -126,11 +133,12 @@ class AIServiceManager(Host):
 
     def initialize(self):
         self.chat_participants = {}
+        self._extension_participant_ids = set()
         self.register_llm_provider(GitHubCopilotLLMProvider())
         self.register_llm_provider(self._openai_compatible_llm_provider)
         self.register_llm_provider(self._litellm_compatible_llm_provider)
         self.register_llm_provider(self._ollama_llm_provider)
-        self._mcp_manager = MCPManager(self.nbi_config.mcp)
+        self._mcp_manager = MCPManager(self.nbi_config.mcp, self.nbi_config.mcp_tool_catalog_file)
         for participant in self._mcp_manager.get_mcp_participants():
             self.register_chat_participant(participant)
 
@@ -191,6 +199,13 @@ class AIServiceManager(Host):
     def update_mcp_servers(self):
         self._mcp_manager.update_mcp_servers(self.nbi_config.mcp)
 
+    @property
+    def mcp_tools_changed_signal(self) -> Signal:
+        return self._mcp_manager.tools_changed_signal
+
+    def shutdown(self):
+        self._mcp_manager.shutdown()
+
     def initialize_extensions(self):
         extensions_dir = path.join(sys.prefix, "share", "jupyter", "nbi_extensions")
         if not path.exists(extensions_dir):
@@ -206,7 +221,11 @@ class AIServiceManager(Host):
                         class_name = data["class"]
                         extension = self.load_extension(class_name)
                         if extension:
+                            participant_ids = set(self.chat_participants.keys())
                             extension.activate(self)
+                            self._extension_participant_ids.update(
+                                set(self.chat_participants.keys()) - participant_ids
+                            )
                             log.info(f"Activated NBI extension '{class_name}'.")
                             self._extensions.append(extension)
             except Exception as e:
@@ -271,6 +290,8 @@ class AIServiceManager(Host):
         if provider_id not in self._extension_toolsets:
             self._extension_toolsets[provider_id] = []
         self._extension_toolsets[provider_id].append(toolset)
+        self._extension_toolsets_by_id.setdefault((provider_id, toolset.id), toolset)
+        self._extension_toolsets_version += 1
         log.debug(f"Registered toolset '{toolset.id}' from provider '{provider_id}'.")
 
     @property
@@ -429,6 +450,13 @@ class AIServiceManager(Host):
         request.command = command
         request.prompt = prompt
         response.participant_id = participant_id
+        if participant.id in self._extension_participant_ids:
+            # extension participants may make blocking calls such as the sync
+            # ChatModel.completions, they run on a worker thread with their own loop
+            # so that they cannot block the shared request loop
+            return await asyncio.to_thread(
+                run_in_new_loop, participant.handle_chat_request(request, response, options)
+            )
         return await participant.handle_chat_request(request, response, options)
 
     async def get_completion_context(self, request: ContextRequest) -> CompletionContext:
@@ -450,7 +478,10 @@ class AIServiceManager(Host):
             ):
                 continue
             try:
-                provider_context = provider.handle_completion_context_request(request)
+                # providers are synchronous, they must not block the shared request loop
+                provider_context = await asyncio.to_thread(
+                    provider.handle_completion_context_request, request
+                )
                 if provider_context.items:
                     context.items += provider_context.items
             except Exception as e:
@@ -462,11 +493,15 @@ class AIServiceManager(Host):
 
     async def emit_telemetry_event(self, event: TelemetryEvent):
         for listener in self.telemetry_listeners.values():
-            listener.on_telemetry_event(event)
+            await asyncio.to_thread(listener.on_telemetry_event, event)
 
     def get_mcp_servers(self):
         return self._mcp_manager.get_mcp_servers()
 
+    @property
+    def mcp_tool_result_cache_metrics(self) -> dict:
+        return self._mcp_manager.tool_result_cache_metrics
+
     def get_mcp_server(self, server_name: str) -> MCPServer:
         return self._mcp_manager.get_mcp_server(server_name)
 
@@ -481,26 +516,26 @@ class AIServiceManager(Host):
         return self._extension_toolsets
 
     def get_extension_toolset(self, extension_id: str, toolset_id: str) -> Toolset:
-        if extension_id not in self._extension_toolsets:
-            return None
-
-        extension_toolsets = self._extension_toolsets[extension_id]
-        for toolset in extension_toolsets:
-            if toolset_id == toolset.id:
-                return toolset
-
-        return None
+        return self._extension_toolsets_by_id.get((extension_id, toolset_id))
 
     def get_extension_tool(self, extension_id: str, toolset_id: str, tool_name: str) -> Tool:
-        if extension_id not in self._extension_toolsets:
+        toolset = self.get_extension_toolset(extension_id, toolset_id)
+        if toolset is None:
             return None
-        extension_toolsets = self._extension_toolsets[extension_id]
-        for toolset in extension_toolsets:
-            if toolset_id == toolset.id:
-                for tool in toolset.tools:
-                    if tool.name == tool_name:
-                        return tool
-        return None
+        return toolset.get_tool(tool_name)
+
+    @property
+    def tools_version(self):
+        return (
+            self._extension_toolsets_version,
+            # toolset tools lists are public, they can change without a version bump.
+            # Registries cached by this key keep their tools alive, so ids are not reused
+            tuple(
+                tuple(id(tool) for tool in toolset.tools)
+                for toolset in self._extension_toolsets_by_id.values()
+            ),
+            self._mcp_manager.tools_version,
+        )
 
     def get_extension(self, extension_id: str) -> NotebookIntelligenceExtension:
         for extension in self._extensions:
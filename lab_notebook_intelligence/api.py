@@ -1,6 +1,7 @@
 # Copyright (c) Mehmet Bektas <mbektasgh@outlook.com>
 
 import asyncio
+import inspect
 import logging
 import uuid
 from dataclasses import asdict, dataclass
@@ -11,6 +12,18 @@ from fuzzy_json import loads as fuzzy_json_loads
 from mcp.server.fastmcp.tools import Tool as MCPToolClass
 
 from lab_notebook_intelligence.config import NBIConfig
+from lab_notebook_intelligence.context_budget import (
+    fit_appended_messages_for_model,
+    fit_messages_for_model,
+    get_token_counter,
+)
+from lab_notebook_intelligence.prompt_cache import canonical_tool_schemas
+from lab_notebook_intelligence.request_runtime import waiting_on_user
+from lab_notebook_intelligence.tool_retrieval import (
+    ToolSearchIndex,
+    tool_query,
+    tool_retrieval_stats,
+)
 
 log = logging.getLogger(__name__)
 
@@ -24,13 +37,16 @@ class RequestDataType(str, Enum):
     CancelChatRequest = "cancel-chat-request"
     InlineCompletionRequest = "inline-completion-request"
     CancelInlineCompletionRequest = "cancel-inline-completion-request"
+    ActiveDocumentChange = "active-document-change"
 
 
 class BackendMessageType(str, Enum):
     StreamMessage = "stream-message"
     StreamEnd = "stream-end"
     RunUICommand = "run-ui-command"
+    RunUICommands = "run-ui-commands"
     GitHubCopilotLoginStatusChange = "github-copilot-login-status-change"
+    MCPToolsChange = "mcp-tools-change"
 
 
 class ResponseStreamDataType(str, Enum):
@@ -70,7 +86,8 @@ class SignalImpl(Signal):
         super().__init__()
 
     def emit(self, *args, **kwargs) -> None:
-        for listener in self._listeners:
+        # listeners can disconnect from other threads while emitting
+        for listener in list(self._listeners):
             listener(*args, **kwargs)
 
 
@@ -88,6 +105,57 @@ class CancelToken:
         return self._cancellation_signal
 
 
+class CancelScope:
+    """
+    Async context manager that cancels the current task as soon as cancellation is
+    requested on the token, so that pending network reads are aborted right away
+    instead of at the next poll. Cancellation requested by the token is not raised
+    out of the scope, check the cancelled property to find out if it happened.
+    """
+
+    def __init__(self, cancel_token: CancelToken):
+        self._cancel_token = cancel_token
+        self._loop: asyncio.AbstractEventLoop = None
+        self._task: asyncio.Task = None
+        self._exited = False
+        self._cancelled = False
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    async def __aenter__(self) -> "CancelScope":
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.current_task()
+        if self._cancel_token is not None:
+            self._cancel_token.cancellation_signal.connect(self._on_cancel_requested)
+            if self._cancel_token.is_cancel_requested:
+                self._cancel_task()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> bool:
+        self._exited = True
+        if self._cancel_token is not None:
+            self._cancel_token.cancellation_signal.disconnect(self._on_cancel_requested)
+        if self._cancelled and exc_type is asyncio.CancelledError:
+            # python 3.11+ tracks cancellation requests, propagate other cancellations
+            if hasattr(self._task, "uncancel") and self._task.uncancel() > 0:
+                return False
+            return True
+        return False
+
+    def _on_cancel_requested(self) -> None:
+        # cancellation is usually requested from the websocket IO loop
+        if not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._cancel_task)
+
+    def _cancel_task(self) -> None:
+        if self._exited or self._cancelled:
+            return
+        self._cancelled = True
+        self._task.cancel()
+
+
 @dataclass
 class RequestToolSelection:
     built_in_toolsets: list[str] = None
@@ -95,6 +163,14 @@ class RequestToolSelection:
     extension_tools: dict[str, dict[str, list[str]]] = None
 
 
+@dataclass
+class ActiveDocument:
+    # path relative to the server root
+    path: str = ""
+    # whether the document has unsaved changes in the browser
+    dirty: bool = False
+
+
 @dataclass
 class ChatRequest:
     host: "Host" = None
@@ -250,6 +326,13 @@ class ChatResponse:
     def finish(self) -> None:
         raise NotImplemented
 
+    @property
+    def active_document(self) -> Union[ActiveDocument, None]:
+        """
+        Document active in the browser that sent the request, if known.
+        """
+        return None
+
     @property
     def user_input_signal(self) -> Signal:
         return self._user_input_signal
@@ -258,24 +341,84 @@ class ChatResponse:
         self._user_input_signal.emit(data)
 
     @staticmethod
-    async def wait_for_chat_user_input(response: "ChatResponse", callback_id: str):
-        resp = {"data": None}
-
-        def _on_user_input(data: dict):
-            if data["callback_id"] == callback_id:
-                resp["data"] = data["data"]
-
-        response.user_input_signal.connect(_on_user_input)
+    async def _wait_for_callback(
+        signal: Signal,
+        callback_id: str,
+        key: str,
+        cancel_token: CancelToken = None,
+        timeout: float = None,
+    ):
+        """
+        Waits for the signal to be emitted for callback_id and returns data[key].
+        Signals are emitted from the websocket thread, the result is handed over to
+        the waiting loop. Raises asyncio.CancelledError if cancellation is requested
+        on the token and TimeoutError if timeout (in seconds) expires.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def _set_result(result):
+            if not future.done():
+                future.set_result(result)
+
+        def _cancel():
+            if not future.done():
+                future.cancel()
+
+        def _call_on_loop(callback, *args):
+            try:
+                loop.call_soon_threadsafe(callback, *args)
+            except RuntimeError:
+                # loop is closed, nobody is waiting anymore
+                pass
+
+        def _on_data(data: dict):
+            if data.get("callback_id") == callback_id:
+                _call_on_loop(_set_result, data.get(key))
+
+        def _on_cancel_requested():
+            _call_on_loop(_cancel)
+
+        signal.connect(_on_data)
+        if cancel_token is not None:
+            cancel_token.cancellation_signal.connect(_on_cancel_requested)
+            if cancel_token.is_cancel_requested:
+                future.cancel()
+        try:
+            if timeout is not None and timeout > 0:
+                return await asyncio.wait_for(future, timeout)
+            return await future
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"No response received for callback '{callback_id}'")
+        finally:
+            signal.disconnect(_on_data)
+            if cancel_token is not None:
+                cancel_token.cancellation_signal.disconnect(_on_cancel_requested)
 
-        while True:
-            if resp["data"] is not None:
-                response.user_input_signal.disconnect(_on_user_input)
-                return resp["data"]
-            await asyncio.sleep(0.1)
+    @staticmethod
+    async def wait_for_chat_user_input(
+        response: "ChatResponse",
+        callback_id: str,
+        cancel_token: CancelToken = None,
+        timeout: float = None,
+    ):
+        # the request does not count against the runtime's concurrency limit while
+        # the user has not answered
+        async with waiting_on_user():
+            return await ChatResponse._wait_for_callback(
+                response.user_input_signal, callback_id, "data", cancel_token, timeout
+            )
 
     async def run_ui_command(self, command: str, args: dict = {}) -> None:
         raise NotImplemented
 
+    async def run_ui_commands(self, commands: list[tuple[str, dict]]) -> list:
+        """
+        Runs (command, args) pairs in order and returns their results. Responses that
+        can send all commands in a single message override this.
+        """
+        return [await self.run_ui_command(command, args) for command, args in commands]
+
     @property
     def run_ui_command_response_signal(self) -> Signal:
         return self._run_ui_command_response_signal
@@ -284,20 +427,15 @@ class ChatResponse:
         self._run_ui_command_response_signal.emit(data)
 
     @staticmethod
-    async def wait_for_run_ui_command_response(response: "ChatResponse", callback_id: str):
-        resp = {"result": None}
-
-        def _on_ui_command_response(data: dict):
-            if data["callback_id"] == callback_id:
-                resp["result"] = data["result"]
-
-        response.run_ui_command_response_signal.connect(_on_ui_command_response)
-
-        while True:
-            if resp["result"] is not None:
-                response.run_ui_command_response_signal.disconnect(_on_ui_command_response)
-                return resp["result"]
-            await asyncio.sleep(0.1)
+    async def wait_for_run_ui_command_response(
+        response: "ChatResponse",
+        callback_id: str,
+        cancel_token: CancelToken = None,
+        timeout: float = None,
+    ):
+        return await ChatResponse._wait_for_callback(
+            response.run_ui_command_response_signal, callback_id, "result", cancel_token, timeout
+        )
 
 
 @dataclass
@@ -335,6 +473,14 @@ class Tool:
     def schema(self) -> dict:
         raise NotImplemented
 
+    @property
+    def concurrency_safe(self) -> bool:
+        """
+        Whether the tool can run at the same time as other concurrency safe tools
+        called in the same round. Only tools without side effects should be.
+        """
+        return False
+
     def pre_invoke(
         self, request: ChatRequest, tool_args: dict
     ) -> Union[ToolPreInvokeResponse, None]:
@@ -366,12 +512,33 @@ class Toolset:
         self.provider = provider
         self.tools: list[Tool] = tools
         self.instructions: Union[str, None] = instructions
+        # incremented when tools are added or removed
+        self.version = 0
+        self._tools_by_name: dict[str, Tool] = {}
+        self._tools_by_name_key = None
+        self._indexed_tools: tuple[Tool, ...] = ()
 
     def add_tool(self, tool: Tool) -> None:
         self.tools.append(tool)
+        self.version += 1
 
     def remove_tool(self, tool: Tool) -> None:
         self.tools.remove(tool)
+        self.version += 1
+
+    def get_tool(self, tool_name: str) -> Union[Tool, None]:
+        # tools list is public, the index is keyed by the ids of the tools so that
+        # changes made without add_tool, such as replacing a tool, are also caught
+        tools = tuple(self.tools)
+        key = tuple(id(tool) for tool in tools)
+        if self._tools_by_name_key != key:
+            tools_by_name = {}
+            for tool in tools:
+                tools_by_name.setdefault(tool.name, tool)
+            # indexed tools are kept alive, so that their ids are not reused
+            self._indexed_tools = tools
+            self._tools_by_name, self._tools_by_name_key = tools_by_name, key
+        return self._tools_by_name.get(tool_name)
 
 
 class SimpleTool(Tool):
@@ -384,6 +551,7 @@ class SimpleTool(Tool):
         title: str = None,
         auto_approve: bool = False,
         has_var_args: bool = False,
+        concurrency_safe: bool = False,
     ):
         super().__init__()
         self._tool_function = tool_function
@@ -393,6 +561,7 @@ class SimpleTool(Tool):
         self._title = title
         self._auto_approve = auto_approve
         self._has_var_args = has_var_args
+        self._concurrency_safe = concurrency_safe
 
     @property
     def name(self) -> str:
@@ -414,6 +583,10 @@ class SimpleTool(Tool):
     def schema(self) -> dict:
         return self._schema
 
+    @property
+    def concurrency_safe(self) -> bool:
+        return self._concurrency_safe
+
     def pre_invoke(
         self, request: ChatRequest, tool_args: dict
     ) -> Union[ToolPreInvokeResponse, None]:
@@ -462,6 +635,52 @@ class MCPServer:
     async def call_tool(self, tool_name: str, tool_args: dict):
         return NotImplemented
 
+    @property
+    def tools_version(self) -> int:
+        """
+        Changes when the tool list of the server changes.
+        """
+        return 0
+
+
+class ToolRegistry:
+    """
+    Tools available to a request, indexed by name. It is built once per request so
+    that tool lists and their schemas are not recreated on every lookup.
+    """
+
+    def __init__(self, tools: list[Tool]):
+        self._tools = list(tools)
+        self._tools_by_name: dict[str, Tool] = {}
+        for tool in self._tools:
+            # first tool wins on name conflicts, same as a lookup by iteration
+            self._tools_by_name.setdefault(tool.name, tool)
+        self._schemas: list[dict] = None
+        self._search_index: ToolSearchIndex = None
+
+    @property
+    def tools(self) -> list[Tool]:
+        return self._tools
+
+    @property
+    def schemas(self) -> list[dict]:
+        if self._schemas is None:
+            # same bytes for the same tools, so that providers can cache the prompt prefix
+            self._schemas = canonical_tool_schemas([tool.schema for tool in self._tools])
+        return self._schemas
+
+    @property
+    def search_index(self) -> ToolSearchIndex:
+        if self._search_index is None:
+            self._search_index = ToolSearchIndex(self.schemas)
+        return self._search_index
+
+    def get_tool(self, tool_name: str) -> Union[Tool, None]:
+        return self._tools_by_name.get(tool_name)
+
+    def __len__(self) -> int:
+        return len(self._tools)
+
 
 def auto_approve(tool: SimpleTool):
     """
@@ -471,6 +690,14 @@ def auto_approve(tool: SimpleTool):
     return tool
 
 
+def concurrency_safe(tool: SimpleTool):
+    """
+    Decorator to mark a tool without side effects as safe to run concurrently.
+    """
+    tool._concurrency_safe = True
+    return tool
+
+
 def tool(tool_function: Callable) -> SimpleTool:
     mcp_tool = MCPToolClass.from_function(tool_function)
     has_var_args = False
@@ -501,6 +728,25 @@ def tool(tool_function: Callable) -> SimpleTool:
     )
 
 
+@dataclass
+class _PreparedToolCall:
+    tool_call: dict
+    tool: Tool
+    args: dict
+    pre_invoke_response: ToolPreInvokeResponse = None
+
+    @property
+    def needs_confirmation(self) -> bool:
+        return (
+            self.pre_invoke_response is not None
+            and self.pre_invoke_response.confirmationMessage is not None
+        )
+
+    @property
+    def runs_concurrently(self) -> bool:
+        return self.tool.concurrency_safe and not self.needs_confirmation
+
+
 class ChatMode:
     def __init__(self, id: str, name: str, instructions: str = None):
         self.id = id
@@ -538,6 +784,12 @@ class ChatParticipant:
         # any context provider can be used
         return set(["*"])
 
+    def get_tool_registry(self, request: ChatRequest) -> ToolRegistry:
+        """
+        Returns the tools available to the request.
+        """
+        return ToolRegistry(self.tools)
+
     async def handle_chat_request(
         self, request: ChatRequest, response: ChatResponse, options: dict = {}
     ) -> None:
@@ -550,8 +802,10 @@ class ChatParticipant:
         options: dict = {},
         tool_context: dict = {},
         tool_choice="auto",
+        tool_registry: ToolRegistry = None,
     ) -> None:
-        tools = self.tools
+        if tool_registry is None:
+            tool_registry = self.get_tool_registry(request)
 
         messages = request.chat_history.copy()
 
@@ -559,39 +813,234 @@ class ChatParticipant:
         if system_prompt is not None:
             messages = [{"role": "system", "content": system_prompt}] + messages
 
-        if len(tools) == 0:
-            request.host.chat_model.completions(
-                messages,
+        if len(tool_registry) == 0:
+            await request.host.chat_model.acompletions(
+                fit_messages_for_model(messages, request.host.chat_model),
                 tools=None,
                 cancel_token=request.cancel_token,
                 response=response,
             )
             return
 
-        openai_tools = [tool.schema for tool in tools]
+        openai_tools = tool_registry.schemas
 
-        tool_call_rounds = []
         # TODO overrides options arg
         options = {"tool_choice": tool_choice}
-
-        async def _tool_call_loop(tool_call_rounds: list):
+        max_rounds = request.host.nbi_config.max_tool_call_rounds
+
+        # large tool selections are pruned to the tools relevant to the request. built-in
+        # tools are always sent since toolset instructions refer to them, and so are tools
+        # the model called in this request
+        max_tool_schemas = request.host.nbi_config.max_tool_schemas
+        pinned_tool_names = set(
+            tool.name for tool in tool_registry.tools if isinstance(tool, SimpleTool)
+        )
+        query = tool_query(request.prompt, request.chat_history)
+        sent_tools: list[dict] = None
+        tokens_saved = 0
+
+        def _select_tools() -> list[dict]:
+            nonlocal sent_tools, tokens_saved
+            if sent_tools is None:
+                selected_tools = tool_registry.search_index.select(
+                    query, max_tool_schemas, pinned_tool_names
+                )
+            else:
+                # tools sent in earlier rounds are at the front of the cached prompt
+                # prefix, they are kept and only tools called since are added
+                sent_tool_names = set(schema["function"]["name"] for schema in sent_tools)
+                selected_tools = (
+                    sent_tools
+                    if pinned_tool_names.issubset(sent_tool_names)
+                    else [
+                        schema
+                        for schema in openai_tools
+                        if schema["function"]["name"] in sent_tool_names
+                        or schema["function"]["name"] in pinned_tool_names
+                    ]
+                )
+            if selected_tools is not sent_tools:
+                tokens_saved = 0
+                if len(selected_tools) < len(openai_tools):
+                    token_counter = get_token_counter(request.host.chat_model.id)
+                    all_tools_tokens = token_counter.count_tools(openai_tools)
+                    tokens_saved = all_tools_tokens - token_counter.count_tools(selected_tools)
+                sent_tools = selected_tools
+            tool_retrieval_stats.record(len(openai_tools), len(selected_tools), tokens_saved)
+            return selected_tools
+
+        async def _call_tool(tool_call: dict, tool_to_call: Tool, args: dict) -> dict:
+            # a failing call is reported to the model, so that the round and the calls
+            # running concurrently with it go on
             try:
+                tool_call_response = await tool_to_call.handle_tool_call(
+                    request, response, tool_context, args
+                )
+            except Exception as e:
+                log.error(f"Error calling tool '{tool_to_call.name}': {e}")
+                tool_call_response = f"Error occurred while calling tool: {str(e)}"
+            return {
+                "role": "tool",
+                "content": str(tool_call_response),
+                "tool_call_id": tool_call["id"],
+            }
+
+        def _stream_pre_invoke_message(tool_pre_invoke_response: ToolPreInvokeResponse):
+            if tool_pre_invoke_response is not None and tool_pre_invoke_response.message:
+                response.stream(
+                    MarkdownData(
+                        f"&#x2713; {tool_pre_invoke_response.message}...",
+                        tool_pre_invoke_response.detail,
+                    )
+                )
+
+        async def _confirm_tool_call(
+            tool_call: dict, tool_pre_invoke_response: ToolPreInvokeResponse
+        ) -> bool:
+            response.stream(
+                ConfirmationData(
+                    title=tool_pre_invoke_response.confirmationTitle,
+                    message=tool_pre_invoke_response.confirmationMessage,
+                    confirmArgs={
+                        "id": response.message_id,
+                        "data": {
+                            "callback_id": tool_call["id"],
+                            "data": {"confirmed": True},
+                        },
+                    },
+                    cancelArgs={
+                        "id": response.message_id,
+                        "data": {
+                            "callback_id": tool_call["id"],
+                            "data": {"confirmed": False},
+                        },
+                    },
+                )
+            )
+            user_input = await ChatResponse.wait_for_chat_user_input(
+                response, tool_call["id"], request.cancel_token
+            )
+            return user_input["confirmed"] != False
+
+        async def _run_tool_calls(tool_calls: list[dict]) -> bool:
+            """
+            Runs tool calls of a round and appends their results to messages in call
+            order. Consecutive concurrency safe calls that don't need confirmation run
+            together. Returns False if the request should not continue.
+            """
+            prepared_calls = []
+            for tool_call in tool_calls:
+                if "id" not in tool_call:
+                    tool_call["id"] = uuid.uuid4().hex
+
+                tool_name = tool_call["function"]["name"]
+                tool_to_call = tool_registry.get_tool(tool_name)
+                if tool_to_call is None:
+                    log.error(
+                        f"Tool not found: {tool_name}, args: {tool_call['function']['arguments']}"
+                    )
+                    response.stream(
+                        MarkdownData(
+                            "Oops! Failed to find requested tool. Please try again with a different prompt."
+                        )
+                    )
+                    response.finish()
+                    return False
+
+                pinned_tool_names.add(tool_name)
+                args = self._parse_tool_args(tool_to_call, tool_call)
+                prepared_calls.append(
+                    _PreparedToolCall(
+                        tool_call, tool_to_call, args, tool_to_call.pre_invoke(request, args)
+                    )
+                )
+
+            i = 0
+            while i < len(prepared_calls):
+                if request.cancel_token.is_cancel_requested:
+                    return False
+
+                batch_end = i + 1
+                if prepared_calls[i].runs_concurrently:
+                    while (
+                        batch_end < len(prepared_calls)
+                        and prepared_calls[batch_end].runs_concurrently
+                    ):
+                        batch_end += 1
+                batch = prepared_calls[i:batch_end]
+                i = batch_end
+
+                if len(batch) > 1:
+                    for prepared_call in batch:
+                        _stream_pre_invoke_message(prepared_call.pre_invoke_response)
+                    log.debug(f"Running {len(batch)} tool calls concurrently")
+                    function_call_result_messages = await asyncio.gather(
+                        *[
+                            _call_tool(
+                                prepared_call.tool_call, prepared_call.tool, prepared_call.args
+                            )
+                            for prepared_call in batch
+                        ]
+                    )
+                    messages.extend(function_call_result_messages)
+                    continue
+
+                prepared_call = batch[0]
+                _stream_pre_invoke_message(prepared_call.pre_invoke_response)
+                if prepared_call.needs_confirmation:
+                    confirmed = await _confirm_tool_call(
+                        prepared_call.tool_call, prepared_call.pre_invoke_response
+                    )
+                    if not confirmed:
+                        response.finish()
+                        return False
+                messages.append(
+                    await _call_tool(
+                        prepared_call.tool_call, prepared_call.tool, prepared_call.args
+                    )
+                )
+
+            return True
+
+        sent_messages: list[dict] = None
+        sent_message_count = 0
+        try:
+            for _ in range(max_rounds):
                 if request.cancel_token.is_cancel_requested:
                     return
 
-                tool_response = request.host.chat_model.completions(
-                    messages,
-                    openai_tools,
+                selected_tools = _select_tools()
+                # messages sent in earlier rounds are kept byte-identical for the prompt
+                # cache, only the messages added since are fitted
+                if sent_messages is None:
+                    # copied, messages is appended to while sent_messages has to stay as sent
+                    sent_messages = list(
+                        fit_messages_for_model(messages, request.host.chat_model, selected_tools)
+                    )
+                else:
+                    sent_messages = fit_appended_messages_for_model(
+                        sent_messages,
+                        messages[sent_message_count:],
+                        request.host.chat_model,
+                        selected_tools,
+                    )
+                sent_message_count = len(messages)
+                tool_response = await request.host.chat_model.acompletions(
+                    sent_messages,
+                    selected_tools,
                     cancel_token=request.cancel_token,
                     options=options,
                 )
+                if request.cancel_token.is_cancel_requested or tool_response is None:
+                    return
                 # after first call, set tool_choice to auto
                 options["tool_choice"] = "auto"
 
+                tool_calls = []
                 for choice in tool_response["choices"]:
                     if choice["message"].get("tool_calls", None) is not None:
                         for tool_call in choice["message"]["tool_calls"]:
-                            tool_call_rounds.append(tool_call)
+                            tool_calls.append(tool_call)
                     elif choice["message"].get("content", None) is not None:
                         response.stream(
                             MarkdownData(tool_response["choices"][0]["message"]["content"])
@@ -599,129 +1048,50 @@ class ChatParticipant:
 
                     messages.append(choice["message"])
 
-                had_tool_call = len(tool_call_rounds) > 0
-
-                # handle first tool calls
-                while len(tool_call_rounds) > 0:
-                    if request.cancel_token.is_cancel_requested:
-                        return
-
-                    tool_call = tool_call_rounds[0]
-                    if "id" not in tool_call:
-                        tool_call["id"] = uuid.uuid4().hex
-                    tool_call_rounds = tool_call_rounds[1:]
-
-                    tool_name = tool_call["function"]["name"]
-                    print("Tool name is : ", tool_name)
-                    tool_to_call = self._get_tool_by_name(tool_name)
-                    if tool_to_call is None:
-                        log.error(
-                            f"Tool not found: {tool_name}, args: {tool_call['function']['arguments']}"
-                        )
-                        response.stream(
-                            MarkdownData(
-                                "Oops! Failed to find requested tool. Please try again with a different prompt."
-                            )
-                        )
-                        response.finish()
-                        return
-
-                    print("Tool to call is : ", tool_to_call)
-
-                    if type(tool_call["function"]["arguments"]) is dict:
-                        args = tool_call["function"]["arguments"]
-                    elif not tool_call["function"]["arguments"].startswith("{"):
-                        args = tool_call["function"]["arguments"]
-                    else:
-                        args = fuzzy_json_loads(tool_call["function"]["arguments"])
-
-                    tool_properties = tool_to_call.schema["function"]["parameters"]["properties"]
-                    if type(args) is str:
-                        if (
-                            len(tool_properties) == 1
-                            and tool_call["function"]["arguments"] is not None
-                        ):
-                            tool_property = list(tool_properties.keys())[0]
-                            args = {tool_property: args}
-                        else:
-                            args = {}
-
-                    tool_pre_invoke_response = tool_to_call.pre_invoke(request, args)
-                    if tool_pre_invoke_response is not None:
-                        if tool_pre_invoke_response.message is not None:
-                            response.stream(
-                                MarkdownData(
-                                    f"&#x2713; {tool_pre_invoke_response.message}...",
-                                    tool_pre_invoke_response.detail,
-                                )
-                            )
-                        if tool_pre_invoke_response.confirmationMessage is not None:
-                            response.stream(
-                                ConfirmationData(
-                                    title=tool_pre_invoke_response.confirmationTitle,
-                                    message=tool_pre_invoke_response.confirmationMessage,
-                                    confirmArgs={
-                                        "id": response.message_id,
-                                        "data": {
-                                            "callback_id": tool_call["id"],
-                                            "data": {"confirmed": True},
-                                        },
-                                    },
-                                    cancelArgs={
-                                        "id": response.message_id,
-                                        "data": {
-                                            "callback_id": tool_call["id"],
-                                            "data": {"confirmed": False},
-                                        },
-                                    },
-                                )
-                            )
-                            user_input = await ChatResponse.wait_for_chat_user_input(
-                                response, tool_call["id"]
-                            )
-                            if user_input["confirmed"] == False:
-                                response.finish()
-                                return
-
-                    tool_call_response = await tool_to_call.handle_tool_call(
-                        request, response, tool_context, args
-                    )
-
-                    function_call_result_message = {
-                        "role": "tool",
-                        "content": str(tool_call_response),
-                        "tool_call_id": tool_call["id"],
-                    }
-
-                    messages.append(function_call_result_message)
-
-                if had_tool_call:
-                    await _tool_call_loop(tool_call_rounds)
+                if len(tool_calls) == 0:
+                    response.finish()
                     return
 
-                if len(tool_call_rounds) > 0:
-                    await _tool_call_loop(tool_call_rounds)
-                    return
-                else:
-                    response.finish()
+                if not await _run_tool_calls(tool_calls):
                     return
-            except Exception as e:
-                log.error(f"Error in tool call loop: {str(e)}")
-                response.stream(
-                    MarkdownData(
-                        f"Oops! I am sorry, there was a problem generating response with tools. Please try again. You can check server logs for more details."
-                    )
+
+            log.warning(f"Stopped tool call loop after {max_rounds} rounds")
+            response.stream(
+                MarkdownData(
+                    f"Stopped after {max_rounds} rounds of tool calls. You can ask me to continue."
                 )
-                response.finish()
-                return
+            )
+            response.finish()
+        except asyncio.CancelledError:
+            # waits for UI responses are cancelled with the request
+            if not request.cancel_token.is_cancel_requested:
+                raise
+        except Exception as e:
+            log.error(f"Error in tool call loop: {str(e)}")
+            response.stream(
+                MarkdownData(
+                    f"Oops! I am sorry, there was a problem generating response with tools. Please try again. You can check server logs for more details."
+                )
+            )
+            response.finish()
 
-        await _tool_call_loop(tool_call_rounds)
+    def _parse_tool_args(self, tool_to_call: Tool, tool_call: dict) -> dict:
+        if type(tool_call["function"]["arguments"]) is dict:
+            args = tool_call["function"]["arguments"]
+        elif not tool_call["function"]["arguments"].startswith("{"):
+            args = tool_call["function"]["arguments"]
+        else:
+            args = fuzzy_json_loads(tool_call["function"]["arguments"])
 
-    def _get_tool_by_name(self, name: str) -> Tool:
-        for tool in self.tools:
-            if tool.name == name:
-                return tool
-        return None
+        tool_properties = tool_to_call.schema["function"]["parameters"]["properties"]
+        if type(args) is str:
+            if len(tool_properties) == 1 and tool_call["function"]["arguments"] is not None:
+                tool_property = list(tool_properties.keys())[0]
+                args = {tool_property: args}
+            else:
+                args = {}
+
+        return args
 
 
 class CompletionContextProvider:
@@ -802,18 +1172,74 @@ class ChatModel(AIModel):
     ) -> Any:
         raise NotImplemented
 
+    async def acompletions(
+        self,
+        messages: list[dict],
+        tools: list[dict] = None,
+        response: ChatResponse = None,
+        cancel_token: CancelToken = None,
+        options: dict = {},
+    ) -> Any:
+        # models without a native async implementation run on a worker thread
+        return await asyncio.to_thread(
+            self.completions, messages, tools, response, cancel_token, options
+        )
+
+
+def options_argument(method: Callable, options: dict) -> dict:
+    """
+    Keyword arguments that pass options to method. Models written before methods took
+    options don't accept them, they are called without.
+    """
+    if not options:
+        return {}
+    try:
+        parameters = inspect.signature(method).parameters.values()
+    except (TypeError, ValueError):
+        return {}
+    if any(
+        parameter.name == "options" or parameter.kind == inspect.Parameter.VAR_KEYWORD
+        for parameter in parameters
+    ):
+        return {"options": options}
+    return {}
+
 
 class InlineCompletionModel(AIModel):
     def inline_completions(
+        self,
         prefix,
         suffix,
         language,
         filename,
         context: CompletionContext,
         cancel_token: CancelToken,
+        options: dict = {},
     ) -> str:
         raise NotImplemented
 
+    async def ainline_completions(
+        self,
+        prefix,
+        suffix,
+        language,
+        filename,
+        context: CompletionContext,
+        cancel_token: CancelToken,
+        options: dict = {},
+    ) -> str:
+        # models without a native async implementation run on a worker thread
+        return await asyncio.to_thread(
+            self.inline_completions,
+            prefix,
+            suffix,
+            language,
+            filename,
+            context,
+            cancel_token,
+            **options_argument(self.inline_completions, options),
+        )
+
 
 class EmbeddingModel(AIModel):
     def embeddings(self, inputs: list[str]) -> Any:
@@ -944,6 +1370,13 @@ class Host:
     def get_extension_tool(self, extension_id: str, toolset_id: str, tool_name: str) -> Tool:
         return NotImplemented
 
+    @property
+    def tools_version(self):
+        """
+        Hashable value that changes when MCP tool lists or extension toolsets change.
+        """
+        return NotImplemented
+
 
 class NotebookIntelligenceExtension:
     @property
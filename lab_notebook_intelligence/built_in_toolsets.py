@@ -1,12 +1,169 @@
 # Copyright (c) Mehmet Bektas <mbektasgh@outlook.com>
 
 import logging
+import time
+from typing import Union
 
 import lab_notebook_intelligence.api as nbapi
-from lab_notebook_intelligence.api import BuiltinToolset, ChatResponse, Toolset
+from lab_notebook_intelligence.api import (
+    BuiltinToolset,
+    ChatResponse,
+    ProgressData,
+    Toolset,
+)
+from lab_notebook_intelligence.document_reader import (
+    cell_output_text,
+    cell_source,
+    document_reader,
+)
+from lab_notebook_intelligence.kernel_executor import (
+    ExecutionResult,
+    ExecutionStatus,
+    kernel_executor,
+)
+from lab_notebook_intelligence.output_condenser import (
+    CondensedOutput,
+    condense_output_text,
+    condense_outputs,
+)
 
 log = logging.getLogger(__name__)
 
+CELL_TYPES = ("code", "markdown")
+CELL_EDIT_ACTIONS = ("update", "insert", "delete")
+# saves the notebook shortly after the last edit, consecutive edits are saved once
+SCHEDULE_SAVE_COMMAND = "lab-notebook-intelligence:schedule-save-active-notebook"
+GET_CELL_TYPE_AND_SOURCE_COMMAND = "lab-notebook-intelligence:get-cell-type-and-source"
+SET_CELL_OUTPUTS_COMMAND = "lab-notebook-intelligence:set-cell-outputs-at-index"
+# minimum number of seconds between progress updates of a running cell
+EXECUTION_PROGRESS_INTERVAL = 0.5
+MAX_PROGRESS_LINE_LENGTH = 80
+CONDENSED_OUTPUT_NOTE = (
+    "(Output was condensed, use get_cell_output with full set to true to get the complete output.)"
+)
+
+
+async def _read_active_notebook(response: ChatResponse) -> Union[dict, None]:
+    """
+    Reads the active notebook on the server. Returns None if it has to be read through
+    the frontend instead.
+    """
+    document = response.active_document
+    if document is None or not document.path.endswith(".ipynb"):
+        return None
+    # unsaved changes are only visible in the live document
+    return await document_reader.read_notebook(document.path, allow_disk=not document.dirty)
+
+
+def _get_cell(notebook: dict, cell_index: int) -> Union[dict, None]:
+    cells = notebook["cells"]
+    if not isinstance(cell_index, int) or cell_index < 0 or cell_index >= len(cells):
+        return None
+    return cells[cell_index]
+
+
+def _condensed_output_text(output: CondensedOutput) -> str:
+    if output.condensed:
+        return f"{output.text}\n{CONDENSED_OUTPUT_NOTE}"
+    return output.text
+
+
+def _execution_progress(cell_index: int, response: ChatResponse):
+    last_update = 0
+
+    def _on_output(output: dict) -> None:
+        nonlocal last_update
+        now = time.monotonic()
+        if now - last_update < EXECUTION_PROGRESS_INTERVAL:
+            return
+        lines = cell_output_text({"outputs": [output]}).strip().splitlines()
+        if len(lines) == 0:
+            return
+        last_update = now
+        line = lines[-1]
+        if len(line) > MAX_PROGRESS_LINE_LENGTH:
+            line = line[: MAX_PROGRESS_LINE_LENGTH - 3] + "..."
+        response.stream(ProgressData(f"Running cell {cell_index}: {line}"))
+
+    return _on_output
+
+
+def _execution_result_text(cell_index: int, result: ExecutionResult) -> str:
+    if result.status == ExecutionStatus.Timeout:
+        summary = f"Cell at index {cell_index} timed out after {result.duration:.1f}s and was interrupted."
+    else:
+        summary = f"Ran the cell at index {cell_index} in {result.duration:.1f}s with status '{result.status.value}'."
+    if result.execution_count is not None:
+        summary += f" Execution count: {result.execution_count}."
+
+    output = condense_outputs(result.outputs)
+    if output.text.strip() == "":
+        return f"{summary}\nThe cell produced no output."
+    return f"{summary}\nOutput:\n{_condensed_output_text(output)}"
+
+
+async def _live_cell_source(cell_index: int, response: ChatResponse) -> Union[dict, None]:
+    """
+    Type and source of a cell as the user sees it. Notebooks on disk can be stale, so
+    the cell is read from the live collaborative document or else from the frontend.
+    """
+    document = response.active_document
+    notebook = await document_reader.read_notebook(document.path, allow_disk=False)
+    if notebook is not None:
+        cell = _get_cell(notebook, cell_index)
+        if cell is None:
+            return None
+        return {"type": cell.get("cell_type"), "source": cell_source(cell)}
+
+    ui_cmd_response = await response.run_ui_command(
+        GET_CELL_TYPE_AND_SOURCE_COMMAND, {"cellIndex": cell_index}
+    )
+    if not isinstance(ui_cmd_response, dict) or not isinstance(ui_cmd_response.get("source"), str):
+        return None
+    return ui_cmd_response
+
+
+async def _run_cell_on_kernel(cell_index: int, response: ChatResponse) -> Union[str, None]:
+    """
+    Runs a code cell on the notebook's kernel from the server and writes its outputs
+    to the notebook. Returns None if the cell has to be run through the frontend.
+    """
+    document = response.active_document
+    if document is None or not document.path.endswith(".ipynb") or not kernel_executor.available:
+        return None
+    cell = await _live_cell_source(cell_index, response)
+    if cell is None or cell["type"] != "code":
+        return None
+
+    result = await kernel_executor.execute(
+        document.path,
+        cell["source"],
+        on_output=_execution_progress(cell_index, response),
+    )
+    if result is None:
+        return None
+
+    ui_cmd_response = await response.run_ui_command(
+        SET_CELL_OUTPUTS_COMMAND,
+        {
+            "cellIndex": cell_index,
+            "outputs": result.outputs,
+            "executionCount": result.execution_count,
+        },
+    )
+    text = _execution_result_text(cell_index, result)
+    if ui_cmd_response is False:
+        text += "\nThe outputs could not be written to the notebook."
+    return text
+
+
+def _failed_command_messages(results: list, descriptions: list[str]) -> list[str]:
+    return [
+        f"{description}: {result}"
+        for description, result in zip(descriptions, results)
+        if result is False or (isinstance(result, str) and result.startswith("Failed"))
+    ]
+
 
 @nbapi.auto_approve
 @nbapi.tool
@@ -67,10 +224,15 @@ async def add_code_cell(source: str, **args) -> str:
 
 
 @nbapi.auto_approve
+@nbapi.concurrency_safe
 @nbapi.tool
 async def get_number_of_cells(**args) -> str:
     """Get number of cells for the active notebook."""
     response = args["response"]
+    notebook = await _read_active_notebook(response)
+    if notebook is not None:
+        return str(len(notebook["cells"]))
+
     ui_cmd_response = await response.run_ui_command(
         "lab-notebook-intelligence:get-number-of-cells", {}
     )
@@ -79,6 +241,7 @@ async def get_number_of_cells(**args) -> str:
 
 
 @nbapi.auto_approve
+@nbapi.concurrency_safe
 @nbapi.tool
 async def get_cell_type_and_source(cell_index: int, **args) -> str:
     """Get cell type and source for the cell at index for the active notebook.
@@ -87,27 +250,49 @@ async def get_cell_type_and_source(cell_index: int, **args) -> str:
         cell_index: Zero based cell index
     """
     response = args["response"]
+    notebook = await _read_active_notebook(response)
+    if notebook is not None:
+        cell = _get_cell(notebook, cell_index)
+        if cell is None:
+            return f"Invalid cell index: {cell_index}"
+        return str({"type": cell.get("cell_type"), "source": cell_source(cell)})
+
     ui_cmd_response = await response.run_ui_command(
-        "lab-notebook-intelligence:get-cell-type-and-source", {"cellIndex": cell_index}
+        GET_CELL_TYPE_AND_SOURCE_COMMAND, {"cellIndex": cell_index}
     )
 
     return str(ui_cmd_response)
 
 
 @nbapi.auto_approve
+@nbapi.concurrency_safe
 @nbapi.tool
-async def get_cell_output(cell_index: int, **args) -> str:
-    """Get cell output for the cell at index for the active notebook.
+async def get_cell_output(cell_index: int, full: bool = False, **args) -> str:
+    """Get cell output for the cell at index for the active notebook. Long outputs are condensed unless full is set.
 
     Args:
         cell_index: Zero based cell index
+        full: Return the complete output without condensing it
     """
     response = args["response"]
+    notebook = await _read_active_notebook(response)
+    if notebook is not None:
+        cell = _get_cell(notebook, cell_index)
+        if cell is None:
+            return f"Invalid cell index: {cell_index}"
+        if cell.get("cell_type") != "code":
+            return ""
+        if full:
+            return cell_output_text(cell)
+        return _condensed_output_text(condense_outputs(cell.get("outputs", [])))
+
     ui_cmd_response = await response.run_ui_command(
         "lab-notebook-intelligence:get-cell-output", {"cellIndex": cell_index}
     )
+    if full or not isinstance(ui_cmd_response, str):
+        return str(ui_cmd_response)
 
-    return str(ui_cmd_response)
+    return _condensed_output_text(condense_output_text(ui_cmd_response))
 
 
 @nbapi.auto_approve
@@ -165,15 +350,99 @@ async def insert_cell(cell_index: int, cell_type: str, source: str, **args) -> s
     return str(ui_cmd_response)
 
 
+@nbapi.auto_approve
+@nbapi.tool
+async def add_cells(cells: list[dict], **args) -> str:
+    """Adds multiple cells to the end of notebook in order, with a single edit. Use this instead of calling add_code_cell or add_markdown_cell repeatedly.
+    Args:
+        cells: List of cells to add, each an object with "cell_type" (code or markdown) and "source" keys
+    """
+    response = args["response"]
+    commands = []
+    for i, cell in enumerate(cells):
+        cell_type = cell.get("cell_type", "code") if isinstance(cell, dict) else None
+        if cell_type not in CELL_TYPES or not isinstance(cell.get("source"), str):
+            return f"Invalid cell at position {i}, no cells were added: {cell}"
+        commands.append(
+            (
+                f"lab-notebook-intelligence:add-{cell_type}-cell-to-active-notebook",
+                {"source": cell["source"]},
+            )
+        )
+    commands.append((SCHEDULE_SAVE_COMMAND, {}))
+
+    results = await response.run_ui_commands(commands)
+    failures = _failed_command_messages(
+        results[:-1], [f"Cell at position {i}" for i in range(len(cells))]
+    )
+    if len(failures) > 0:
+        return "Failed to add some cells to notebook\n" + "\n".join(failures)
+
+    return f"Added {len(cells)} cells to notebook"
+
+
+@nbapi.auto_approve
+@nbapi.tool
+async def apply_cell_edits(edits: list[dict], **args) -> str:
+    """Applies multiple cell edits to the active notebook in order, with a single edit. Each edit sees the cell indices left by the previous edits. Use this instead of calling set_cell_type_and_source, insert_cell or delete_cell repeatedly.
+    Args:
+        edits: List of edits, each an object with "action" (update, insert or delete), "cell_index" (zero based) and, for update and insert, "cell_type" (code or markdown) and "source" keys
+    """
+    response = args["response"]
+    commands = []
+    for i, edit in enumerate(edits):
+        action = edit.get("action", "update") if isinstance(edit, dict) else None
+        if action not in CELL_EDIT_ACTIONS or not isinstance(edit.get("cell_index"), int):
+            return f"Invalid edit at position {i}, no edits were applied: {edit}"
+        if action == "delete":
+            commands.append(
+                (
+                    "lab-notebook-intelligence:delete-cell-at-index",
+                    {"cellIndex": edit["cell_index"]},
+                )
+            )
+            continue
+        if edit.get("cell_type") not in CELL_TYPES or not isinstance(edit.get("source"), str):
+            return f"Invalid edit at position {i}, no edits were applied: {edit}"
+        command = (
+            "lab-notebook-intelligence:set-cell-type-and-source"
+            if action == "update"
+            else "lab-notebook-intelligence:insert-cell-at-index"
+        )
+        commands.append(
+            (
+                command,
+                {
+                    "cellIndex": edit["cell_index"],
+                    "cellType": edit["cell_type"],
+                    "source": edit["source"],
+                },
+            )
+        )
+    commands.append((SCHEDULE_SAVE_COMMAND, {}))
+
+    results = await response.run_ui_commands(commands)
+    failures = _failed_command_messages(
+        results[:-1], [f"Edit at position {i}" for i in range(len(edits))]
+    )
+    if len(failures) > 0:
+        return "Failed to apply some cell edits\n" + "\n".join(failures)
+
+    return f"Applied {len(edits)} cell edits"
+
+
 @nbapi.auto_approve
 @nbapi.tool
 async def run_cell(cell_index: int, **args) -> str:
-    """Run the cell at index for the active notebook.
+    """Run the cell at index for the active notebook and return its output.
 
     Args:
         cell_index: Zero based cell index
     """
     response = args["response"]
+    result = await _run_cell_on_kernel(cell_index, response)
+    if result is not None:
+        return result
 
     ui_cmd_response = await response.run_ui_command(
         "lab-notebook-intelligence:run-cell-at-index", {"cellIndex": cell_index}
@@ -209,15 +478,22 @@ async def create_new_python_file(code: str, **args) -> str:
 
 
 @nbapi.auto_approve
+@nbapi.concurrency_safe
 @nbapi.tool
 async def get_file_content(**args) -> str:
     """Returns the content of the current file."""
     response = args["response"]
+    document = response.active_document
+    if document is not None and document.path != "" and not document.path.endswith(".ipynb"):
+        content = await document_reader.read_text(document.path, allow_disk=not document.dirty)
+        if content is not None:
+            return content
+
     ui_cmd_response = await response.run_ui_command(
         "lab-notebook-intelligence:get-current-file-content", {}
     )
 
-    return f"Received the file content"
+    return ui_cmd_response if isinstance(ui_cmd_response, str) else str(ui_cmd_response)
 
 
 @nbapi.auto_approve
@@ -246,6 +522,8 @@ You can refer to cells in notebooks by their index. The first cell in the notebo
 
 If you need to make changes to an existing notebook use the tools to get existing cell type and source. Use the set_cell_type_and_source tool for updating cell type and source. You can set the cell type to either code or markdown. You can set the source of the cell to either source code or markdown text.
 
+If you need to add or change more than one cell, use the add_cells tool to add cells and the apply_cell_edits tool to update, insert or delete cells, so that all changes are made at once. These tools save the notebook automatically.
+
 If you need to install any packages you shoud use %pip install <package_name> in a code cell instead of !pip install <package_name>.
 
 If you need to detect issues in a notebook check the code cell sources and also the cell output for any problems.
@@ -256,7 +534,7 @@ First create an execution plan and show before calling any tools. The execution
 """
 
 NOTEBOOK_EXECUTE_INSTRUCTIONS = """
-Running a notebook and executing a notebook refer to the same thing. Running a notebook means executing all the cells in the notebook in order. If you need to run a cell in the notebook use the run_cell tool with the cell index. Executing a cell and running a cell are the same thing.
+Running a notebook and executing a notebook refer to the same thing. Running a notebook means executing all the cells in the notebook in order. If you need to run a cell in the notebook use the run_cell tool with the cell index. Executing a cell and running a cell are the same thing. The run_cell tool waits for the cell to finish and returns its output, so you don't need to call get_cell_output after running a cell.
 
 If you create a new notebook and run it, then check for errors in the output of the cells. If there are any errors in the output, update the cell code that caused the error to fix it and rerun the cell. Repeat until there are no errors in the output of the cells.
 
@@ -288,6 +566,8 @@ built_in_toolsets: dict[BuiltinToolset, Toolset] = {
             set_cell_type_and_source,
             delete_cell,
             insert_cell,
+            add_cells,
+            apply_cell_edits,
             save_notebook,
         ],
         instructions=NOTEBOOK_EDIT_INSTRUCTIONS,
@@ -0,0 +1,177 @@
+# Copyright (c) Mehmet Bektas <mbektasgh@outlook.com>
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+from lab_notebook_intelligence.context_budget import get_token_counter
+
+DEFAULT_MAX_MESSAGES = 10
+DEFAULT_MAX_TOKENS = 200000
+DEFAULT_MAX_CHATS = 64
+DEFAULT_IDLE_TIMEOUT = 3600
+# history is shared across models, it is only measured approximately
+TOKEN_COUNTER_MODEL = "gpt-4o"
+
+
+class _ChatRecord:
+    def __init__(self):
+        self.messages: list[dict] = []
+        self.token_counts: list[int] = []
+        self.token_count = 0
+        # participant of the last user message, to detect participant changes
+        self.participant: str = None
+        self.last_access = time.monotonic()
+
+    def clear(self) -> None:
+        self.messages = []
+        self.token_counts = []
+        self.token_count = 0
+
+    def append(self, message: dict, token_count: int) -> None:
+        self.messages.append(message)
+        self.token_counts.append(token_count)
+        self.token_count += token_count
+
+    def pop_oldest(self) -> int:
+        self.messages.pop(0)
+        token_count = self.token_counts.pop(0)
+        self.token_count -= token_count
+        return token_count
+
+
+class ChatHistory:
+    """
+    History of chat messages, keyed by chat id. Keeps the last messages of each chat
+    for the same chat participant, within a token cap shared by all chats. Least
+    recently used chats are evicted when the cap is exceeded or they are idle.
+
+    History is owned by the event loop it is created on. Mutations from other threads
+    are handed over to that loop, so no locking is needed.
+    """
+
+    max_messages = DEFAULT_MAX_MESSAGES
+    max_tokens = DEFAULT_MAX_TOKENS
+    max_chats = DEFAULT_MAX_CHATS
+    idle_timeout = DEFAULT_IDLE_TIMEOUT
+
+    def __init__(self):
+        self._chats: OrderedDict[str, _ChatRecord] = OrderedDict()
+        self._token_count = 0
+        self._token_counter = get_token_counter(TOKEN_COUNTER_MODEL)
+        try:
+            self._owner_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._owner_loop = None
+        self._owner_thread_id = threading.get_ident()
+
+    @property
+    def token_count(self) -> int:
+        return self._token_count
+
+    @property
+    def chat_count(self) -> int:
+        return len(self._chats)
+
+    def _run_on_owner(self, callback, *args) -> None:
+        if (
+            self._owner_loop is None
+            or threading.get_ident() == self._owner_thread_id
+            or self._owner_loop.is_closed()
+        ):
+            callback(*args)
+        else:
+            self._owner_loop.call_soon_threadsafe(callback, *args)
+
+    def clear(self, chatId=None) -> bool:
+        if chatId is None:
+            self._run_on_owner(self._clear_all)
+            return True
+        elif chatId in self._chats:
+            self._run_on_owner(self._remove_chat, chatId)
+            return True
+
+        return False
+
+    def _clear_all(self) -> None:
+        self._chats.clear()
+        self._token_count = 0
+
+    def _remove_chat(self, chatId) -> None:
+        record = self._chats.pop(chatId, None)
+        if record is not None:
+            self._token_count -= record.token_count
+
+    def add_message(self, chatId, message, participant: str = None) -> None:
+        """
+        Adds a message to the chat. participant is the chat participant a user message
+        is addressed to, the chat's history is cleared when it changes.
+        """
+        self._run_on_owner(self._add_message, chatId, message, participant)
+
+    def _add_message(self, chatId, message, participant: str) -> None:
+        record = self._chats.get(chatId)
+        if record is None:
+            record = _ChatRecord()
+            self._chats[chatId] = record
+        self._chats.move_to_end(chatId)
+        record.last_access = time.monotonic()
+
+        # clear the chat history if participant changed
+        if participant is not None:
+            if record.participant is not None and participant != record.participant:
+                self._token_count -= record.token_count
+                record.clear()
+            record.participant = participant
+
+        token_count = self._token_counter.count_message(message)
+        record.append(message, token_count)
+        self._token_count += token_count
+
+        # limit number of messages kept in history
+        while len(record.messages) > ChatHistory.max_messages:
+            self._token_count -= record.pop_oldest()
+
+        self._evict(chatId)
+
+    def _evict(self, active_chat_id) -> None:
+        now = time.monotonic()
+        for chatId in list(self._chats.keys()):
+            if chatId == active_chat_id:
+                continue
+            record = self._chats[chatId]
+            idle = now - record.last_access > ChatHistory.idle_timeout
+            over_limit = (
+                self._token_count > ChatHistory.max_tokens
+                or len(self._chats) > ChatHistory.max_chats
+            )
+            # chats are in least recently used order
+            if idle or over_limit:
+                self._remove_chat(chatId)
+
+        # a single chat over the limit keeps its most recent messages
+        record = self._chats.get(active_chat_id)
+        while (
+            record is not None
+            and self._token_count > ChatHistory.max_tokens
+            and len(record.messages) > 1
+        ):
+            self._token_count -= record.pop_oldest()
+
+    def get_history(self, chatId) -> list[dict]:
+        record = self._chats.get(chatId)
+        if record is None:
+            return []
+        self._run_on_owner(self._touch, chatId)
+        return list(record.messages)
+
+    def _touch(self, chatId) -> None:
+        record = self._chats.get(chatId)
+        if record is not None:
+            record.last_access = time.monotonic()
+            self._chats.move_to_end(chatId)
+
+    def get_token_count(self, chatId) -> int:
+        record = self._chats.get(chatId)
+        return record.token_count if record is not None else 0
@@ -7,6 +7,9 @@ import sys
 
 log = logging.getLogger(__name__)
 
+DEFAULT_MAX_TOOL_CALL_ROUNDS = 50
+DEFAULT_MAX_TOOL_SCHEMAS = 32
+
 
 class NBIConfig:
     def __init__(self, options: dict = {}):
@@ -25,6 +28,7 @@ class NBIConfig:
         self.user_config_file = os.path.join(self.nbi_user_dir, "config.json")
         self.env_mcp_file = os.path.join(self.nbi_env_dir, "mcp.json")
         self.user_mcp_file = os.path.join(self.nbi_user_dir, "mcp.json")
+        self.mcp_tool_catalog_file = os.path.join(self.nbi_user_dir, "mcp-tool-catalog.json")
         self.env_config = {}
         self.user_config = {}
         self.env_mcp = {}
@@ -123,6 +127,14 @@ class NBIConfig:
     def embedding_model(self):
         return self.get("embedding_model", {})
 
+    @property
+    def max_tool_call_rounds(self) -> int:
+        return self.get("max_tool_call_rounds", DEFAULT_MAX_TOOL_CALL_ROUNDS)
+
+    @property
+    def max_tool_schemas(self) -> int:
+        return self.get("max_tool_schemas", DEFAULT_MAX_TOOL_SCHEMAS)
+
     @property
     def mcp(self):
         mcp_config = self.env_mcp.copy()
@@ -0,0 +1,345 @@
+# Copyright (c) Mehmet Bektas <mbektasgh@outlook.com>
+
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+import tiktoken
+
+log = logging.getLogger(__name__)
+
+# approximate per message overhead of chat formatting (role, separators)
+TOKENS_PER_MESSAGE = 4
+# share of the context window kept free for the model response
+OUTPUT_RESERVE_RATIO = 0.2
+MAX_OUTPUT_RESERVE_TOKENS = 8192
+# non-OpenAI models use different tokenizers, leave some headroom for them
+UNKNOWN_TOKENIZER_SAFETY_FACTOR = 1.15
+# messages are not trimmed below this, older history is dropped instead
+MIN_MESSAGE_TOKENS = 64
+TRUNCATION_MARKER = "\n...\n"
+# share of the free budget left when appended messages are trimmed, so that later tool
+# call rounds can still be appended without fitting the whole conversation again
+APPEND_HEADROOM_RATIO = 0.25
+TOKEN_COUNT_CACHE_SIZE = 4096
+APPROXIMATE_CHARS_PER_TOKEN = 3
+
+_O200K_MODEL_PREFIXES = ("gpt-4o", "gpt-4.1", "gpt-5", "o1", "o3", "o4", "chatgpt-4o")
+_CL100K_MODEL_PREFIXES = ("gpt-4", "gpt-3.5", "text-embedding")
+
+
+def _model_encoding_name(model_id: str) -> tuple[str, bool]:
+    """
+    Returns tiktoken encoding name for the model and whether it is the model's
+    actual tokenizer.
+    """
+    # provider prefixed ids like openai/gpt-4o or ollama_chat/llama3
+    name = model_id.split("/")[-1].lower()
+    try:
+        return tiktoken.encoding_for_model(name).name, True
+    except Exception:
+        pass
+    if name.startswith(_O200K_MODEL_PREFIXES):
+        return "o200k_base", True
+    if name.startswith(_CL100K_MODEL_PREFIXES):
+        return "cl100k_base", True
+    return "o200k_base", False
+
+
+class TokenCounter:
+    """
+    Counts and truncates text in tokens of a model's tokenizer. Token counts are
+    cached by content hash since the same history and context are counted on every
+    request and tool call round.
+    """
+
+    def __init__(self, encoding_name: str, safety_factor: float = 1.0):
+        self._encoding_name = encoding_name
+        self._safety_factor = safety_factor
+        try:
+            self._encoding = tiktoken.get_encoding(encoding_name)
+        except Exception as e:
+            log.warning(f"Failed to load tokenizer '{encoding_name}', using approximation: {e}")
+            self._encoding = None
+        self._lock = threading.Lock()
+        self._counts: OrderedDict[bytes, int] = OrderedDict()
+
+    @property
+    def encoding_name(self) -> str:
+        return self._encoding_name
+
+    def _count_tokens(self, text: str) -> int:
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return -(-len(text) // APPROXIMATE_CHARS_PER_TOKEN)
+
+    def count(self, text: str) -> int:
+        if text == "":
+            return 0
+        key = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        with self._lock:
+            count = self._counts.get(key)
+            if count is not None:
+                self._counts.move_to_end(key)
+                return count
+
+        count = int(self._count_tokens(text) * self._safety_factor + 0.5)
+
+        with self._lock:
+            self._counts[key] = count
+            if len(self._counts) > TOKEN_COUNT_CACHE_SIZE:
+                self._counts.popitem(last=False)
+
+        return count
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """
+        Trims text to at most max_tokens tokens at token boundaries. The middle is
+        cut, so that both the beginning and the end of the text are kept.
+        """
+        if self.count(text) <= max_tokens:
+            return text
+
+        max_tokens = int(max_tokens / self._safety_factor)
+        marker_tokens = self._count_tokens(TRUNCATION_MARKER)
+        if max_tokens <= marker_tokens:
+            return ""
+        max_tokens -= marker_tokens
+        tail_tokens = max_tokens // 4
+        head_tokens = max_tokens - tail_tokens
+
+        if self._encoding is not None:
+            tokens = self._encoding.encode(text, disallowed_special=())
+            head = self._encoding.decode(tokens[:head_tokens])
+            tail = self._encoding.decode(tokens[len(tokens) - tail_tokens :]) if tail_tokens else ""
+        else:
+            head = text[: head_tokens * APPROXIMATE_CHARS_PER_TOKEN]
+            tail = (
+                text[len(text) - tail_tokens * APPROXIMATE_CHARS_PER_TOKEN :] if tail_tokens else ""
+            )
+
+        return head + TRUNCATION_MARKER + tail
+
+    def count_message(self, message: dict) -> int:
+        count = TOKENS_PER_MESSAGE
+        content = message.get("content")
+        if isinstance(content, str):
+            count += self.count(content)
+        elif content is not None:
+            count += self.count(json.dumps(content))
+        if message.get("tool_calls"):
+            count += self.count(json.dumps(message["tool_calls"]))
+        if message.get("name"):
+            count += self.count(message["name"])
+        return count
+
+    def count_messages(self, messages: list[dict]) -> int:
+        return sum(self.count_message(message) for message in messages)
+
+    def count_tools(self, tools: list[dict]) -> int:
+        if not tools:
+            return 0
+        return self.count(json.dumps(tools))
+
+
+_token_counters: dict[str, TokenCounter] = {}
+_token_counters_lock = threading.Lock()
+
+
+def get_token_counter(model_id: str) -> TokenCounter:
+    encoding_name, exact = _model_encoding_name(model_id or "")
+    safety_factor = 1.0 if exact else UNKNOWN_TOKENIZER_SAFETY_FACTOR
+    key = f"{encoding_name}:{safety_factor}"
+    with _token_counters_lock:
+        counter = _token_counters.get(key)
+        if counter is None:
+            counter = TokenCounter(encoding_name, safety_factor)
+            _token_counters[key] = counter
+        return counter
+
+
+def _water_level(sizes: list[int], budget: int) -> int:
+    """
+    Largest per item cap such that sum(min(size, cap)) fits the budget.
+    """
+    if len(sizes) == 0:
+        return 0
+    budget = max(budget, 0)
+    if sum(sizes) <= budget:
+        return max(sizes, default=0)
+    remaining = budget
+    sorted_sizes = sorted(sizes)
+    for i, size in enumerate(sorted_sizes):
+        items_left = len(sorted_sizes) - i
+        if size * items_left > remaining:
+            return remaining // items_left
+        remaining -= size
+    return sorted_sizes[-1]
+
+
+def fit_messages(
+    messages: list[dict],
+    model_id: str,
+    context_window: int,
+    tools: list[dict] = None,
+    reserve_output_tokens: int = None,
+) -> list[dict]:
+    """
+    Fits messages and tool schemas into the model's context window using a single
+    budget. System messages and the latest user message are kept intact if possible.
+    When the rest does not fit, the largest messages are trimmed down to a common
+    cap and, if that is not enough, the oldest history messages are dropped.
+    The input messages are not modified.
+    """
+    if not context_window or context_window <= 0:
+        return messages
+
+    counter = get_token_counter(model_id)
+    if reserve_output_tokens is None:
+        reserve_output_tokens = min(
+            int(context_window * OUTPUT_RESERVE_RATIO), MAX_OUTPUT_RESERVE_TOKENS
+        )
+    budget = context_window - reserve_output_tokens - counter.count_tools(tools)
+
+    sizes = [counter.count_message(message) for message in messages]
+    if sum(sizes) <= budget:
+        return messages
+
+    last_user_index = next(
+        (i for i in range(len(messages) - 1, -1, -1) if messages[i].get("role") == "user"),
+        None,
+    )
+    pinned = set(i for i, message in enumerate(messages) if message.get("role") == "system")
+    if last_user_index is not None:
+        pinned.add(last_user_index)
+
+    def _is_droppable(i: int) -> bool:
+        # tool call messages and their results have to stay together, so only plain
+        # history messages before the current prompt are dropped
+        message = messages[i]
+        return (
+            i not in pinned
+            and (last_user_index is None or i < last_user_index)
+            and message.get("role") in ("user", "assistant")
+            and not message.get("tool_calls")
+        )
+
+    kept = [i for i in range(len(messages))]
+    elastic_budget = budget - sum(sizes[i] for i in pinned)
+    while True:
+        elastic = [i for i in kept if i not in pinned]
+        if len(elastic) == 0:
+            break
+        cap = _water_level([sizes[i] for i in elastic], elastic_budget)
+        if cap >= MIN_MESSAGE_TOKENS:
+            break
+        droppable = [i for i in elastic if _is_droppable(i)]
+        if len(droppable) == 0:
+            break
+        kept.remove(droppable[0])
+
+    elastic = [i for i in kept if i not in pinned]
+    cap = _water_level([sizes[i] for i in elastic], elastic_budget)
+
+    # pinned messages alone do not fit, the largest of them are trimmed to a common cap
+    pinned_cap = _water_level([sizes[i] for i in pinned], budget) if elastic_budget < 0 else None
+
+    fitted = []
+    for i in kept:
+        message = messages[i]
+        limit = cap if i not in pinned else pinned_cap
+        if limit is not None and sizes[i] > limit:
+            message = _truncate_message(message, counter, limit)
+        fitted.append(message)
+
+    dropped = len(messages) - len(kept)
+    log.debug(
+        f"Fitted {len(messages)} messages into {budget} tokens, dropped {dropped} and trimmed to {cap} tokens"
+    )
+
+    return fitted
+
+
+def fit_appended_messages(
+    fitted: list[dict],
+    new_messages: list[dict],
+    model_id: str,
+    context_window: int,
+    tools: list[dict] = None,
+    reserve_output_tokens: int = None,
+) -> list[dict]:
+    """
+    Fits messages appended to an already fitted conversation, such as the results of
+    a tool call round. The fitted messages were sent before and are kept as they are,
+    so that the prompt prefix cached by the provider still matches, only the new
+    messages are trimmed. The whole conversation is fitted again if the earlier
+    messages leave no room for the new ones.
+    """
+    messages = fitted + new_messages
+    if not context_window or context_window <= 0:
+        return messages
+
+    counter = get_token_counter(model_id)
+    if reserve_output_tokens is None:
+        reserve_output_tokens = min(
+            int(context_window * OUTPUT_RESERVE_RATIO), MAX_OUTPUT_RESERVE_TOKENS
+        )
+    budget = (
+        context_window
+        - reserve_output_tokens
+        - counter.count_tools(tools)
+        - counter.count_messages(fitted)
+    )
+    sizes = [counter.count_message(message) for message in new_messages]
+    if sum(sizes) <= budget:
+        return messages
+
+    cap = _water_level(sizes, int(budget * (1 - APPEND_HEADROOM_RATIO)))
+    if cap < MIN_MESSAGE_TOKENS:
+        return fit_messages(messages, model_id, context_window, tools, reserve_output_tokens)
+
+    return fitted + [
+        _truncate_message(message, counter, cap) if size > cap else message
+        for message, size in zip(new_messages, sizes)
+    ]
+
+
+def _truncate_message(message: dict, counter: TokenCounter, max_tokens: int) -> dict:
+    content = message.get("content")
+    if not isinstance(content, str):
+        return message
+    overhead = counter.count_message(message) - counter.count(content)
+    message = message.copy()
+    message["content"] = counter.truncate(content, max(max_tokens - overhead, 0))
+    return message
+
+
+def fit_messages_for_model(messages: list[dict], model, tools: list[dict] = None) -> list[dict]:
+    """
+    Fits messages into the context window of a ChatModel.
+    """
+    if model is None:
+        return messages
+    try:
+        context_window = model.context_window
+    except Exception:
+        return messages
+    return fit_messages(messages, model.id, context_window, tools)
+
+
+def fit_appended_messages_for_model(
+    fitted: list[dict], new_messages: list[dict], model, tools: list[dict] = None
+) -> list[dict]:
+    """
+    Fits messages appended to an already fitted conversation into the context window
+    of a ChatModel.
+    """
+    if model is None:
+        return fitted + new_messages
+    try:
+        context_window = model.context_window
+    except Exception:
+        return fitted + new_messages
+    return fit_appended_messages(fitted, new_messages, model.id, context_window, tools)
@@ -0,0 +1,226 @@
+# Copyright (c) Mehmet Bektas <mbektasgh@outlook.com>
+
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Union
+
+log = logging.getLogger(__name__)
+
+DOCUMENT_CACHE_SIZE = 32
+# files larger than this are left to the frontend
+MAX_DOCUMENT_SIZE = 20 * 1024 * 1024
+# frontend paths of documents opened through a drive, e.g. RTC:notebook.ipynb
+_DRIVE_PREFIX = re.compile(r"^[A-Za-z0-9_.-]{2,}:")
+_ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*[A-Za-z]")
+
+
+@dataclass
+class _CachedDocument:
+    mtime_ns: int
+    size: int
+    content: Any
+
+
+def local_path(path: str) -> Union[str, None]:
+    """
+    Server relative path of a document path reported by the frontend.
+    """
+    path = _DRIVE_PREFIX.sub("", path or "").lstrip("/")
+    return path if path != "" else None
+
+
+def _source_text(source) -> str:
+    if isinstance(source, list):
+        return "".join(source)
+    return source or ""
+
+
+def cell_source(cell: dict) -> str:
+    return _source_text(cell.get("source"))
+
+
+def cell_output_text(cell: dict) -> str:
+    """
+    Text of a code cell's outputs, in the same format as the frontend's
+    cellOutputAsText.
+    """
+    content = ""
+    for output in cell.get("outputs", []):
+        output_type = output.get("output_type")
+        if output_type == "execute_result":
+            data = output.get("data")
+            if isinstance(data, dict):
+                content += _source_text(data.get("text/plain")) + "\n"
+        elif output_type == "stream":
+            content += _source_text(output.get("text")) + "\n"
+        elif output_type == "error" and isinstance(output.get("traceback"), list):
+            content += f"{output.get('ename')}: {output.get('evalue')}\n"
+            content += "\n".join(_ANSI_ESCAPE.sub("", item) for item in output["traceback"])
+            content += "\n"
+    return content
+
+
+class DocumentReader:
+    """
+    Reads notebooks and text files on the server, so that read only tools do not need
+    a round trip to the browser. Documents open in the collaborative document store
+    (jupyter-collaboration) are read live, others are read from disk and cached by
+    modification time. Callers only read from disk when the document has no unsaved
+    changes in the browser.
+    """
+
+    def __init__(self, max_entries: int = DOCUMENT_CACHE_SIZE):
+        self._max_entries = max_entries
+        self._root_dir: str = None
+        self._server_loop: asyncio.AbstractEventLoop = None
+        self._ydoc_extension = None
+        self._lock = threading.Lock()
+        self._cache: OrderedDict[str, _CachedDocument] = OrderedDict()
+        self._live_reads = 0
+        self._disk_reads = 0
+        self._cache_hits = 0
+        self._unavailable = 0
+
+    def configure(self, root_dir: str) -> None:
+        self._root_dir = os.path.realpath(os.path.expanduser(root_dir)) if root_dir else None
+        self.clear()
+
+    def attach_server(self, server_loop: asyncio.AbstractEventLoop, ydoc_extension=None) -> None:
+        """
+        Sets the loop that owns the collaborative document store and the store itself,
+        if jupyter-collaboration is installed.
+        """
+        self._server_loop = server_loop
+        self._ydoc_extension = ydoc_extension
+
+    def _local_path(self, path: str) -> Union[str, None]:
+        if self._root_dir is None:
+            return None
+        return local_path(path)
+
+    def _file_path(self, path: str) -> Union[str, None]:
+        file_path = os.path.realpath(os.path.join(self._root_dir, path))
+        # documents outside of the server root are not served
+        if os.path.commonpath([self._root_dir, file_path]) != self._root_dir:
+            return None
+        return file_path
+
+    async def _read_live(self, path: str, content_type: str, file_format: str) -> Any:
+        if self._ydoc_extension is None or self._server_loop is None:
+            return None
+
+        async def _get():
+            document = await self._ydoc_extension.get_document(
+                path=path, content_type=content_type, file_format=file_format, copy=False
+            )
+            # read on the server loop, the document is only used there
+            return document.get() if document is not None else None
+
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        try:
+            if running_loop is self._server_loop:
+                return await _get()
+            return await asyncio.wrap_future(
+                asyncio.run_coroutine_threadsafe(_get(), self._server_loop)
+            )
+        except Exception as e:
+            log.debug(f"Failed to read live document '{path}': {e}")
+            return None
+
+    def _read_disk(self, path: str, parse_json: bool) -> Any:
+        file_path = self._file_path(path)
+        if file_path is None:
+            return None
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        if stat.st_size > MAX_DOCUMENT_SIZE:
+            return None
+
+        with self._lock:
+            cached = self._cache.get(file_path)
+            if (
+                cached is not None
+                and cached.mtime_ns == stat.st_mtime_ns
+                and cached.size == stat.st_size
+            ):
+                self._cache.move_to_end(file_path)
+                self._cache_hits += 1
+                return cached.content
+
+        try:
+            with open(file_path, "r", encoding="utf-8") as file:
+                content = json.load(file) if parse_json else file.read()
+        except Exception as e:
+            log.debug(f"Failed to read document '{path}' from disk: {e}")
+            return None
+
+        with self._lock:
+            self._disk_reads += 1
+            self._cache[file_path] = _CachedDocument(stat.st_mtime_ns, stat.st_size, content)
+            self._cache.move_to_end(file_path)
+            while len(self._cache) > self._max_entries:
+                self._cache.popitem(last=False)
+        return content
+
+    async def _read(self, path: str, content_type: str, file_format: str, allow_disk: bool) -> Any:
+        local_path = self._local_path(path)
+        if local_path is not None:
+            content = await self._read_live(local_path, content_type, file_format)
+            if content is not None:
+                with self._lock:
+                    self._live_reads += 1
+                return content
+            if allow_disk:
+                content = await asyncio.to_thread(
+                    self._read_disk, local_path, file_format == "json"
+                )
+                if content is not None:
+                    return content
+
+        with self._lock:
+            self._unavailable += 1
+        return None
+
+    async def read_notebook(self, path: str, allow_disk: bool = True) -> Union[dict, None]:
+        """
+        Returns the notebook as a dict in nbformat layout, or None if it cannot be read
+        on the server.
+        """
+        notebook = await self._read(path, "notebook", "json", allow_disk)
+        if not isinstance(notebook, dict) or not isinstance(notebook.get("cells"), list):
+            return None
+        return notebook
+
+    async def read_text(self, path: str, allow_disk: bool = True) -> Union[str, None]:
+        text = await self._read(path, "file", "text", allow_disk)
+        return text if isinstance(text, str) else None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    @property
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "live_collaboration": self._ydoc_extension is not None,
+                "cached_documents": len(self._cache),
+                "live_reads": self._live_reads,
+                "disk_reads": self._disk_reads,
+                "cache_hits": self._cache_hits,
+                "unavailable": self._unavailable,
+            }
+
+
+document_reader = DocumentReader()
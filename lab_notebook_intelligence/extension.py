@@ -5,23 +5,25 @@ import datetime as dt
 import json
 import logging
 import os
-import threading
 import uuid
 from dataclasses import dataclass
 from os import path
 from typing import Union
 
-import tiktoken
 import tornado
 from jupyter_server.base.handlers import APIHandler
 from jupyter_server.extension.application import ExtensionApp
 from jupyter_server.utils import url_path_join
 from tornado import websocket
-from traitlets import Unicode
+from traitlets import Integer, Unicode
 
 import lab_notebook_intelligence.github_copilot as github_copilot
-from lab_notebook_intelligence.ai_service_manager import AIServiceManager
+from lab_notebook_intelligence.ai_service_manager import (
+    DEFAULT_CHAT_PARTICIPANT_ID,
+    AIServiceManager,
+)
 from lab_notebook_intelligence.api import (
+    ActiveDocument,
     BackendMessageType,
     BuiltinToolset,
     CancelToken,
@@ -30,18 +32,41 @@ from lab_notebook_intelligence.api import (
     ChatResponse,
     ContextRequest,
     ContextRequestType,
+    MarkdownData,
     RequestDataType,
     RequestToolSelection,
     ResponseStreamData,
     ResponseStreamDataType,
     SignalImpl,
+    options_argument,
 )
 from lab_notebook_intelligence.built_in_toolsets import built_in_toolsets
-from lab_notebook_intelligence.util import ThreadSafeWebSocketConnector
+from lab_notebook_intelligence.chat_history import ChatHistory
+from lab_notebook_intelligence.document_reader import document_reader
+from lab_notebook_intelligence.inline_completion_cache import (
+    InlineCompletionCache,
+    model_cache_key,
+)
+from lab_notebook_intelligence.inline_completion_cutoff import InlineCompletionStopBoundary
+from lab_notebook_intelligence.inline_completion_scheduler import (
+    InlineCompletionScheduler,
+    scheduler_stats,
+)
+from lab_notebook_intelligence.kernel_executor import KernelExecutor, kernel_executor
+from lab_notebook_intelligence.output_condenser import (
+    condense_output_text,
+    output_condenser_stats,
+)
+from lab_notebook_intelligence.prompt_cache import prompt_cache_stats
+from lab_notebook_intelligence.request_runtime import RequestRuntime
+from lab_notebook_intelligence.tool_retrieval import tool_retrieval_stats
+from lab_notebook_intelligence.util import ThreadSafeWebSocketConnector, credential_vault
+from lab_notebook_intelligence.websocket_stream import COMPACT_PROTOCOL, WebsocketStreamWriter
 
 ai_service_manager: AIServiceManager = None
+request_runtime: RequestRuntime = None
+inline_completion_cache: InlineCompletionCache = None
 log = logging.getLogger(__name__)
-tiktoken_encoding = tiktoken.encoding_for_model("gpt-4o")
 
 
 class GetCapabilitiesHandler(APIHandler):
@@ -65,6 +90,7 @@ class GetCapabilitiesHandler(APIHandler):
         mcp_server_tools = [
             {
                 "id": mcp_server.name,
+                "circuitState": mcp_server.circuit_state.value,
                 "tools": [
                     {"name": tool.name, "description": tool.description}
                     for tool in mcp_server.get_tools()
@@ -317,13 +343,32 @@ class EmitTelemetryEventHandler(APIHandler):
     @tornado.web.authenticated
     def post(self):
         event = json.loads(self.request.body)
-        thread = threading.Thread(
-            target=asyncio.run, args=(ai_service_manager.emit_telemetry_event(event),)
-        )
-        thread.start()
+        if request_runtime.submit(ai_service_manager.emit_telemetry_event(event)) is None:
+            log.warning("Request runtime is busy, dropped telemetry event")
         self.finish(json.dumps({}))
 
 
+class GetMetricsHandler(APIHandler):
+    @tornado.web.authenticated
+    def get(self):
+        self.finish(
+            json.dumps(
+                {
+                    "request_runtime": request_runtime.metrics,
+                    "credential_vault": credential_vault.metrics,
+                    "inline_completion_cache": inline_completion_cache.metrics,
+                    "inline_completion_scheduler": scheduler_stats.metrics,
+                    "document_reader": document_reader.metrics,
+                    "kernel_executor": kernel_executor.metrics,
+                    "output_condenser": output_condenser_stats.metrics,
+                    "prompt_cache": prompt_cache_stats.metrics,
+                    "tool_retrieval": tool_retrieval_stats.metrics,
+                    "mcp_tool_result_cache": ai_service_manager.mcp_tool_result_cache_metrics,
+                }
+            )
+        )
+
+
 class GetGitHubLoginStatusHandler(APIHandler):
     # The following decorator should be present on all verb methods (head, get, post,
     # patch, put, delete, options) to ensure only authorized user can request the
@@ -352,63 +397,17 @@ class GetGitHubLogoutHandler(APIHandler):
         self.finish(json.dumps(github_copilot.logout()))
 
 
-class ChatHistory:
-    """
-    History of chat messages, key is chat id, value is list of messages
-    keep the last 10 messages in the same chat participant
-    """
-
-    MAX_MESSAGES = 10
-
-    def __init__(self):
-        self.messages = {}
-
-    def clear(self, chatId=None):
-        if chatId is None:
-            self.messages = {}
-            return True
-        elif chatId in self.messages:
-            del self.messages[chatId]
-            return True
-
-        return False
-
-    def add_message(self, chatId, message):
-        if chatId not in self.messages:
-            self.messages[chatId] = []
-
-        # clear the chat history if participant changed
-        if message["role"] == "user":
-            existing_messages = self.messages[chatId]
-            prev_user_message = next(
-                (m for m in reversed(existing_messages) if m["role"] == "user"), None
-            )
-            if prev_user_message is not None:
-                (current_participant, command, prompt) = AIServiceManager.parse_prompt(
-                    message["content"]
-                )
-                (prev_participant, command, prompt) = AIServiceManager.parse_prompt(
-                    prev_user_message["content"]
-                )
-                if current_participant != prev_participant:
-                    self.messages[chatId] = []
-
-        self.messages[chatId].append(message)
-        # limit number of messages kept in history
-        if len(self.messages[chatId]) > ChatHistory.MAX_MESSAGES:
-            self.messages[chatId] = self.messages[chatId][-ChatHistory.MAX_MESSAGES :]
-
-    def get_history(self, chatId):
-        return self.messages.get(chatId, [])
-
-
 class WebsocketCopilotResponseEmitter(ChatResponse):
-    def __init__(self, chatId, messageId, websocket_handler, chat_history):
+    # seconds to wait for the UI to respond to a command, 0 to wait indefinitely
+    ui_command_timeout = 600
+
+    def __init__(self, chatId, messageId, websocket_handler, chat_history, cancel_token=None):
         super().__init__()
         self.chatId = chatId
         self.messageId = messageId
         self.websocket_handler = websocket_handler
         self.chat_history = chat_history
+        self.cancel_token = cancel_token
         self.streamed_contents = []
 
     @property
@@ -419,10 +418,14 @@ class WebsocketCopilotResponseEmitter(ChatResponse):
     def message_id(self) -> str:
         return self.messageId
 
+    @property
+    def active_document(self) -> Union[ActiveDocument, None]:
+        return self.websocket_handler.active_document
+
     def stream(self, data: Union[ResponseStreamData, dict]):
         data_type = ResponseStreamDataType.LLMRaw if type(data) is dict else data.data_type
 
-        if data_type == ResponseStreamDataType.Markdown:
+        if data_type == ResponseStreamDataType.Markdown and self.chat_history is not None:
             self.chat_history.add_message(
                 self.chatId, {"role": "assistant", "content": data.content}
             )
@@ -573,7 +576,7 @@ class WebsocketCopilotResponseEmitter(ChatResponse):
                 if part is not None:
                     self.streamed_contents.append(part)
 
-        self.websocket_handler.write_message(
+        self.websocket_handler.stream_writer.write_message(
             {
                 "id": self.messageId,
                 "participant": self.participant_id,
@@ -584,12 +587,13 @@ class WebsocketCopilotResponseEmitter(ChatResponse):
         )
 
     def finish(self) -> None:
-        self.chat_history.add_message(
-            self.chatId,
-            {"role": "assistant", "content": "".join(self.streamed_contents)},
-        )
+        if self.chat_history is not None:
+            self.chat_history.add_message(
+                self.chatId,
+                {"role": "assistant", "content": "".join(self.streamed_contents)},
+            )
         self.streamed_contents = []
-        self.websocket_handler.write_message(
+        self.websocket_handler.stream_writer.write_message(
             {
                 "id": self.messageId,
                 "participant": self.participant_id,
@@ -600,7 +604,7 @@ class WebsocketCopilotResponseEmitter(ChatResponse):
 
     async def run_ui_command(self, command: str, args: dict = {}) -> None:
         callback_id = str(uuid.uuid4())
-        self.websocket_handler.write_message(
+        self.websocket_handler.stream_writer.write_message(
             {
                 "id": self.messageId,
                 "participant": self.participant_id,
@@ -612,9 +616,41 @@ class WebsocketCopilotResponseEmitter(ChatResponse):
                 },
             }
         )
-        response = await ChatResponse.wait_for_run_ui_command_response(self, callback_id)
+        response = await ChatResponse.wait_for_run_ui_command_response(
+            self,
+            callback_id,
+            self.cancel_token,
+            WebsocketCopilotResponseEmitter.ui_command_timeout,
+        )
         return response
 
+    async def run_ui_commands(self, commands: list[tuple[str, dict]]) -> list:
+        if len(commands) == 0:
+            return []
+        callback_id = str(uuid.uuid4())
+        self.websocket_handler.stream_writer.write_message(
+            {
+                "id": self.messageId,
+                "participant": self.participant_id,
+                "type": BackendMessageType.RunUICommands,
+                "data": {
+                    "callback_id": callback_id,
+                    "commands": [
+                        {"commandId": command, "args": args} for command, args in commands
+                    ],
+                },
+            }
+        )
+        results = await ChatResponse.wait_for_run_ui_command_response(
+            self,
+            callback_id,
+            self.cancel_token,
+            WebsocketCopilotResponseEmitter.ui_command_timeout,
+        )
+        if not isinstance(results, list) or len(results) != len(commands):
+            raise ValueError(f"Invalid response for {len(commands)} UI commands: {results}")
+        return results
+
 
 class CancelTokenImpl(CancelToken):
     def __init__(self):
@@ -633,15 +669,52 @@ class MessageCallbackHandlers:
 
 
 class WebsocketCopilotHandler(websocket.WebSocketHandler):
+    inline_completion_stop_boundary = InlineCompletionStopBoundary.EndOfBlock
+    # handlers of the open tabs, for messages sent to all of them
+    _open_handlers: set["WebsocketCopilotHandler"] = set()
+
     def __init__(self, application, request, **kwargs):
         super().__init__(application, request, **kwargs)
         # TODO: cleanup
         self._messageCallbackHandlers: dict[str, MessageCallbackHandlers] = {}
         self.chat_history = ChatHistory()
-        github_copilot.websocket_connector = ThreadSafeWebSocketConnector(self)
+        self._inline_completion_scheduler = InlineCompletionScheduler()
+        self.stream_writer = WebsocketStreamWriter(self)
+        # document active in the browser, reported with requests and UI command responses
+        self.active_document: ActiveDocument = None
+        self.connector = ThreadSafeWebSocketConnector(self)
+        github_copilot.websocket_connector = self.connector
 
     def open(self):
-        pass
+        # clients opt in to the compact streaming protocol when connecting
+        protocol = self.get_query_argument("protocol", "")
+        self.stream_writer = WebsocketStreamWriter(self, compact=protocol == COMPACT_PROTOCOL)
+        # live documents are read on the server loop, handlers run on it
+        document_reader.attach_server(
+            asyncio.get_running_loop(), self.settings.get("jupyter_server_ydoc")
+        )
+        kernel_executor.attach_server(asyncio.get_running_loop())
+        WebsocketCopilotHandler._open_handlers.add(self)
+
+    @classmethod
+    def broadcast(cls, message: dict) -> None:
+        """
+        Sends the message to all open tabs. Can be called from any thread.
+        """
+        for handler in list(cls._open_handlers):
+            handler.connector.write_message(message)
+
+    def _update_active_document(self, data: dict) -> None:
+        active_document = data.get("activeDocument")
+        if isinstance(active_document, dict):
+            self.active_document = ActiveDocument(
+                path=active_document.get("path") or "",
+                dirty=active_document.get("dirty", False) == True,
+            )
+
+    def get_compression_options(self):
+        # enable permessage-deflate with default options
+        return {}
 
     def on_message(self, message):
         msg = json.loads(message)
@@ -650,6 +723,7 @@ class WebsocketCopilotHandler(websocket.WebSocketHandler):
         messageType = msg["type"]
         if messageType == RequestDataType.ChatRequest:
             data = msg["data"]
+            self._update_active_document(data)
             chatId = data["chatId"]
             prompt = data["prompt"]
             language = data["language"]
@@ -668,13 +742,8 @@ class WebsocketCopilotHandler(websocket.WebSocketHandler):
             )
 
             request_chat_history = self.chat_history.get_history(chatId).copy()
-
-            token_limit = (
-                100
-                if ai_service_manager.chat_model is None
-                else ai_service_manager.chat_model.context_window
-            )
-            token_budget = 0.8 * token_limit
+            # messages of the request are kept in history for the participant it addresses
+            participant_id = AIServiceManager.parse_prompt(prompt)[0]
 
             for context in additionalContext:
                 file_path = context["filePath"]
@@ -685,17 +754,18 @@ class WebsocketCopilotHandler(websocket.WebSocketHandler):
                 end_line = context.get("endLine", 0)
                 current_cell_contents = context.get("currentCellContents", {})
                 current_cell_input = current_cell_contents.get("input", "")
-                current_cell_output = current_cell_contents.get("output", "")
+                # outputs like dataframes, tracebacks and images are condensed
+                current_cell_output = condense_output_text(
+                    current_cell_contents.get("output", "")
+                ).text
 
                 current_cell_context = (
                     f"This is a Jupyter notebook and currently selected cell input is: ```{current_cell_input}``` and currently selected cell output is: ```{current_cell_output}```. If user asks a question about 'this' cell then assume that user is referring to currently selected cell."
                     if current_cell_contents is not None
                     else ""
                 )
+                # context is trimmed to fit the model's context window with the rest of the request
                 context_content = context.get("content", "")
-                token_count = len(tiktoken_encoding.encode(context_content))
-                if token_count > token_budget:
-                    context_content = context_content[: int(token_budget)] + "..."
                 msg_content = f"Use this as additional context: ```{context_content}```. It is from current file: '{filename}' at path '{file_path}'"
                 if start_line >= 0 and end_line > 0:
                     msg_content += f", lines: {start_line} - {end_line}."
@@ -714,33 +784,33 @@ class WebsocketCopilotHandler(websocket.WebSocketHandler):
                         "role": "user",
                         "content": f"This file was provided as additional context: '{filename}' at path '{file_path}'. {current_cell_context}",
                     },
+                    participant_id,
                 )
 
-            self.chat_history.add_message(chatId, {"role": "user", "content": prompt})
+            self.chat_history.add_message(
+                chatId, {"role": "user", "content": prompt}, participant_id
+            )
             request_chat_history.append({"role": "user", "content": prompt})
+            cancel_token = CancelTokenImpl()
             response_emitter = WebsocketCopilotResponseEmitter(
-                chatId, messageId, self, self.chat_history
+                chatId, messageId, self, self.chat_history, cancel_token
             )
-            cancel_token = CancelTokenImpl()
             self._messageCallbackHandlers[messageId] = MessageCallbackHandlers(
                 response_emitter, cancel_token
             )
-            thread = threading.Thread(
-                target=asyncio.run,
-                args=(
-                    ai_service_manager.handle_chat_request(
-                        ChatRequest(
-                            chat_mode=chat_mode,
-                            tool_selection=tool_selection,
-                            prompt=prompt,
-                            chat_history=request_chat_history,
-                            cancel_token=cancel_token,
-                        ),
-                        response_emitter,
+            self._submit_request(
+                ai_service_manager.handle_chat_request(
+                    ChatRequest(
+                        chat_mode=chat_mode,
+                        tool_selection=tool_selection,
+                        prompt=prompt,
+                        chat_history=request_chat_history,
+                        cancel_token=cancel_token,
                     ),
+                    response_emitter,
                 ),
+                response_emitter,
             )
-            thread.start()
         elif messageType == RequestDataType.GenerateCode:
             data = msg["data"]
             chatId = data["chatId"]
@@ -751,6 +821,8 @@ class WebsocketCopilotHandler(websocket.WebSocketHandler):
             language = data["language"]
             filename = data["filename"]
             chat_mode = ChatMode("ask", "Ask")
+            # code is generated by the default participant
+            participant_id = DEFAULT_CHAT_PARTICIPANT_ID
             if prefix != "":
                 self.chat_history.add_message(
                     chatId,
@@ -758,6 +830,7 @@ class WebsocketCopilotHandler(websocket.WebSocketHandler):
                         "role": "user",
                         "content": f"This code section comes before the code section you will generate, use as context. Leading content: ```{prefix}```",
                     },
+                    participant_id,
                 )
             if suffix != "":
                 self.chat_history.add_message(
@@ -766,6 +839,7 @@ class WebsocketCopilotHandler(websocket.WebSocketHandler):
                         "role": "user",
                         "content": f"This code section comes after the code section you will generate, use as context. Trailing content: ```{suffix}```",
                     },
+                    participant_id,
                 )
             if existing_code != "":
                 self.chat_history.add_message(
@@ -774,14 +848,15 @@ class WebsocketCopilotHandler(websocket.WebSocketHandler):
                         "role": "user",
                         "content": f"You are asked to modify the existing code. Generate a replacement for this existing code : ```{existing_code}```",
                     },
+                    participant_id,
                 )
             self.chat_history.add_message(
-                chatId, {"role": "user", "content": f"Generate code for: {prompt}"}
+                chatId, {"role": "user", "content": f"Generate code for: {prompt}"}, participant_id
             )
+            cancel_token = CancelTokenImpl()
             response_emitter = WebsocketCopilotResponseEmitter(
-                chatId, messageId, self, self.chat_history
+                chatId, messageId, self, self.chat_history, cancel_token
             )
-            cancel_token = CancelTokenImpl()
             self._messageCallbackHandlers[messageId] = MessageCallbackHandlers(
                 response_emitter, cancel_token
             )
@@ -790,24 +865,21 @@ class WebsocketCopilotHandler(websocket.WebSocketHandler):
                 if existing_code != ""
                 else ""
             )
-            thread = threading.Thread(
-                target=asyncio.run,
-                args=(
-                    ai_service_manager.handle_chat_request(
-                        ChatRequest(
-                            chat_mode=chat_mode,
-                            prompt=prompt,
-                            chat_history=self.chat_history.get_history(chatId),
-                            cancel_token=cancel_token,
-                        ),
-                        response_emitter,
-                        options={
-                            "system_prompt": f"You are an assistant that generates code for '{language}' language. You generate code between existing leading and trailing code sections.{existing_code_message} Be concise and return only code as a response. Don't include leading content or trailing content in your response, they are provided only for context. You can reuse methods and symbols defined in leading and trailing content."
-                        },
+            self._submit_request(
+                ai_service_manager.handle_chat_request(
+                    ChatRequest(
+                        chat_mode=chat_mode,
+                        prompt=prompt,
+                        chat_history=self.chat_history.get_history(chatId),
+                        cancel_token=cancel_token,
                     ),
+                    response_emitter,
+                    options={
+                        "system_prompt": f"You are an assistant that generates code for '{language}' language. You generate code between existing leading and trailing code sections.{existing_code_message} Be concise and return only code as a response. Don't include leading content or trailing content in your response, they are provided only for context. You can reuse methods and symbols defined in leading and trailing content."
+                    },
                 ),
+                response_emitter,
             )
-            thread.start()
         elif messageType == RequestDataType.InlineCompletionRequest:
             data = msg["data"]
             chatId = data["chatId"]
@@ -815,30 +887,46 @@ class WebsocketCopilotHandler(websocket.WebSocketHandler):
             suffix = data["suffix"]
             language = data["language"]
             filename = data["filename"]
-            chat_history = ChatHistory()
 
+            # inline completions are not kept in chat history
+            cancel_token = CancelTokenImpl()
             response_emitter = WebsocketCopilotResponseEmitter(
-                chatId, messageId, self, chat_history
+                chatId, messageId, self, None, cancel_token
             )
-            cancel_token = CancelTokenImpl()
             self._messageCallbackHandlers[messageId] = MessageCallbackHandlers(
                 response_emitter, cancel_token
             )
 
-            thread = threading.Thread(
-                target=asyncio.run,
-                args=(
-                    WebsocketCopilotHandler.handle_inline_completions(
-                        prefix,
-                        suffix,
-                        language,
-                        filename,
-                        response_emitter,
-                        cancel_token,
-                    ),
-                ),
-            )
-            thread.start()
+            # chatId is unique per inline completion request, editors are told apart by filename
+            flight_key = (prefix, suffix, language, filename)
+            flight, is_leader = self._inline_completion_scheduler.join(filename, flight_key)
+
+            def _on_flight_done(future):
+                self._messageCallbackHandlers.pop(messageId, None)
+                completions = future.result()
+                if completions is not None and not cancel_token.is_cancel_requested:
+                    response_emitter.stream({"completions": completions})
+                response_emitter.finish()
+
+            flight.future.add_done_callback(_on_flight_done)
+
+            if is_leader:
+                future = request_runtime.submit(
+                    self._inline_completion_scheduler.run(
+                        flight_key,
+                        flight,
+                        WebsocketCopilotHandler.handle_inline_completions(
+                            prefix,
+                            suffix,
+                            language,
+                            filename,
+                            flight.cancel_token,
+                        ),
+                    )
+                )
+                if future is None:
+                    log.warning(f"Request runtime is busy, rejected request {messageId}")
+                    self._inline_completion_scheduler.complete(flight_key, flight, None)
         elif messageType == RequestDataType.ChatUserInput:
             handlers = self._messageCallbackHandlers.get(messageId)
             if handlers is None:
@@ -847,10 +935,13 @@ class WebsocketCopilotHandler(websocket.WebSocketHandler):
         elif messageType == RequestDataType.ClearChatHistory:
             self.chat_history.clear()
         elif messageType == RequestDataType.RunUICommandResponse:
+            self._update_active_document(msg["data"])
             handlers = self._messageCallbackHandlers.get(messageId)
             if handlers is None:
                 return
             handlers.response_emitter.on_run_ui_command_response(msg["data"])
+        elif messageType == RequestDataType.ActiveDocumentChange:
+            self._update_active_document(msg["data"])
         elif (
             messageType == RequestDataType.CancelChatRequest
             or messageType == RequestDataType.CancelInlineCompletionRequest
@@ -861,14 +952,40 @@ class WebsocketCopilotHandler(websocket.WebSocketHandler):
             handlers.cancel_token.cancel_request()
 
     def on_close(self):
-        pass
+        WebsocketCopilotHandler._open_handlers.discard(self)
+        self.stream_writer.close()
+        self._inline_completion_scheduler.cancel_all()
+        # stop requests of the closed tab, including those waiting for UI responses
+        for handlers in list(self._messageCallbackHandlers.values()):
+            handlers.cancel_token.cancel_request()
+        self._messageCallbackHandlers.clear()
+
+    def _submit_request(self, coro, response_emitter: WebsocketCopilotResponseEmitter):
+        message_id = response_emitter.message_id
+        future = request_runtime.submit(coro)
+        if future is not None:
+            # callback handlers are no longer needed once the request is done
+            future.add_done_callback(lambda _: self._messageCallbackHandlers.pop(message_id, None))
+            return
+        log.warning(f"Request runtime is busy, rejected request {message_id}")
+        self._messageCallbackHandlers.pop(message_id, None)
+        response_emitter.stream(
+            MarkdownData("Server is busy handling other requests. Please try again shortly.")
+        )
+        response_emitter.finish()
 
     async def handle_inline_completions(
-        prefix, suffix, language, filename, response_emitter, cancel_token
-    ):
+        prefix, suffix, language, filename, cancel_token
+    ) -> Union[str, None]:
         if ai_service_manager.inline_completion_model is None:
-            response_emitter.finish()
-            return
+            return None
+
+        inline_completion_model = ai_service_manager.inline_completion_model
+        model_key = model_cache_key(inline_completion_model)
+        # cache hits are served before context providers run
+        completions = inline_completion_cache.get(model_key, language, filename, prefix, suffix)
+        if completions is not None:
+            return completions
 
         context = await ai_service_manager.get_completion_context(
             ContextRequest(
@@ -883,18 +1000,24 @@ class WebsocketCopilotHandler(websocket.WebSocketHandler):
         )
 
         if cancel_token.is_cancel_requested:
-            response_emitter.finish()
-            return
-
-        completions = ai_service_manager.inline_completion_model.inline_completions(
-            prefix, suffix, language, filename, context, cancel_token
+            return None
+
+        options = {"stop_boundary": WebsocketCopilotHandler.inline_completion_stop_boundary}
+
+        completions = await inline_completion_model.ainline_completions(
+            prefix,
+            suffix,
+            language,
+            filename,
+            context,
+            cancel_token,
+            **options_argument(inline_completion_model.ainline_completions, options),
         )
         if cancel_token.is_cancel_requested:
-            response_emitter.finish()
-            return
+            return None
 
-        response_emitter.stream({"completions": completions})
-        response_emitter.finish()
+        inline_completion_cache.put(model_key, language, filename, prefix, suffix, completions)
+        return completions
 
 
 class NotebookIntelligence(ExtensionApp):
@@ -922,12 +1045,94 @@ class NotebookIntelligence(ExtensionApp):
         config=True,
     )
 
+    inline_completion_stop_boundary = Unicode(
+        default_value="end_of_block",
+        help="""
+        Where streamed inline completions are cut off early.
+
+        'end_of_block' - Stop at indentation drop or at the end of the current block (default).
+        'indentation_drop' - Stop when a line is indented less than the line at cursor.
+        'disabled' - Use the full completion returned by the model.
+        """,
+        config=True,
+    )
+
+    inline_completion_cache_max_entries = Integer(
+        default_value=256,
+        help="Maximum number of inline completion results cached. Set to 0 to disable the cache.",
+        config=True,
+    )
+
+    inline_completion_cache_ttl = Integer(
+        default_value=300,
+        help="Number of seconds an inline completion result is kept in the cache.",
+        config=True,
+    )
+
+    chat_history_max_tokens = Integer(
+        default_value=200000,
+        help="Maximum number of tokens kept in chat history of a connection, across all chats.",
+        config=True,
+    )
+
+    chat_history_max_chats = Integer(
+        default_value=64,
+        help="Maximum number of chats kept in chat history of a connection.",
+        config=True,
+    )
+
+    chat_history_idle_timeout = Integer(
+        default_value=3600,
+        help="Number of seconds after which history of an idle chat is evicted.",
+        config=True,
+    )
+
+    ui_command_timeout = Integer(
+        default_value=600,
+        help="Number of seconds to wait for the UI to respond to a command run by a tool. Set to 0 to wait indefinitely.",
+        config=True,
+    )
+
+    cell_execution_timeout = Integer(
+        default_value=600,
+        help="Number of seconds to wait for a cell run by the notebook execute tool to finish before interrupting the kernel. Set to 0 to wait indefinitely.",
+        config=True,
+    )
+
+    request_runtime_event_loops = Integer(
+        default_value=1,
+        help="Number of event loops that websocket requests are multiplexed on.",
+        config=True,
+    )
+
+    request_runtime_max_concurrent_requests = Integer(
+        default_value=32,
+        help="Maximum number of chat and inline completion requests processed at the same time.",
+        config=True,
+    )
+
+    request_runtime_max_queued_requests = Integer(
+        default_value=128,
+        help="Maximum number of requests waiting to be processed. Requests beyond this are rejected.",
+        config=True,
+    )
+
+    request_runtime_executor_max_workers = Integer(
+        default_value=8,
+        help="Maximum number of worker threads used for blocking calls made by requests.",
+        config=True,
+    )
+
     def initialize_settings(self):
         pass
 
     def initialize_handlers(self):
         NotebookIntelligence.root_dir = self.serverapp.root_dir
+        document_reader.configure(self.serverapp.root_dir)
+        kernel_executor.configure(self.serverapp.kernel_manager, self.serverapp.session_manager)
         server_root_dir = os.path.expanduser(self.serverapp.web_app.settings["server_root_dir"])
+        self.initialize_request_runtime()
+        self.initialize_inline_completion_cache()
         self.initialize_ai_service(server_root_dir)
         self._setup_handlers(self.serverapp.web_app)
         self.serverapp.log.info(f"Registered {self.name} server extension")
@@ -935,6 +1140,29 @@ class NotebookIntelligence(ExtensionApp):
     def initialize_ai_service(self, server_root_dir: str):
         global ai_service_manager
         ai_service_manager = AIServiceManager({"server_root_dir": server_root_dir})
+        ai_service_manager.mcp_tools_changed_signal.connect(self._on_mcp_tools_changed)
+
+    def _on_mcp_tools_changed(self):
+        # let the UI of every open tab refresh tools shown from the tool catalog
+        WebsocketCopilotHandler.broadcast({"type": BackendMessageType.MCPToolsChange, "data": {}})
+
+    def initialize_request_runtime(self):
+        global request_runtime
+        request_runtime = RequestRuntime(
+            num_event_loops=self.request_runtime_event_loops,
+            max_concurrent_requests=self.request_runtime_max_concurrent_requests,
+            max_queued_requests=self.request_runtime_max_queued_requests,
+            executor_max_workers=self.request_runtime_executor_max_workers,
+        )
+        request_runtime.start()
+        github_copilot.http_client_event_loops = request_runtime.event_loops
+
+    def initialize_inline_completion_cache(self):
+        global inline_completion_cache
+        inline_completion_cache = InlineCompletionCache(
+            max_entries=self.inline_completion_cache_max_entries,
+            ttl=self.inline_completion_cache_ttl,
+        )
 
     def initialize_templates(self):
         pass
@@ -942,6 +1170,11 @@ class NotebookIntelligence(ExtensionApp):
     async def stop_extension(self):
         log.info(f"Stopping {self.name} extension...")
         github_copilot.handle_stop_request()
+        github_copilot.close_http_clients()
+        if ai_service_manager is not None:
+            ai_service_manager.shutdown()
+        if request_runtime is not None:
+            request_runtime.stop()
 
     def _setup_handlers(self, web_app):
         host_pattern = ".*$"
@@ -966,6 +1199,7 @@ class NotebookIntelligence(ExtensionApp):
         route_pattern_emit_telemetry_event = url_path_join(
             base_url, "lab-notebook-intelligence", "emit-telemetry-event"
         )
+        route_pattern_metrics = url_path_join(base_url, "lab-notebook-intelligence", "metrics")
         route_pattern_github_login_status = url_path_join(
             base_url, "lab-notebook-intelligence", "gh-login-status"
         )
@@ -977,6 +1211,14 @@ class NotebookIntelligence(ExtensionApp):
         )
         route_pattern_copilot = url_path_join(base_url, "lab-notebook-intelligence", "copilot")
         GetCapabilitiesHandler.notebook_execute_tool = self.notebook_execute_tool
+        ChatHistory.max_tokens = self.chat_history_max_tokens
+        ChatHistory.max_chats = self.chat_history_max_chats
+        ChatHistory.idle_timeout = self.chat_history_idle_timeout
+        WebsocketCopilotResponseEmitter.ui_command_timeout = self.ui_command_timeout
+        KernelExecutor.timeout = self.cell_execution_timeout
+        WebsocketCopilotHandler.inline_completion_stop_boundary = InlineCompletionStopBoundary(
+            self.inline_completion_stop_boundary
+        )
         NotebookIntelligence.handlers = [
             (route_pattern_capabilities, GetCapabilitiesHandler),
             (route_pattern_config, ConfigHandler),
@@ -985,6 +1227,7 @@ class NotebookIntelligence(ExtensionApp):
             (route_pattern_mcp_config_file, MCPConfigFileHandler),
             (route_pattern_create_dynamic_mcp_config, CreateDynamicMCPConfigHandler),
             (route_pattern_emit_telemetry_event, EmitTelemetryEventHandler),
+            (route_pattern_metrics, GetMetricsHandler),
             (route_pattern_github_login_status, GetGitHubLoginStatusHandler),
             (route_pattern_github_login, PostGitHubLoginHandler),
             (route_pattern_github_logout, GetGitHubLogoutHandler),
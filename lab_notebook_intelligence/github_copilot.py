@@ -2,8 +2,10 @@
 #
 # GitHub auth and inline completion sections are derivative of https://github.com/B00TK1D/copilot-api
 
+import asyncio
 import base64
 import datetime as dt
+import importlib.util
 import json
 import logging
 import os
@@ -11,19 +13,25 @@ import secrets
 import threading
 import time
 import uuid
+import weakref
 from enum import Enum
-from typing import Any
+from typing import Any, Union
 
-import requests
-import sseclient
+import httpx
 
 from lab_notebook_intelligence.api import (
     BackendMessageType,
+    CancelScope,
     CancelToken,
     ChatResponse,
     CompletionContext,
     MarkdownData,
 )
+from lab_notebook_intelligence.inline_completion_cutoff import (
+    InlineCompletionCutoff,
+    InlineCompletionStopBoundary,
+)
+from lab_notebook_intelligence.request_runtime import add_loop_cleanup
 from lab_notebook_intelligence.util import (
     ThreadSafeWebSocketConnector,
     decrypt_with_password,
@@ -54,8 +62,16 @@ TOKEN_REFRESH_INTERVAL = 1500
 ACCESS_TOKEN_THREAD_SLEEP_INTERVAL = 5
 TOKEN_THREAD_SLEEP_INTERVAL = 3
 TOKEN_FETCH_INTERVAL = 15
+INLINE_COMPLETION_MAX_TOKENS = 500
 NL = "\n"
 
+HTTP_MAX_CONNECTIONS = int(os.getenv("NBI_GH_HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("NBI_GH_HTTP_MAX_KEEPALIVE_CONNECTIONS", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("NBI_GH_HTTP_KEEPALIVE_EXPIRY", "120"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("NBI_GH_HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_TIMEOUT = float(os.getenv("NBI_GH_HTTP_TIMEOUT", "120"))
+HTTP2_ENABLED = os.getenv("NBI_GH_HTTP2", "disabled") == "enabled"
+
 LoginStatus = Enum("LoginStatus", ["NOT_LOGGED_IN", "ACTIVATING_DEVICE", "LOGGING_IN", "LOGGED_IN"])
 
 github_auth = {
@@ -78,6 +94,14 @@ github_access_token_provided = None
 websocket_connector: ThreadSafeWebSocketConnector = None
 github_login_status_change_updater_enabled = False
 
+# event loops that requests are served from, their HTTP clients are pre-warmed on login
+http_client_event_loops: list[asyncio.AbstractEventLoop] = []
+_http_client: httpx.Client = None
+_async_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+    weakref.WeakKeyDictionary()
+)
+_http_clients_lock = threading.Lock()
+
 deprecated_user_data_file = os.path.join(os.path.expanduser("~"), ".jupyter", "nbi-data.json")
 user_data_file = os.path.join(os.path.expanduser("~"), ".jupyter", "nbi", "user-data.json")
 access_token_password = os.getenv("NBI_GH_ACCESS_TOKEN_PASSWORD", "nbi-access-token-password")
@@ -94,6 +118,100 @@ def get_gh_access_token_from_env() -> str:
     return None
 
 
+def _http_client_options() -> dict:
+    http2 = HTTP2_ENABLED
+    if http2 and importlib.util.find_spec("h2") is None:
+        log.warning("HTTP/2 requested for GitHub Copilot but 'h2' package is not installed")
+        http2 = False
+
+    return {
+        "http2": http2,
+        "limits": httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+    }
+
+
+def get_http_client() -> httpx.Client:
+    """
+    Process-wide connection-pooled client for GitHub and GitHub Copilot endpoints.
+    """
+    global _http_client
+    with _http_clients_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(**_http_client_options())
+        return _http_client
+
+
+def get_async_http_client(loop: asyncio.AbstractEventLoop = None) -> httpx.AsyncClient:
+    """
+    Connection-pooled async client for GitHub Copilot endpoints. Async connections are
+    bound to an event loop, so there is one client per loop.
+    """
+    if loop is None:
+        loop = asyncio.get_running_loop()
+    with _http_clients_lock:
+        client = _async_http_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(**_http_client_options())
+            _async_http_clients[loop] = client
+        return client
+
+
+async def _close_async_http_client(loop: asyncio.AbstractEventLoop) -> None:
+    with _http_clients_lock:
+        client = _async_http_clients.pop(loop, None)
+    if client is not None:
+        await client.aclose()
+
+
+add_loop_cleanup(_close_async_http_client)
+
+
+def prewarm_http_clients():
+    """
+    Open keep-alive connections to Copilot endpoints ahead of the first completion
+    request so that it does not pay for TCP and TLS handshakes.
+    """
+    endpoints = [API_ENDPOINT, PROXY_ENDPOINT]
+
+    def _prewarm():
+        client = get_http_client()
+        for endpoint in endpoints:
+            try:
+                client.head(endpoint)
+            except Exception as e:
+                log.debug(f"Failed to pre-warm connection to {endpoint}: {e}")
+
+    async def _aprewarm():
+        client = get_async_http_client()
+        for endpoint in endpoints:
+            try:
+                await client.head(endpoint)
+            except Exception as e:
+                log.debug(f"Failed to pre-warm connection to {endpoint}: {e}")
+
+    threading.Thread(target=_prewarm, daemon=True).start()
+    for loop in http_client_event_loops:
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(_aprewarm(), loop)
+
+
+def close_http_clients():
+    global _http_client
+    with _http_clients_lock:
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
+        for loop, client in list(_async_http_clients.items()):
+            if loop.is_running():
+                asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        _async_http_clients.clear()
+
+
 def enable_github_login_status_change_updater(enabled: bool):
     global github_login_status_change_updater_enabled
     github_login_status_change_updater_enabled = enabled
@@ -259,7 +377,7 @@ def get_device_verification_info():
     global github_auth
     data = {"client_id": CLIENT_ID, "scope": "read:user"}
     try:
-        resp = requests.post(
+        resp = get_http_client().post(
             f"{GH_WEB_BASE_URL}/login/device/code",
             headers={
                 "accept": "application/json",
@@ -267,9 +385,9 @@ def get_device_verification_info():
                 "editor-plugin-version": EDITOR_PLUGIN_VERSION,
                 "content-type": "application/json",
                 "user-agent": USER_AGENT,
-                "accept-encoding": "gzip,deflate,br",
+                "accept-encoding": "gzip,deflate",
             },
-            data=json.dumps(data),
+            content=json.dumps(data),
         )
 
         resp_json = resp.json()
@@ -315,7 +433,7 @@ def wait_for_user_access_token_thread_func():
             "grant_type": "urn:ietf:params:oauth:grant-type:device_code",
         }
         try:
-            resp = requests.post(
+            resp = get_http_client().post(
                 f"{GH_WEB_BASE_URL}/login/oauth/access_token",
                 headers={
                     "accept": "application/json",
@@ -323,9 +441,9 @@ def wait_for_user_access_token_thread_func():
                     "editor-plugin-version": EDITOR_PLUGIN_VERSION,
                     "content-type": "application/json",
                     "user-agent": USER_AGENT,
-                    "accept-encoding": "gzip,deflate,br",
+                    "accept-encoding": "gzip,deflate",
                 },
-                data=json.dumps(data),
+                content=json.dumps(data),
             )
 
             resp_json = resp.json()
@@ -354,7 +472,7 @@ def get_token():
     emit_github_login_status_change()
 
     try:
-        resp = requests.get(
+        resp = get_http_client().get(
             f"{GH_REST_API_BASE_URL}/copilot_internal/v2/token",
             headers={
                 "authorization": f"token {access_token}",
@@ -384,6 +502,7 @@ def get_token():
             github_auth["token_expires_at"] = dt.datetime.now() + dt.timedelta(
                 seconds=TOKEN_REFRESH_INTERVAL
             )
+        was_logged_in = github_auth["status"] == LoginStatus.LOGGED_IN
         github_auth["verification_uri"] = None
         github_auth["user_code"] = None
         github_auth["status"] = LoginStatus.LOGGED_IN
@@ -393,6 +512,9 @@ def get_token():
         API_ENDPOINT = endpoints.get("api", API_ENDPOINT)
         PROXY_ENDPOINT = endpoints.get("proxy", PROXY_ENDPOINT)
         TOKEN_REFRESH_INTERVAL = resp_json.get("refresh_in", TOKEN_REFRESH_INTERVAL)
+
+        if not was_logged_in:
+            prewarm_http_clients()
     except Exception as e:
         log.error(f"Failed to get token from GitHub Copilot: {e}")
 
@@ -450,6 +572,47 @@ def generate_copilot_headers():
     }
 
 
+def _inline_completions_prompt(filename, prefix, context: CompletionContext) -> str:
+    prompt = f"# Path: {filename}"
+
+    if context is not None:
+        for item in context.items:
+            context_file = f"Compare this snippet from {item.filePath if item.filePath is not None else 'undefined'}:{NL}{item.content}{NL}"
+            prompt += "\n# " + "\n# ".join(context_file.split("\n"))
+
+    prompt += f"{NL}{prefix}"
+
+    return prompt
+
+
+def _inline_completions_request_data(prompt, suffix, language) -> dict:
+    return {
+        "prompt": prompt,
+        "suffix": suffix,
+        "max_tokens": INLINE_COMPLETION_MAX_TOKENS,
+        "temperature": 0,
+        "top_p": 1,
+        "n": 1,
+        "stop": ["<END>", "```"],
+        "nwo": "LabNotebookIntelligence",
+        "stream": True,
+        "extra": {
+            "language": language,
+            "next_indent": 0,
+            "trim_by_indentation": True,
+        },
+    }
+
+
+def _inline_completion_chunk_text(event_data: str) -> str:
+    if not event_data.startswith("{"):
+        return ""
+    choices = json.loads(event_data).get("choices")
+    if not choices:
+        return ""
+    return choices[0].get("text") or ""
+
+
 def inline_completions(
     model_id,
     prefix,
@@ -458,46 +621,40 @@ def inline_completions(
     filename,
     context: CompletionContext,
     cancel_token: CancelToken,
+    options: dict = {},
 ) -> str:
     global github_auth
     token = github_auth["token"]
 
-    prompt = f"# Path: {filename}"
-
     if cancel_token.is_cancel_requested:
         return ""
 
-    if context is not None:
-        for item in context.items:
-            context_file = f"Compare this snippet from {item.filePath if item.filePath is not None else 'undefined'}:{NL}{item.content}{NL}"
-            prompt += "\n# " + "\n# ".join(context_file.split("\n"))
-
-    prompt += f"{NL}{prefix}"
+    prompt = _inline_completions_prompt(filename, prefix, context)
+    cutoff = InlineCompletionCutoff(
+        prefix, options.get("stop_boundary", InlineCompletionStopBoundary.EndOfBlock)
+    )
 
     try:
-        if cancel_token.is_cancel_requested:
-            return ""
-        resp = requests.post(
+        with get_http_client().stream(
+            "POST",
             f"{PROXY_ENDPOINT}/v1/engines/{model_id}/completions",
             headers={"authorization": f"Bearer {token}"},
-            json={
-                "prompt": prompt,
-                "suffix": suffix,
-                "min_tokens": 500,
-                "max_tokens": 2000,
-                "temperature": 0,
-                "top_p": 1,
-                "n": 1,
-                "stop": ["<END>", "```"],
-                "nwo": "LabNotebookIntelligence",
-                "stream": True,
-                "extra": {
-                    "language": language,
-                    "next_indent": 0,
-                    "trim_by_indentation": True,
-                },
-            },
-        )
+            json=_inline_completions_request_data(prompt, suffix, language),
+        ) as resp:
+            if resp.status_code != 200:
+                resp.read()
+                log.error(f"Failed to get inline completions: [{resp.status_code}]: {resp.text}")
+                return ""
+            # leaving the stream context early closes the connection
+            for event_data in _iter_sse_data(resp):
+                if cancel_token.is_cancel_requested:
+                    return ""
+                if event_data == "[DONE]":
+                    break
+                chunk = _inline_completion_chunk_text(event_data)
+                cutoff.feed(chunk)
+                if cutoff.stopped:
+                    break
     except Exception as e:
         log.error(f"Failed to get inline completions: {e}")
         return ""
@@ -505,55 +662,80 @@ def inline_completions(
     if cancel_token.is_cancel_requested:
         return ""
 
-    result = ""
+    return cutoff.text
 
-    decoded_response = resp.content.decode()
 
-    resp_text = decoded_response.split("\n")
-    for line in resp_text:
-        if line.startswith("data: {"):
-            json_completion = json.loads(line[6:])
-            completion = json_completion.get("choices")[0].get("text")
-            if completion:
-                result += completion
-            # else:
-            #     result += '\n'
+async def ainline_completions(
+    model_id,
+    prefix,
+    suffix,
+    language,
+    filename,
+    context: CompletionContext,
+    cancel_token: CancelToken,
+    options: dict = {},
+) -> str:
+    global github_auth
+    token = github_auth["token"]
 
-    return result
+    if cancel_token.is_cancel_requested:
+        return ""
 
+    prompt = _inline_completions_prompt(filename, prefix, context)
+    cutoff = InlineCompletionCutoff(
+        prefix, options.get("stop_boundary", InlineCompletionStopBoundary.EndOfBlock)
+    )
 
-def _aggregate_streaming_response(client: sseclient.SSEClient) -> dict:
-    final_tool_calls = []
-    final_content = ""
+    try:
+        async with CancelScope(cancel_token):
+            async with get_async_http_client().stream(
+                "POST",
+                f"{PROXY_ENDPOINT}/v1/engines/{model_id}/completions",
+                headers={"authorization": f"Bearer {token}"},
+                json=_inline_completions_request_data(prompt, suffix, language),
+            ) as resp:
+                if resp.status_code != 200:
+                    await resp.aread()
+                    log.error(
+                        f"Failed to get inline completions: [{resp.status_code}]: {resp.text}"
+                    )
+                    return ""
+                # leaving the stream context early closes the connection
+                async for event_data in _aiter_sse_data(resp):
+                    if cancel_token.is_cancel_requested:
+                        return ""
+                    if event_data == "[DONE]":
+                        break
+                    chunk = _inline_completion_chunk_text(event_data)
+                    cutoff.feed(chunk)
+                    if cutoff.stopped:
+                        break
+    except Exception as e:
+        log.error(f"Failed to get inline completions: {e}")
+        return ""
 
-    def _format_llm_response():
-        for tool_call in final_tool_calls:
-            if "arguments" in tool_call["function"] and tool_call["function"]["arguments"] == "":
-                tool_call["function"]["arguments"] = "{}"
+    if cancel_token.is_cancel_requested:
+        return ""
+
+    return cutoff.text
 
-        return {
-            "choices": [
-                {
-                    "message": {
-                        "tool_calls": (final_tool_calls if len(final_tool_calls) > 0 else None),
-                        "content": final_content,
-                        "role": "assistant",
-                    }
-                }
-            ]
-        }
 
-    for event in client.events():
-        if event.data == "[DONE]":
-            return _format_llm_response()
+class _StreamingResponseAggregator:
+    """
+    Aggregates streamed chat completion chunks into a single non-streaming response.
+    """
 
-        chunk = json.loads(event.data)
+    def __init__(self):
+        self._tool_calls = []
+        self._content = ""
+
+    def add_chunk(self, chunk: dict) -> None:
         if len(chunk["choices"]) == 0:
-            continue
+            return
 
         content_chunk = chunk["choices"][0]["delta"].get("content")
         if content_chunk:
-            final_content += content_chunk
+            self._content += content_chunk
 
         for tool_call in chunk["choices"][0]["delta"].get("tool_calls", []):
             if "index" not in tool_call:
@@ -561,18 +743,113 @@ def _aggregate_streaming_response(client: sseclient.SSEClient) -> dict:
 
             index = tool_call["index"]
 
-            if index >= len(final_tool_calls):
+            if index >= len(self._tool_calls):
                 tc = tool_call.copy()
                 if "arguments" not in tc:
                     tc["function"]["arguments"] = ""
-                final_tool_calls.append(tc)
+                self._tool_calls.append(tc)
             else:
                 if "arguments" in tool_call["function"]:
-                    final_tool_calls[index]["function"]["arguments"] += tool_call["function"][
+                    self._tool_calls[index]["function"]["arguments"] += tool_call["function"][
                         "arguments"
                     ]
 
-    return _format_llm_response()
+    def response(self) -> dict:
+        for tool_call in self._tool_calls:
+            if "arguments" in tool_call["function"] and tool_call["function"]["arguments"] == "":
+                tool_call["function"]["arguments"] = "{}"
+
+        return {
+            "choices": [
+                {
+                    "message": {
+                        "tool_calls": (self._tool_calls if len(self._tool_calls) > 0 else None),
+                        "content": self._content,
+                        "role": "assistant",
+                    }
+                }
+            ]
+        }
+
+
+class _SSEDataParser:
+    """
+    Incremental server-sent events parser. Feed lines, get back the data field of
+    each completed event.
+    """
+
+    def __init__(self):
+        self._data_lines = []
+
+    def feed(self, line: str) -> Union[str, None]:
+        if line == "":
+            return self.flush()
+        if line.startswith(":"):
+            return None
+        field, _, value = line.partition(":")
+        if value.startswith(" "):
+            value = value[1:]
+        if field == "data":
+            self._data_lines.append(value)
+        return None
+
+    def flush(self) -> Union[str, None]:
+        if len(self._data_lines) == 0:
+            return None
+        data = "\n".join(self._data_lines)
+        self._data_lines = []
+        return data
+
+
+def _iter_sse_data(response: httpx.Response):
+    """
+    Yields the data field of each server-sent event in the response.
+    """
+    parser = _SSEDataParser()
+    for line in response.iter_lines():
+        data = parser.feed(line)
+        if data is not None:
+            yield data
+
+    data = parser.flush()
+    if data is not None:
+        yield data
+
+
+async def _aiter_sse_data(response: httpx.Response):
+    """
+    Yields the data field of each server-sent event in the response.
+    """
+    parser = _SSEDataParser()
+    async for line in response.aiter_lines():
+        data = parser.feed(line)
+        if data is not None:
+            yield data
+
+    data = parser.flush()
+    if data is not None:
+        yield data
+
+
+def _completions_request_data(model_id, messages, tools, options: dict) -> dict:
+    data = {
+        "model": model_id,
+        "messages": messages,
+        "tools": tools,
+        "temperature": 0,
+        "top_p": 1,
+        "n": 1,
+        "nwo": "LabNotebookIntelligence",
+        "stream": True,
+    }
+
+    if not (model_id == "gpt-5" or model_id == "gpt-5-mini"):
+        data["stop"] = ["<END>"]
+
+    if "tool_choice" in options:
+        data["tool_choice"] = options["tool_choice"]
+
+    return data
 
 
 def completions(
@@ -586,56 +863,104 @@ def completions(
     aggregate = response is None
 
     try:
-        data = {
-            "model": model_id,
-            "messages": messages,
-            "tools": tools,
-            "temperature": 0,
-            "top_p": 1,
-            "n": 1,
-            "nwo": "LabNotebookIntelligence",
-            "stream": True,
-        }
-
-        if not (model_id == "gpt-5" or model_id == "gpt-5-mini"):
-            data["stop"] = ["<END>"]
-
-        if "tool_choice" in options:
-            data["tool_choice"] = options["tool_choice"]
+        data = _completions_request_data(model_id, messages, tools, options)
 
         if cancel_token is not None and cancel_token.is_cancel_requested:
             if response is not None:
                 response.finish()
             return
 
-        request = requests.post(
+        with get_http_client().stream(
+            "POST",
             f"{API_ENDPOINT}/chat/completions",
             headers=generate_copilot_headers(),
             json=data,
-            stream=True,
-        )
+        ) as http_response:
+            if http_response.status_code != 200:
+                http_response.read()
+                msg = f"Failed to get completions from GitHub Copilot: [{http_response.status_code}]: {http_response.text}"
+                log.error(msg)
+                if response is not None:
+                    response.stream(MarkdownData(msg))
+                    response.finish()
+                raise Exception(msg)
+
+            if aggregate:
+                aggregator = _StreamingResponseAggregator()
+                for event_data in _iter_sse_data(http_response):
+                    if event_data == "[DONE]":
+                        break
+                    aggregator.add_chunk(json.loads(event_data))
+                return aggregator.response()
+            else:
+                # leaving the stream context closes the connection
+                for event_data in _iter_sse_data(http_response):
+                    if cancel_token is not None and cancel_token.is_cancel_requested:
+                        break
+                    if event_data == "[DONE]":
+                        break
+                    response.stream(json.loads(event_data))
+                response.finish()
+        return
+    except httpx.ConnectError:
+        raise Exception("Connection error")
+    except Exception as e:
+        log.error(f"Failed to get completions from GitHub Copilot: {e}")
+        raise e
+
 
-        if request.status_code != 200:
-            msg = f"Failed to get completions from GitHub Copilot: [{request.status_code}]: {request.text}"
-            log.error(msg)
+async def acompletions(
+    model_id,
+    messages,
+    tools=None,
+    response: ChatResponse = None,
+    cancel_token: CancelToken = None,
+    options: dict = {},
+) -> Any:
+    aggregate = response is None
+
+    try:
+        data = _completions_request_data(model_id, messages, tools, options)
+
+        if cancel_token is not None and cancel_token.is_cancel_requested:
             if response is not None:
-                response.stream(MarkdownData(msg))
                 response.finish()
-            raise Exception(msg)
+            return
 
-        client = sseclient.SSEClient(request)
-        if aggregate:
-            return _aggregate_streaming_response(client)
-        else:
-            for event in client.events():
-                if cancel_token is not None and cancel_token.is_cancel_requested:
-                    response.finish()
-                if event.data == "[DONE]":
-                    response.finish()
+        async with CancelScope(cancel_token):
+            async with get_async_http_client().stream(
+                "POST",
+                f"{API_ENDPOINT}/chat/completions",
+                headers=generate_copilot_headers(),
+                json=data,
+            ) as http_response:
+                if http_response.status_code != 200:
+                    await http_response.aread()
+                    msg = f"Failed to get completions from GitHub Copilot: [{http_response.status_code}]: {http_response.text}"
+                    log.error(msg)
+                    if response is not None:
+                        response.stream(MarkdownData(msg))
+                        response.finish()
+                    raise Exception(msg)
+
+                if aggregate:
+                    aggregator = _StreamingResponseAggregator()
+                    async for event_data in _aiter_sse_data(http_response):
+                        if event_data == "[DONE]":
+                            break
+                        aggregator.add_chunk(json.loads(event_data))
+                    return aggregator.response()
                 else:
-                    response.stream(json.loads(event.data))
+                    async for event_data in _aiter_sse_data(http_response):
+                        if event_data == "[DONE]":
+                            break
+                        response.stream(json.loads(event_data))
+
+        # a cancelled stream is aborted and its connection closed by the cancel scope
+        if not aggregate:
+            response.finish()
         return
-    except requests.exceptions.ConnectionError:
+    except httpx.ConnectError:
         raise Exception("Connection error")
     except Exception as e:
         log.error(f"Failed to get completions from GitHub Copilot: {e}")
@@ -0,0 +1,171 @@
+# Copyright (c) Mehmet Bektas <mbektasgh@outlook.com>
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Union
+
+from lab_notebook_intelligence.api import InlineCompletionModel
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_TTL = 300
+# number of recent entries per file and suffix checked for typing-through reuse
+MAX_TYPING_THROUGH_CANDIDATES = 8
+
+
+def _digest(*parts: str) -> str:
+    hash = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        hash.update(part.encode("utf-8", "surrogatepass"))
+        hash.update(b"\0")
+    return hash.hexdigest()
+
+
+def model_cache_key(model: InlineCompletionModel) -> str:
+    properties = [f"{prop.id}={prop.value}" for prop in model.properties]
+    return f"{model.provider.id}:{model.id}:{_digest(*properties)}"
+
+
+@dataclass
+class _CacheEntry:
+    key: tuple
+    group_key: tuple
+    prefix_length: int
+    prefix_digest: str
+    completion: str
+    expires_at: float
+
+
+class InlineCompletionCache:
+    """
+    LRU cache of inline completion results with TTL expiry. Besides exact matches,
+    it serves the rest of a cached completion when the user types the start of it.
+    Entries are keyed by file and text around the cursor, not by completion context,
+    so that lookups do not have to gather the context first.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl: float = DEFAULT_TTL):
+        self._max_entries = max(0, max_entries)
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple, _CacheEntry] = OrderedDict()
+        # entries that share model, language, file and suffix, most recent last
+        self._groups: dict[tuple, list[_CacheEntry]] = {}
+        self._hits = 0
+        self._typing_through_hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._max_entries > 0
+
+    def _group_key(self, model_key: str, language: str, filename: str, suffix: str) -> tuple:
+        return (model_key, language, filename, _digest(suffix))
+
+    def _remove_entry(self, entry: _CacheEntry) -> None:
+        self._entries.pop(entry.key, None)
+        group = self._groups.get(entry.group_key)
+        if group is not None:
+            if entry in group:
+                group.remove(entry)
+            if len(group) == 0:
+                del self._groups[entry.group_key]
+
+    def get(
+        self, model_key: str, language: str, filename: str, prefix: str, suffix: str
+    ) -> Union[str, None]:
+        if not self.enabled:
+            return None
+
+        group_key = self._group_key(model_key, language, filename, suffix)
+        prefix_digest = _digest(prefix)
+        key = group_key + (prefix_digest,)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return entry.completion
+                self._remove_entry(entry)
+
+            for entry in reversed(self._groups.get(group_key, [])):
+                if entry.expires_at <= now or entry.prefix_length >= len(prefix):
+                    continue
+                typed = prefix[entry.prefix_length :]
+                if len(typed) >= len(entry.completion) or not entry.completion.startswith(typed):
+                    continue
+                if _digest(prefix[: entry.prefix_length]) != entry.prefix_digest:
+                    continue
+                self._entries.move_to_end(entry.key)
+                self._typing_through_hits += 1
+                return entry.completion[len(typed) :]
+
+            self._misses += 1
+            return None
+
+    def put(
+        self,
+        model_key: str,
+        language: str,
+        filename: str,
+        prefix: str,
+        suffix: str,
+        completion: str,
+    ) -> None:
+        if not self.enabled or completion == "":
+            return
+
+        group_key = self._group_key(model_key, language, filename, suffix)
+        prefix_digest = _digest(prefix)
+        key = group_key + (prefix_digest,)
+        entry = _CacheEntry(
+            key=key,
+            group_key=group_key,
+            prefix_length=len(prefix),
+            prefix_digest=prefix_digest,
+            completion=completion,
+            expires_at=time.monotonic() + self._ttl,
+        )
+
+        with self._lock:
+            existing = self._entries.get(key)
+            if existing is not None:
+                self._remove_entry(existing)
+            self._entries[key] = entry
+            group = self._groups.setdefault(group_key, [])
+            group.append(entry)
+            if len(group) > MAX_TYPING_THROUGH_CANDIDATES:
+                group.pop(0)
+
+            while len(self._entries) > self._max_entries:
+                _, oldest = self._entries.popitem(last=False)
+                self._remove_entry(oldest)
+                self._evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._groups.clear()
+
+    @property
+    def metrics(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._typing_through_hits + self._misses
+            return {
+                "max_entries": self._max_entries,
+                "ttl": self._ttl,
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "typing_through_hits": self._typing_through_hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": (
+                    (self._hits + self._typing_through_hits) / lookups if lookups > 0 else 0
+                ),
+            }
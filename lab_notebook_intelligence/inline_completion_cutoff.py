@@ -0,0 +1,88 @@
+# Copyright (c) Mehmet Bektas <mbektasgh@outlook.com>
+
+from enum import Enum
+
+
+class InlineCompletionStopBoundary(str, Enum):
+    Disabled = "disabled"
+    # stop when a line is indented less than the line completion started on
+    IndentationDrop = "indentation_drop"
+    # in addition to indentation drop, stop at a blank line followed by a
+    # line at the same or lower indentation
+    EndOfBlock = "end_of_block"
+
+
+def _indent_width(line: str) -> int:
+    line = line.expandtabs(4)
+    return len(line) - len(line.lstrip(" "))
+
+
+class InlineCompletionCutoff:
+    """
+    Accumulates a streamed inline completion and detects the point where it should
+    be cut off, so that the rest of the stream does not need to be waited for.
+    """
+
+    def __init__(self, prefix: str, boundary: InlineCompletionStopBoundary):
+        current_line = prefix[prefix.rfind("\n") + 1 :]
+        if current_line.strip() == "":
+            self._base_indent = len(current_line.expandtabs(4))
+        else:
+            self._base_indent = _indent_width(current_line)
+        self._boundary = InlineCompletionStopBoundary(boundary)
+        self._text = ""
+        # offset to search for the newline that starts the next undecided line
+        self._scan_offset = 0
+        self._previous_line_blank = False
+        self._stopped = False
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    @property
+    def stopped(self) -> bool:
+        return self._stopped
+
+    def feed(self, chunk: str) -> str:
+        """
+        Appends the chunk and returns the accepted completion text so far.
+        """
+        if self._stopped:
+            return self._text
+
+        self._text += chunk
+        if self._boundary == InlineCompletionStopBoundary.Disabled:
+            return self._text
+
+        # first line is the continuation of the line at cursor, it is never cut
+        while True:
+            newline = self._text.find("\n", self._scan_offset)
+            if newline == -1:
+                break
+            line_start = newline + 1
+            line_end = self._text.find("\n", line_start)
+            line = self._text[line_start:] if line_end == -1 else self._text[line_start:line_end]
+
+            if line.strip() == "":
+                # indentation of a blank line is not known until it ends
+                if line_end == -1:
+                    break
+                self._previous_line_blank = True
+                self._scan_offset = line_start
+                continue
+
+            indent = _indent_width(line)
+            if indent < self._base_indent or (
+                self._boundary == InlineCompletionStopBoundary.EndOfBlock
+                and self._previous_line_blank
+                and indent <= self._base_indent
+            ):
+                self._text = self._text[:newline].rstrip()
+                self._stopped = True
+                break
+
+            self._previous_line_blank = False
+            self._scan_offset = line_start
+
+        return self._text
@@ -0,0 +1,149 @@
+# Copyright (c) Mehmet Bektas <mbektasgh@outlook.com>
+
+import concurrent.futures
+import logging
+import threading
+from typing import Coroutine, Union
+
+from lab_notebook_intelligence.api import CancelToken, SignalImpl
+
+log = logging.getLogger(__name__)
+
+
+class _FlightCancelToken(CancelToken):
+    def __init__(self):
+        super().__init__()
+        self._cancellation_signal = SignalImpl()
+
+    def cancel_request(self) -> None:
+        if self._cancellation_requested:
+            return
+        self._cancellation_requested = True
+        self._cancellation_signal.emit()
+
+
+class InlineCompletionFlight:
+    """
+    A single upstream inline completion call shared by all identical requests
+    that arrive while it is in flight.
+    """
+
+    def __init__(self):
+        self.cancel_token = _FlightCancelToken()
+        # resolves to the completion, or None if cancelled or failed
+        self.future: concurrent.futures.Future = concurrent.futures.Future()
+        self.editors: set[str] = set()
+
+
+class InlineCompletionSchedulerStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.upstream_calls = 0
+        self.coalesced = 0
+        self.superseded = 0
+
+    def increment(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    @property
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "upstream_calls": self.upstream_calls,
+                "coalesced": self.coalesced,
+                "superseded": self.superseded,
+            }
+
+
+scheduler_stats = InlineCompletionSchedulerStats()
+
+
+class InlineCompletionScheduler:
+    """
+    Per-connection scheduler for inline completion requests. A new request from an
+    editor supersedes (cancels) the upstream call of its previous request, and
+    identical requests in flight at the same time share one upstream call.
+
+    Client cancellation only detaches the request from its flight. The upstream call
+    keeps running until it is superseded, so that an identical follow-up request can
+    still join it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: dict[tuple, InlineCompletionFlight] = {}
+        self._editor_flight_keys: dict[str, tuple] = {}
+
+    def join(self, editor_key: str, flight_key: tuple) -> tuple[InlineCompletionFlight, bool]:
+        """
+        Attaches a request to the flight for the key. Returns the flight and whether
+        the caller is the leader that needs to start the upstream call.
+        """
+        superseded_flight = None
+        with self._lock:
+            scheduler_stats.increment("requests")
+            flight = self._flights.get(flight_key)
+            is_leader = flight is None
+            if is_leader:
+                flight = InlineCompletionFlight()
+                self._flights[flight_key] = flight
+                scheduler_stats.increment("upstream_calls")
+            else:
+                scheduler_stats.increment("coalesced")
+            flight.editors.add(editor_key)
+
+            previous_key = self._editor_flight_keys.get(editor_key)
+            self._editor_flight_keys[editor_key] = flight_key
+            if previous_key is not None and previous_key != flight_key:
+                previous_flight = self._flights.get(previous_key)
+                if previous_flight is not None:
+                    previous_flight.editors.discard(editor_key)
+                    if len(previous_flight.editors) == 0:
+                        del self._flights[previous_key]
+                        superseded_flight = previous_flight
+
+        if superseded_flight is not None:
+            scheduler_stats.increment("superseded")
+            superseded_flight.cancel_token.cancel_request()
+            self._resolve(superseded_flight, None)
+
+        return flight, is_leader
+
+    async def run(
+        self, flight_key: tuple, flight: InlineCompletionFlight, coro: Coroutine
+    ) -> Union[str, None]:
+        """
+        Runs the upstream call of the flight and resolves it with the result.
+        """
+        result = None
+        try:
+            result = await coro
+            return result
+        finally:
+            self.complete(flight_key, flight, result)
+
+    def complete(
+        self, flight_key: tuple, flight: InlineCompletionFlight, result: Union[str, None]
+    ) -> None:
+        with self._lock:
+            if self._flights.get(flight_key) is flight:
+                del self._flights[flight_key]
+        self._resolve(flight, None if flight.cancel_token.is_cancel_requested else result)
+
+    def cancel_all(self) -> None:
+        with self._lock:
+            flights = list(self._flights.values())
+            self._flights.clear()
+            self._editor_flight_keys.clear()
+        for flight in flights:
+            flight.cancel_token.cancel_request()
+            self._resolve(flight, None)
+
+    def _resolve(self, flight: InlineCompletionFlight, result: Union[str, None]) -> None:
+        try:
+            flight.future.set_result(result)
+        except concurrent.futures.InvalidStateError:
+            pass
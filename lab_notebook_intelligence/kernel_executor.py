@@ -0,0 +1,252 @@
+# Copyright (c) Mehmet Bektas <mbektasgh@outlook.com>
+
+import asyncio
+import inspect
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Callable, Union
+
+from lab_notebook_intelligence.document_reader import local_path
+
+log = logging.getLogger(__name__)
+
+DEFAULT_EXECUTION_TIMEOUT = 600
+# kernel connection is considered failed if it is not ready within this many seconds
+KERNEL_READY_TIMEOUT = 10
+
+
+class ExecutionStatus(str, Enum):
+    Ok = "ok"
+    Error = "error"
+    Aborted = "aborted"
+    Timeout = "timeout"
+
+
+@dataclass
+class ExecutionResult:
+    status: ExecutionStatus = ExecutionStatus.Ok
+    execution_count: int = None
+    # outputs in nbformat layout
+    outputs: list[dict] = field(default_factory=list)
+    duration: float = 0
+
+
+class _OutputCollector:
+    """
+    Builds nbformat outputs from the IOPub messages of an execution.
+    """
+
+    def __init__(self, on_output: Callable[[dict], None] = None):
+        self.outputs: list[dict] = []
+        self.execution_count: int = None
+        self._clear_on_next_output = False
+        self._on_output = on_output
+
+    def _add(self, output: dict) -> None:
+        if self._clear_on_next_output:
+            self.outputs = []
+            self._clear_on_next_output = False
+        last = self.outputs[-1] if len(self.outputs) > 0 else None
+        if (
+            output["output_type"] == "stream"
+            and last is not None
+            and last["output_type"] == "stream"
+            and last["name"] == output["name"]
+        ):
+            last["text"] += output["text"]
+        else:
+            self.outputs.append(output)
+        if self._on_output is not None:
+            try:
+                self._on_output(output)
+            except Exception as e:
+                log.debug(f"Execution output callback failed: {e}")
+
+    def handle_message(self, message: dict) -> None:
+        message_type = message["header"]["msg_type"]
+        content = message["content"]
+        if message_type == "stream":
+            self._add({"output_type": "stream", "name": content["name"], "text": content["text"]})
+        elif message_type in ("display_data", "execute_result"):
+            output = {
+                "output_type": message_type,
+                "data": content.get("data", {}),
+                "metadata": content.get("metadata", {}),
+            }
+            if message_type == "execute_result":
+                output["execution_count"] = content.get("execution_count")
+            self._add(output)
+        elif message_type == "error":
+            self._add(
+                {
+                    "output_type": "error",
+                    "ename": content.get("ename", ""),
+                    "evalue": content.get("evalue", ""),
+                    "traceback": content.get("traceback", []),
+                }
+            )
+        elif message_type == "clear_output":
+            if content.get("wait", False):
+                self._clear_on_next_output = True
+            else:
+                self.outputs = []
+        elif message_type == "execute_input":
+            self.execution_count = content.get("execution_count")
+
+
+class KernelExecutor:
+    """
+    Runs code on the kernel of a notebook from the server and waits for it to finish,
+    so that tools get the outputs of an execution as their result. The kernel is
+    looked up through the notebook's session and a separate client is connected to
+    it for each execution. Outputs are not written to the notebook, callers do that.
+    """
+
+    # seconds to wait for an execution to finish before interrupting the kernel
+    timeout = DEFAULT_EXECUTION_TIMEOUT
+
+    def __init__(self):
+        self._kernel_manager = None
+        self._session_manager = None
+        self._server_loop: asyncio.AbstractEventLoop = None
+        # executions are counted from the request loops and the server loop
+        self._lock = threading.Lock()
+        self._executions = 0
+        self._timeouts = 0
+        self._unavailable = 0
+
+    def configure(self, kernel_manager, session_manager) -> None:
+        self._kernel_manager = kernel_manager
+        self._session_manager = session_manager
+
+    def attach_server(self, server_loop: asyncio.AbstractEventLoop) -> None:
+        """
+        Sets the loop that owns the kernel manager, kernel clients are created on it.
+        """
+        self._server_loop = server_loop
+
+    def _increment(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    @property
+    def available(self) -> bool:
+        return (
+            self._kernel_manager is not None
+            and self._session_manager is not None
+            and self._server_loop is not None
+        )
+
+    async def _get_kernel(self, path: str):
+        try:
+            session = await self._session_manager.get_session(path=path)
+            return self._kernel_manager.get_kernel(session["kernel"]["id"])
+        except Exception as e:
+            log.debug(f"No running kernel found for '{path}': {e}")
+            return None
+
+    async def _interrupt(self, kernel) -> None:
+        try:
+            result = kernel.interrupt_kernel()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            log.error(f"Failed to interrupt kernel after execution timeout: {e}")
+
+    async def _execute(
+        self, path: str, code: str, timeout: float, on_output: Callable[[dict], None]
+    ) -> Union[ExecutionResult, None]:
+        kernel = await self._get_kernel(path)
+        if kernel is None:
+            return None
+
+        client = kernel.client()
+        client.start_channels()
+        collector = _OutputCollector(on_output)
+        start_time = time.monotonic()
+        try:
+            await client.wait_for_ready(timeout=KERNEL_READY_TIMEOUT)
+        except BaseException as e:
+            client.stop_channels()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            log.error(f"Failed to connect to kernel of '{path}': {e}")
+            return None
+
+        try:
+            reply = await client.execute_interactive(
+                code,
+                store_history=True,
+                allow_stdin=False,
+                timeout=timeout if timeout > 0 else None,
+                output_hook=collector.handle_message,
+            )
+            reply_content = reply["content"]
+            status = ExecutionStatus(reply_content.get("status", ExecutionStatus.Error))
+            execution_count = reply_content.get("execution_count", collector.execution_count)
+        except TimeoutError:
+            self._increment("_timeouts")
+            await self._interrupt(kernel)
+            status = ExecutionStatus.Timeout
+            execution_count = collector.execution_count
+        except asyncio.CancelledError:
+            # the request was cancelled, the code must not keep running on the kernel
+            await self._interrupt(kernel)
+            raise
+        finally:
+            client.stop_channels()
+
+        self._increment("_executions")
+        return ExecutionResult(
+            status=status,
+            execution_count=execution_count,
+            outputs=collector.outputs,
+            duration=time.monotonic() - start_time,
+        )
+
+    async def execute(
+        self,
+        path: str,
+        code: str,
+        timeout: float = None,
+        on_output: Callable[[dict], None] = None,
+    ) -> Union[ExecutionResult, None]:
+        """
+        Runs code on the kernel of the notebook at path. on_output is called with each
+        output as it arrives, on the server loop. Returns None if the notebook has no
+        running kernel that the server can connect to.
+        """
+        server_path = local_path(path)
+        if not self.available or server_path is None:
+            self._increment("_unavailable")
+            return None
+        timeout = KernelExecutor.timeout if timeout is None else timeout
+
+        try:
+            result = await asyncio.wrap_future(
+                asyncio.run_coroutine_threadsafe(
+                    self._execute(server_path, code, timeout, on_output), self._server_loop
+                )
+            )
+        except Exception as e:
+            log.error(f"Failed to execute code on kernel of '{path}': {e}")
+            result = None
+
+        if result is None:
+            self._increment("_unavailable")
+        return result
+
+    @property
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "executions": self._executions,
+                "timeouts": self._timeouts,
+                "unavailable": self._unavailable,
+            }
+
+
+kernel_executor = KernelExecutor()
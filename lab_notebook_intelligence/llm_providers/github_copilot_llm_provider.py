@@ -13,6 +13,8 @@ from lab_notebook_intelligence.api import (
     LLMProvider,
 )
 from lab_notebook_intelligence.github_copilot import (
+    acompletions,
+    ainline_completions,
     completions,
     generate_copilot_headers,
     inline_completions,
@@ -64,6 +66,16 @@ class GitHubCopilotChatModel(ChatModel):
     ) -> Any:
         return completions(self._model_id, messages, tools, response, cancel_token, options)
 
+    async def acompletions(
+        self,
+        messages: list[dict],
+        tools: list[dict] = None,
+        response: ChatResponse = None,
+        cancel_token: CancelToken = None,
+        options: dict = {},
+    ) -> Any:
+        return await acompletions(self._model_id, messages, tools, response, cancel_token, options)
+
 
 class GitHubCopilotInlineCompletionModel(InlineCompletionModel):
     def __init__(self, provider: LLMProvider, model_id: str, model_name: str):
@@ -91,9 +103,24 @@ class GitHubCopilotInlineCompletionModel(InlineCompletionModel):
         filename,
         context: CompletionContext,
         cancel_token: CancelToken,
+        options: dict = {},
     ) -> str:
         return inline_completions(
-            self._model_id, prefix, suffix, language, filename, context, cancel_token
+            self._model_id, prefix, suffix, language, filename, context, cancel_token, options
+        )
+
+    async def ainline_completions(
+        self,
+        prefix,
+        suffix,
+        language,
+        filename,
+        context: CompletionContext,
+        cancel_token: CancelToken,
+        options: dict = {},
+    ) -> str:
+        return await ainline_completions(
+            self._model_id, prefix, suffix, language, filename, context, cancel_token, options
         )
 
 
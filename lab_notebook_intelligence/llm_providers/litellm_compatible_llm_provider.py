@@ -6,6 +6,7 @@ from typing import Any
 import litellm
 
 from lab_notebook_intelligence.api import (
+    CancelScope,
     CancelToken,
     ChatModel,
     ChatResponse,
@@ -15,6 +16,15 @@ from lab_notebook_intelligence.api import (
     LLMProvider,
     LLMProviderProperty,
 )
+from lab_notebook_intelligence.prompt_cache import (
+    add_cache_control,
+    prompt_cache_stats,
+    supports_cache_control,
+)
+
+# responses of LiteLLM's aiohttp transport do not release their connection when a
+# stream is cancelled, httpx drops the connection right away
+litellm.disable_aiohttp_transport = True
 
 DEFAULT_CONTEXT_WINDOW = 4096
 
@@ -50,6 +60,11 @@ class LiteLLMCompatibleChatModel(ChatModel):
         except:
             return DEFAULT_CONTEXT_WINDOW
 
+    def _with_cache_hints(self, model_id: str, messages: list[dict], tools: list[dict]):
+        if supports_cache_control(model_id):
+            return add_cache_control(messages, tools)
+        return messages.copy(), tools
+
     def completions(
         self,
         messages: list[dict],
@@ -63,9 +78,10 @@ class LiteLLMCompatibleChatModel(ChatModel):
         base_url = self.get_property("base_url").value
         api_key_prop = self.get_property("api_key")
         api_key = api_key_prop.value if api_key_prop is not None else None
+        messages, tools = self._with_cache_hints(model_id, messages, tools)
         litellm_resp = litellm.completion(
             model=model_id,
-            messages=messages.copy(),
+            messages=messages,
             tools=tools,
             tool_choice=options.get("tool_choice", None),
             api_base=base_url,
@@ -75,6 +91,8 @@ class LiteLLMCompatibleChatModel(ChatModel):
 
         if stream:
             for chunk in litellm_resp:
+                if cancel_token is not None and cancel_token.is_cancel_requested:
+                    break
                 response.stream(
                     {
                         "choices": [
@@ -91,8 +109,56 @@ class LiteLLMCompatibleChatModel(ChatModel):
             return
         else:
             json_resp = json.loads(litellm_resp.model_dump_json())
+            prompt_cache_stats.record(json_resp)
             return json_resp
 
+    async def acompletions(
+        self,
+        messages: list[dict],
+        tools: list[dict] = None,
+        response: ChatResponse = None,
+        cancel_token: CancelToken = None,
+        options: dict = {},
+    ) -> Any:
+        stream = response is not None
+        model_id = self.get_property("model_id").value
+        base_url = self.get_property("base_url").value
+        api_key_prop = self.get_property("api_key")
+        api_key = api_key_prop.value if api_key_prop is not None else None
+        messages, tools = self._with_cache_hints(model_id, messages, tools)
+        async with CancelScope(cancel_token):
+            litellm_resp = await litellm.acompletion(
+                model=model_id,
+                messages=messages,
+                tools=tools,
+                tool_choice=options.get("tool_choice", None),
+                api_base=base_url,
+                api_key=api_key,
+                stream=stream,
+            )
+
+            if not stream:
+                json_resp = json.loads(litellm_resp.model_dump_json())
+                prompt_cache_stats.record(json_resp)
+                return json_resp
+
+            async for chunk in litellm_resp:
+                response.stream(
+                    {
+                        "choices": [
+                            {
+                                "delta": {
+                                    "role": chunk.choices[0].delta.role,
+                                    "content": chunk.choices[0].delta.content,
+                                }
+                            }
+                        ]
+                    }
+                )
+
+        if stream:
+            response.finish()
+
 
 class LiteLLMCompatibleInlineCompletionModel(InlineCompletionModel):
     def __init__(self, provider: "LiteLLMCompatibleLLMProvider"):
@@ -133,6 +199,7 @@ class LiteLLMCompatibleInlineCompletionModel(InlineCompletionModel):
         filename,
         context: CompletionContext,
         cancel_token: CancelToken,
+        options: dict = {},
     ) -> str:
         model_id = self.get_property("model_id").value
         base_url = self.get_property("base_url").value
@@ -149,6 +216,31 @@ class LiteLLMCompatibleInlineCompletionModel(InlineCompletionModel):
 
         return litellm_resp.choices[0].message.content
 
+    async def ainline_completions(
+        self,
+        prefix,
+        suffix,
+        language,
+        filename,
+        context: CompletionContext,
+        cancel_token: CancelToken,
+        options: dict = {},
+    ) -> str:
+        model_id = self.get_property("model_id").value
+        base_url = self.get_property("base_url").value
+        api_key_prop = self.get_property("api_key")
+        api_key = api_key_prop.value if api_key_prop is not None else None
+        litellm_resp = await litellm.acompletion(
+            model=model_id,
+            prompt=prefix,
+            suffix=suffix,
+            stream=False,
+            api_base=base_url,
+            api_key=api_key,
+        )
+
+        return litellm_resp.choices[0].message.content
+
 
 class LiteLLMCompatibleLLMProvider(LLMProvider):
     def __init__(self):
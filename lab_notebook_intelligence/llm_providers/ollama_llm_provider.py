@@ -2,11 +2,13 @@
 
 import json
 import logging
+import os
 from typing import Any
 
 import ollama
 
 from lab_notebook_intelligence.api import (
+    CancelScope,
     CancelToken,
     ChatModel,
     ChatResponse,
@@ -15,6 +17,8 @@ from lab_notebook_intelligence.api import (
     InlineCompletionModel,
     LLMProvider,
 )
+from lab_notebook_intelligence.prompt_cache import OLLAMA_KEEP_ALIVE
+from lab_notebook_intelligence.request_runtime import LoopBoundClients
 from lab_notebook_intelligence.util import extract_llm_generated_code
 
 log = logging.getLogger(__name__)
@@ -26,6 +30,13 @@ CODELLAMA_INLINE_COMPL_PROMPT = """<PRE> {prefix} <SUF>{suffix} <MID>"""
 STARCODER_INLINE_COMPL_PROMPT = """<fim_prefix>{prefix}<fim_suffix>{suffix}<fim_middle>"""
 CODESTRAL_INLINE_COMPL_PROMPT = """[SUFFIX]{suffix}[PREFIX]{prefix}"""
 
+_async_clients = LoopBoundClients(ollama.AsyncClient, lambda client: client.close())
+
+
+def _async_client() -> ollama.AsyncClient:
+    # the client connects to OLLAMA_HOST
+    return _async_clients.get(host=os.environ.get("OLLAMA_HOST"))
+
 
 class OllamaChatModel(ChatModel):
     def __init__(self, provider: LLMProvider, model_id: str, model_name: str, context_window: int):
@@ -59,6 +70,7 @@ class OllamaChatModel(ChatModel):
             "model": self._model_id,
             "messages": messages.copy(),
             "stream": stream,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
         }
         if tools is not None and len(tools) > 0:
             completion_args["tools"] = tools
@@ -67,6 +79,8 @@ class OllamaChatModel(ChatModel):
 
         if stream:
             for chunk in ollama_response:
+                if cancel_token is not None and cancel_token.is_cancel_requested:
+                    break
                 response.stream(
                     {
                         "choices": [
@@ -86,6 +100,49 @@ class OllamaChatModel(ChatModel):
 
             return {"choices": [{"message": json_resp["message"]}]}
 
+    async def acompletions(
+        self,
+        messages: list[dict],
+        tools: list[dict] = None,
+        response: ChatResponse = None,
+        cancel_token: CancelToken = None,
+        options: dict = {},
+    ) -> Any:
+        stream = response is not None
+        completion_args = {
+            "model": self._model_id,
+            "messages": messages.copy(),
+            "stream": stream,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
+        }
+        if tools is not None and len(tools) > 0:
+            completion_args["tools"] = tools
+
+        async with CancelScope(cancel_token):
+            ollama_response = await _async_client().chat(**completion_args)
+
+            if not stream:
+                json_resp = json.loads(ollama_response.model_dump_json())
+
+                return {"choices": [{"message": json_resp["message"]}]}
+
+            async for chunk in ollama_response:
+                response.stream(
+                    {
+                        "choices": [
+                            {
+                                "delta": {
+                                    "role": chunk["message"]["role"],
+                                    "content": chunk["message"]["content"],
+                                }
+                            }
+                        ]
+                    }
+                )
+
+        if stream:
+            response.finish()
+
 
 class OllamaInlineCompletionModel(InlineCompletionModel):
     def __init__(
@@ -114,6 +171,32 @@ class OllamaInlineCompletionModel(InlineCompletionModel):
     def context_window(self) -> int:
         return self._context_window
 
+    def _generate_args(self, prefix, suffix) -> dict:
+        has_suffix = suffix.strip() != ""
+        if has_suffix:
+            prompt = self._prompt_template.format(prefix=prefix, suffix=suffix.strip())
+        else:
+            prompt = prefix
+
+        return {
+            "model": self._model_id,
+            "prompt": prompt,
+            "raw": True,
+            "options": {
+                "num_predict": 128,
+                "temperature": 0,
+                "stop": [
+                    "<|end▁of▁sentence|>",
+                    "<｜end▁of▁sentence｜>",
+                    "<|EOT|>",
+                    "<EOT>",
+                    "\\n",
+                    "</s>",
+                    "<|eot_id|>",
+                ],
+            },
+        }
+
     def inline_completions(
         self,
         prefix,
@@ -122,34 +205,30 @@ class OllamaInlineCompletionModel(InlineCompletionModel):
         filename,
         context: CompletionContext,
         cancel_token: CancelToken,
+        options: dict = {},
     ) -> str:
-        has_suffix = suffix.strip() != ""
-        if has_suffix:
-            prompt = self._prompt_template.format(prefix=prefix, suffix=suffix.strip())
-        else:
-            prompt = prefix
+        try:
+            ollama_response = ollama.generate(**self._generate_args(prefix, suffix))
+            code = ollama_response.response
+            code = extract_llm_generated_code(code)
 
+            return code
+        except Exception as e:
+            log.error(f"Error occurred while generating using completions ollama: {e}")
+            return ""
+
+    async def ainline_completions(
+        self,
+        prefix,
+        suffix,
+        language,
+        filename,
+        context: CompletionContext,
+        cancel_token: CancelToken,
+        options: dict = {},
+    ) -> str:
         try:
-            generate_args = {
-                "model": self._model_id,
-                "prompt": prompt,
-                "raw": True,
-                "options": {
-                    "num_predict": 128,
-                    "temperature": 0,
-                    "stop": [
-                        "<|end▁of▁sentence|>",
-                        "<｜end▁of▁sentence｜>",
-                        "<|EOT|>",
-                        "<EOT>",
-                        "\\n",
-                        "</s>",
-                        "<|eot_id|>",
-                    ],
-                },
-            }
-
-            ollama_response = ollama.generate(**generate_args)
+            ollama_response = await _async_client().generate(**self._generate_args(prefix, suffix))
             code = ollama_response.response
             code = extract_llm_generated_code(code)
 
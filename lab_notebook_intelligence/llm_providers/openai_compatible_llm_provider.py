@@ -3,9 +3,10 @@
 import json
 from typing import Any
 
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 from lab_notebook_intelligence.api import (
+    CancelScope,
     CancelToken,
     ChatModel,
     ChatResponse,
@@ -15,9 +16,13 @@ from lab_notebook_intelligence.api import (
     LLMProvider,
     LLMProviderProperty,
 )
+from lab_notebook_intelligence.prompt_cache import prompt_cache_stats
+from lab_notebook_intelligence.request_runtime import LoopBoundClients
 
 DEFAULT_CONTEXT_WINDOW = 4096
 
+_async_clients = LoopBoundClients(AsyncOpenAI, lambda client: client.close())
+
 
 class OpenAICompatibleChatModel(ChatModel):
     def __init__(self, provider: "OpenAICompatibleLLMProvider"):
@@ -76,6 +81,8 @@ class OpenAICompatibleChatModel(ChatModel):
 
         if stream:
             for chunk in resp:
+                if cancel_token is not None and cancel_token.is_cancel_requested:
+                    break
                 response.stream(
                     {
                         "choices": [
@@ -92,8 +99,57 @@ class OpenAICompatibleChatModel(ChatModel):
             return
         else:
             json_resp = json.loads(resp.model_dump_json())
+            prompt_cache_stats.record(json_resp)
             return json_resp
 
+    async def acompletions(
+        self,
+        messages: list[dict],
+        tools: list[dict] = None,
+        response: ChatResponse = None,
+        cancel_token: CancelToken = None,
+        options: dict = {},
+    ) -> Any:
+        stream = response is not None
+        model_id = self.get_property("model_id").value
+        base_url_prop = self.get_property("base_url")
+        base_url = base_url_prop.value if base_url_prop is not None else None
+        base_url = base_url if base_url.strip() != "" else None
+        api_key = self.get_property("api_key").value
+
+        client = _async_clients.get(base_url=base_url, api_key=api_key)
+        # cancellation aborts the request, which drops its connection from the pool
+        async with CancelScope(cancel_token):
+            resp = await client.chat.completions.create(
+                model=model_id,
+                messages=messages.copy(),
+                tools=tools,
+                tool_choice=options.get("tool_choice", None),
+                stream=stream,
+            )
+
+            if not stream:
+                json_resp = json.loads(resp.model_dump_json())
+                prompt_cache_stats.record(json_resp)
+                return json_resp
+
+            async for chunk in resp:
+                response.stream(
+                    {
+                        "choices": [
+                            {
+                                "delta": {
+                                    "role": chunk.choices[0].delta.role,
+                                    "content": chunk.choices[0].delta.content,
+                                }
+                            }
+                        ]
+                    }
+                )
+
+        if stream:
+            response.finish()
+
 
 class OpenAICompatibleInlineCompletionModel(InlineCompletionModel):
     def __init__(self, provider: "OpenAICompatibleLLMProvider"):
@@ -134,6 +190,7 @@ class OpenAICompatibleInlineCompletionModel(InlineCompletionModel):
         filename,
         context: CompletionContext,
         cancel_token: CancelToken,
+        options: dict = {},
     ) -> str:
         model_id = self.get_property("model_id").value
         base_url_prop = self.get_property("base_url")
@@ -151,6 +208,32 @@ class OpenAICompatibleInlineCompletionModel(InlineCompletionModel):
 
         return resp.choices[0].text
 
+    async def ainline_completions(
+        self,
+        prefix,
+        suffix,
+        language,
+        filename,
+        context: CompletionContext,
+        cancel_token: CancelToken,
+        options: dict = {},
+    ) -> str:
+        model_id = self.get_property("model_id").value
+        base_url_prop = self.get_property("base_url")
+        base_url = base_url_prop.value if base_url_prop is not None else None
+        base_url = base_url if base_url.strip() != "" else None
+        api_key = self.get_property("api_key").value
+
+        client = _async_clients.get(base_url=base_url, api_key=api_key)
+        resp = await client.completions.create(
+            model=model_id,
+            prompt=prefix,
+            suffix=suffix,
+            stream=False,
+        )
+
+        return resp.choices[0].text
+
 
 class OpenAICompatibleLLMProvider(LLMProvider):
     def __init__(self):
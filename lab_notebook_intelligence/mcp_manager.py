@@ -1,17 +1,25 @@
 # Copyright (c) Mehmet Bektas <mbektasgh@outlook.com>
 
 import asyncio
+import concurrent.futures
+import hashlib
 import json
 import logging
+import os
 import threading
+import time
 from dataclasses import dataclass
+from enum import Enum
 from typing import Any, Union
 
 from fastmcp import Client
 from fastmcp.client import StdioTransport, StreamableHttpTransport
+from fastmcp.exceptions import ToolError
 from mcp import StdioServerParameters
 from mcp.client.stdio import get_default_environment as mcp_get_default_environment
 from mcp.types import ImageContent, TextContent
+from mcp.types import Tool as MCPToolDefinition
+from mcp.types import ToolListChangedNotification
 
 from lab_notebook_intelligence.api import (
     ChatCommand,
@@ -22,27 +30,99 @@ from lab_notebook_intelligence.api import (
     MarkdownData,
     MCPServer,
     ProgressData,
+    SignalImpl,
     Tool,
     ToolPreInvokeResponse,
+    ToolRegistry,
 )
 from lab_notebook_intelligence.base_chat_participant import BaseChatParticipant
+from lab_notebook_intelligence.mcp_tool_result_cache import (
+    DEFAULT_RESULT_CACHE_MAX_ENTRIES,
+    MCPToolResultCache,
+)
+from lab_notebook_intelligence.request_runtime import EventLoopThread
 
 log = logging.getLogger(__name__)
 
 MCP_ICON_SRC = "iVBORw0KGgoAAAANSUhEUgAAAMgAAADICAIAAAAiOjnJAAAPBUlEQVR4nOydf2wT5f/AW7pZGLOjE7K5DAfWIYMWM7rpWJTZkCxEh4hdcGKahYhkYRojGPQfUnCJMRpDlpD5hyEknZlWY2AL2UaiDubYLFkDzsE2CBlBrc5ldGm6VLjdnm++6Sf77DO758fdPb279v36kzz3ft73vhfPdffjfRkIIQMAKM0ytRMAUhMQC+ACiAVwAcQCuABiAVwAsQAugFgAF0AsgAsgFsAFEAvgAogFcAHEArgAYgFcALEALoBYABdALIALIBbABRAL4AKIBXABxAK4kKF2Anrlt99+6+vru3r16s2bN+/cuTM1NRWJRGZnZ1esWGGxWPLy8mw22+bNm8vLy7dt27Zy5Uq18002RnhLh4mhoaGvvvqqo6Pjxo0blJuYzebKykq32/3qq6+uXr2ac4KaAQEUiKL4zTffVFRUyCm12Wyur6+/du2a2nuTDEAsMu3t7Xa7Xan/ySaTae/evbdu3VJ7t/gCYuG4e/duTU2NUkotJCsry+v1CoKg9i7yAsRaEr/fb7VaeVg1zzPPPDM+Pq72jnIBxEqAKIoffPABV6XmWbVqVU9Pj9p7rDwg1mIEQairq0uOVXFMJlNbW5va+60wINb/cP/+/d27dyfTqlR1C8T6L2pZNe/W2bNn1a6BYsAF0v/w4MGDvXv3tre3q5hDdnb25cuXt2zZomIOSgFiGeRYZbVan3/++a1bt27YsCE3NzcjI0MQhD/++OP69es///xzIBAQBIEpYHFxcTAYfPjhh1kz0RxqL5nqI+EMaDQa3W53V1cX/kJUOBw+derUxo0bmYIfOnQoiXvPi3QXS4JVLpdraGiIfgpBEHw+X35+Pr21vb29PHc6GaS1WKxWmc3mU6dOSZtrenra7XZTTuRwOERRVHp3k0r6isVqldVq7evrkznpsWPHKKfz+/0K7ag6pKlYEqwKBoOKTH38+HGaGe12uyLTqUU6iqWiVXEaGhpo5tX1rZ60E0t1qxBCsVhs06ZNxKk9Ho+y8yaT9BJLC1bFGRgYMBqN+NktFkssFuMxexJII7G0Y1Wc2tpaYg4XLlzglwBX0uUtHdZr61ar9fvvv9+6dSu/lN5//33imJ6eHn4JcCUt3tLhbdXc3NyPP/7Y29sbDofXr1//8ssvP/7448StysrKHA7Hr7/+ihkzMDBAmYPmUHvJ5A7vM+CtW7fKy8sXRjCZTI2Njffv3ydu6/V6icnI23vVSHGxeFs1NjZWUFCQMFRdXR1x8wsXLhBTmpyclFcDdUhlsVS0Ks63336LjzA5OUnM6pdffpFdCRVIWbFUt8pgMOzatYsYZ/ny5fggOr1MmppiacEqg8FQWFhIDEWMc/78eXnFUIcUvNzA+2/AmzdvulyuUChEHDk3N6fIGD2SamJpxyqDwUDzkHEkEsEPWLFiBWVu2kLtJVNJNHIGnOe7777DB5yYmCAGuXr1quzCqEDqXCDV1FplMBh27979yiuv4McMDw8T42RmZg4ODobD4QcPHsQfNszNzS0oKKB/JFUd1DZbGbS2VlVVVUWjUWJY4gVSDBaLZfv27UePHu3s7NTgvepUEEunViGESktLJUm1GIvF8vrrr2vqwoTuxdKvVcFgUJJFODZt2nTmzBktNLHRt1j6tQoh5PF4JMlDprS09NKlS1KLqgw6FkvXVgUCAZPJJEkbWt54443p6Wmp1ZWLXsXStVWCIDgcDkm2sFFcXKzWrUZdiqVrqxBCjY2NkjyRgsViUaXXiP7E0rtVH3/8sSRDpKNKjySdiaV3qz755BNJbsgl+W7pSSywSg4mk+ncuXOSCi8F3YiV5lZlZ2c/9thjhYWFFotFThCmdiZy0IdY6WmV0+lsamq6dOnS1NTUwmhTU1M9PT1er/epp55ijblhw4ZIJMJSe4noQKx0s8poNHo8HsqlJRAI1NbWMl0SS07/La2LlW5WlZeXS/gmSiAQoL8wlpz+W5oWK92sOnz4sOTbfLFY7ODBg5QTlZaW8u6/pV2x0soqo9HY0tIiqU7/w4cffkg5I+/+WxoVK92sOn36tKQ6JYDSLYfDodSMCdGiWGCVTCjPifIbFGLQnFhglXwo+2/V19crPvU82hILrFKKvr4+Yv+tnJwcmgYT0tCQWGCVstD03/rhhx84za4VscAqxbl8+TIxk2PHjnGaXRNigVUY4p+j3rFjR35+fkFBQXV1Nf3zVU888QQ+merqavpMmFBfLLAKQzQafeGFF/4dp7a2lubnEfFznvn5+fTJMKGyWGAVhmg0WlVVtVS0t956ixihs7OTmBWn5+LVFAuswoC3Kh6Q+Cl8mve2b9y4QZ8VPaqJBVZhIFoV5+TJk/g4oihmZmbig3C6TKqOWGAVBkqrDAbDkSNHiNGIH+Ln9P60CmKBVRjorTIYDCdOnCAGfOSRR/BBUkQssAoDk1U0ToiiSHwGMBVOhWAVBlarKioqiDHv3r1LjKP7H+9gFQZWq4qKisbHx4lhz58/TwzF6RH4JIkFVmHgZBVC6OjRo/hQ+r5AClZh4GcVQqi4uBgfbefOnfSpMsFdLLAKA1er+vv7iQG9Xi99tkzwFQuswsDVKoRQwpuMi+DXRoujWGAVBt5W9fb2EmPm5OTw6/3HSyywCgNvq6LR6JNPPkkMe+DAAfqYrHARC6zCwNsqhND+/ftpIvf39zOFZUJ5sQRB2LNnD33hWK0aHx8HqzBQtvguKytjCsuK8mIx9S5ntWpqaqqoqIg+Pli1FLy//aSwWNPT01lZWZT7xmqVIAgul4v+wIBVS8F7uVJerO7ubsp9k/CN+BMnTtAfGLBqKUwmE9dfV3EUFuvMmTM0+ybBqmvXrtE36wGrMLz99ttMwaWhwoolwSpBEMrKyigLB1Zh2LhxI1NxJKOwWJFIJCcnB7NjEqxCCPl8PsrCgVUYLBYLp4dk/o3yfxVi2k1Ls0oQBJvNRlM4sAqDyWTq7Oxkii8HLtex9u3b9+8dy8vLk2AVQujs2bM0hausrASrliJ12nH7fD6n0xnvS5GXl3fo0KFQKCQt1I4dO4iFKywsnJiYoI8JVvGG79MNsVgsHA7LiRAKhWj+GOzq6qKPCVYlAfVfscfT0tJCrJ3b7aYPCFYlB62LVVNTQ6zdyMgIZTSwKmloWixRFFetWoUvH32/FLAqmWharJGREWIFfT4fTSiwKsloWqxz584Ri0jzxyBYlXw0LdZnn32GL6LNZiMG+fTTT+mPClilFJoW68iRI/g6vvjii/gIXV1dxB6v84BVCqJpsYj9yg8ePIiP4HQ6KY8KWKUsmharvr4eX83GxkbM5jSdC+KAVYqjabGILwU0NDRgNqd5BQqs4oSmxXrnnXfwNa2trcVsPjw8TDwqYBUnNC1WU1MTvqxbtmzBbC6KYn5+PmZzsIofmhbryy+/xFc2MzNzZmYGE+HkyZNglSpoWqwrV64Q69vd3Y2JIIpiXV1dwqMCVnFF02LNzMwQm/7u378fH0QQhObm5oXnRKfTyfQNGbBKApoWCyFUUVGBr3J2dva9e/eIcURRHB0dvXLlCuvzhmCVNLQuFk3R+X1pCKySjNbFCgaDxHJnZWXdvn1b8anBKjloXSyEEM3HQquqqpRt9QRWyUQHYmEuGSzk3XffVWpGsEo+OhDr3r17+Jdg51Gko2YkEgGr5KMDsZiOxOHDh+WcE0Oh0NNPPw1WyUcfYk1PT+Nvzixk+/btxO+tJaS9vZ1+FrAKjz7EYmrfEP878b333qN/hXVoaIipCyFYRUQ3YiGEdu3axXTss7KyPB5PR0fHUq/eh0KhL774wuVy0T9lClZRYvx/uXTC33//7XQ6f//9d9YNMzMzS0pKbDbbmjVrMjIyYrHYn3/+OTo6eufOHQlpFBUVXbx4cd26dfSbHD9+nL5rnMlkam1tfe211yTkpiHUNpuN/v7+5cuXq1guWKso0ZlYCCG/30/f2k9ZwCp69CcWQqitrS35boFVTOhSrPi6lcxzYnFxMVjFhF7FQggNDAwUFhby1Ok/VFdXszZjSnOr9C0WQmhiYoLYjkYOZrP5o48+EkWRKSuwSvdixWlra1uzZo3iVj377LPDw8OsyYBVcVJBrPjzCF6v12q1KqKU3W73+/2sCxVYtZAUEStONBptbm622+3SfDIajTU1NR0dHRKUAqsWkVJizRMMBpuamiorK81mM/EYW63WPXv2tLS0/PXXX5JnBKsWoadbOhL4559/RkdHr1+/HgqFJiYmZmZmYrHYypUrLRbLo48+un79+s2bN69bt27ZsmVyZknHOzZE1DZb98BalRAQSxZg1VKAWNIBqzCAWBIBq/CAWFIAq4iAWMyAVTSAWGyAVZSAWAyAVfSAWLSAVUyAWFSAVayAWGTAKgmAWAQoW5KAVYtI8ZvQMvnpp59cLpcoijSD0+XuMh0g1pLMzs7a7faxsTGawWDVImQ9LpLanD59GqySDKxYS1JSUjI6OkocBlYlBFasxIyMjIBVcgCxEnPx4kXiGLAKA4iVGOLnqMEqPCBWYiYnJ/ED3G43WIUBxErM3NwcfsDq1auTlYsuAbESk5ubix/g8/kGBgaSlY7+ALESY7PZ8AOi0ejOnTvBraUAsRLz3HPPEcdEIhFwayngAmli5ubm1q5dGwqFiCMtFkt3d/e2bduSkpdugBUrMcuWLXvzzTdpRsK6lRBYsZYkHA7bbLZwOEwzGNatRcCKtSRWq7W5uZlyMKxbiwCxcHg8ngMHDlAOBrcWAqdCArOzsx6P5+uvv6YcD+fEOLBiEcjIyGhtbU34KfyEwLoVB8QiA25JAMSiAtxiBX5jMSDh91ZfX5/D4eCclxYBsdhgdcvpdA4ODnJOSovAqZAN1nNiMBgEsQAqWN0KBAKcM9IiIJYUmNwSBIF/RpoDxJIIvVslJSVJyUhbwI93WRB/yxcUFNy+fVvdr8KqAqxYssCvW0aj8fPPP09Dq0AsBYi71dDQsOjfs7OzW1tbX3rpJZXyUhk4FSrG4OCg3+8fGxt76KGHysvL9+3bt3btWrWTUg0QC+ACnAoBLoBYABdALIALIBbABRAL4AKIBXABxAK4AGIBXACxAC6AWAAXQCyACyAWwAUQC+ACiAVwAcQCuABiAVz4vwAAAP//b8cbMGXTzMEAAAAASUVORK5CYII="
 MCP_ICON_URL = f"data:image/png;base64,{MCP_ICON_SRC}"
+# default deadline of a tool call, including waiting for a session and a call slot
 MCP_TOOL_TIMEOUT = 60
+# default number of tool calls in flight per server, others wait for a slot
+MCP_MAX_CONCURRENT_CALLS = 8
+# consecutive failed calls that open a server's circuit, failing calls fast
+MCP_CIRCUIT_FAILURE_THRESHOLD = 5
+# time an open circuit waits before letting a trial call through
+MCP_CIRCUIT_COOLDOWN = 30
 WHITELISTED_MCP_TOOLS = {"SearchQBraid"}
+MCP_CONNECT_TIMEOUT = 60
+MCP_CLOSE_TIMEOUT = 5
+MCP_PING_TIMEOUT = 10
+MCP_KEEPALIVE_INTERVAL = 30
+MCP_RECONNECT_BASE_DELAY = 1
+MCP_RECONNECT_MAX_DELAY = 60
+# sessions kept open per HTTP server, stdio servers use a single session (process)
+MCP_HTTP_POOL_SIZE = 4
+# extra pooled sessions idle for this long are closed
+MCP_SESSION_IDLE_TIMEOUT = 300
+# servers started with `npx -y` etc. may need to download packages first
+MCP_DISCOVERY_TIMEOUT = 120
+# servers often send tool list changes in bursts, they are refreshed once per delay
+MCP_TOOL_LIST_REFRESH_DELAY = 0.5
+
+_mcp_event_loop: EventLoopThread = None
+_mcp_event_loop_lock = threading.Lock()
+
+
+def get_mcp_event_loop() -> EventLoopThread:
+    """
+    Returns the event loop that owns all MCP client sessions.
+    """
+    global _mcp_event_loop
+    with _mcp_event_loop_lock:
+        if _mcp_event_loop is None or not _mcp_event_loop.is_running:
+            _mcp_event_loop = EventLoopThread("nbi-mcp")
+            _mcp_event_loop.start()
+        return _mcp_event_loop
+
+
+def stop_mcp_event_loop(timeout: float = MCP_CLOSE_TIMEOUT) -> None:
+    global _mcp_event_loop
+    with _mcp_event_loop_lock:
+        loop_thread = _mcp_event_loop
+        _mcp_event_loop = None
+    if loop_thread is not None:
+        loop_thread.stop(timeout)
+
+
+async def _run_on_mcp_event_loop(coro):
+    loop_thread = get_mcp_event_loop()
+    try:
+        running_loop = asyncio.get_running_loop()
+    except RuntimeError:
+        running_loop = None
+    if running_loop is loop_thread.loop:
+        return await coro
+    return await asyncio.wrap_future(loop_thread.submit(coro))
 
 
 class MCPTool(Tool):
-    def __init__(self, server: "MCPServer", name, description, schema, auto_approve=False):
+    def __init__(
+        self,
+        server: "MCPServer",
+        name,
+        description,
+        schema,
+        auto_approve=False,
+        concurrency_safe=False,
+    ):
         super().__init__()
         self._server = server
         self._name = name
         self._description = description
         self._schema = schema
         self._auto_approve = auto_approve or self._name in WHITELISTED_MCP_TOOLS
+        self._concurrency_safe = concurrency_safe
 
     @property
     def name(self) -> str:
@@ -72,6 +152,10 @@ class MCPTool(Tool):
             },
         }
 
+    @property
+    def concurrency_safe(self) -> bool:
+        return self._concurrency_safe
+
     def pre_invoke(
         self, request: ChatRequest, tool_args: dict
     ) -> Union[ToolPreInvokeResponse, None]:
@@ -119,12 +203,168 @@ class MCPTool(Tool):
                         return "success"
             elif type(result) is dict:
                 return result
+            elif result is None:
+                return (
+                    f"Error! Failed to call MCP tool '{self.name}' on server '{self._server.name}'"
+                )
             else:
                 return f"Error! Invalid tool result: {result}"
         except Exception as e:
             return f"Error occurred while calling MCP tool: {str(e)}"
 
 
+class _MCPSession:
+    """
+    A connected MCP client. The connection is opened and closed in the session's
+    own task, since transports need to be entered and exited in the same task.
+    """
+
+    def __init__(self, client: Client):
+        self.client = client
+        self.active_calls = 0
+        self.last_used = time.monotonic()
+        self._connected = False
+        self._ready: asyncio.Future = None
+        self._closing: asyncio.Event = None
+        self._task: asyncio.Task = None
+
+    @property
+    def connected(self) -> bool:
+        return self._connected
+
+    async def open(self, timeout: float) -> None:
+        self._ready = asyncio.get_running_loop().create_future()
+        self._closing = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(asyncio.shield(self._ready), timeout)
+        except BaseException:
+            await self.close()
+            raise
+
+    async def _run(self) -> None:
+        try:
+            async with self.client:
+                self._connected = True
+                self._ready.set_result(None)
+                await self._closing.wait()
+        except Exception as e:
+            if not self._ready.done():
+                self._ready.set_exception(e)
+            else:
+                log.debug(f"MCP session closed with error: {e}")
+        finally:
+            self._connected = False
+            if not self._ready.done():
+                self._ready.set_exception(ConnectionError("MCP session closed"))
+            # exception is retrieved by open(), unless it was not waiting anymore
+            if self._ready.done() and not self._ready.cancelled():
+                self._ready.exception()
+
+    async def ping(self) -> bool:
+        try:
+            await asyncio.wait_for(self.client.ping(), MCP_PING_TIMEOUT)
+            return True
+        except Exception:
+            return False
+
+    async def close(self) -> None:
+        self._connected = False
+        if self._closing is not None:
+            self._closing.set()
+        if self._task is not None and not self._task.done():
+            try:
+                await asyncio.wait_for(self._task, MCP_CLOSE_TIMEOUT)
+            except Exception as e:
+                log.debug(f"Failed to close MCP session cleanly: {e}")
+
+
+class CircuitState(str, Enum):
+    Closed = "closed"
+    Open = "open"
+    HalfOpen = "half-open"
+
+
+class _CircuitBreaker:
+    """
+    Fails calls fast after repeated failures. Once the cool-down passes, a single
+    trial call is let through and its outcome closes or reopens the circuit.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = MCP_CIRCUIT_FAILURE_THRESHOLD,
+        cooldown: float = MCP_CIRCUIT_COOLDOWN,
+    ):
+        self._failure_threshold = failure_threshold
+        self._cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: float = None
+        self._trial_started_at: float = None
+
+    @property
+    def state(self) -> CircuitState:
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def _state(self, now: float) -> CircuitState:
+        if self._opened_at is None:
+            return CircuitState.Closed
+        if now - self._opened_at < self._cooldown:
+            return CircuitState.Open
+        return CircuitState.HalfOpen
+
+    @property
+    def retry_in(self) -> float:
+        with self._lock:
+            if self._opened_at is None:
+                return 0
+            return max(self._opened_at + self._cooldown - time.monotonic(), 0)
+
+    def allow_call(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            state = self._state(now)
+            if state == CircuitState.Closed:
+                return True
+            if state == CircuitState.Open:
+                return False
+            # a trial call that never reported back does not block the circuit forever
+            if self._trial_started_at is not None and now - self._trial_started_at < self._cooldown:
+                return False
+            self._trial_started_at = now
+            return True
+
+    def record_success(self) -> bool:
+        """
+        Returns whether the circuit state changed.
+        """
+        with self._lock:
+            changed = self._opened_at is not None
+            self._failures = 0
+            self._opened_at = None
+            self._trial_started_at = None
+            return changed
+
+    def record_failure(self) -> bool:
+        """
+        Returns whether the circuit state changed.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._failures += 1
+            self._trial_started_at = None
+            if self._opened_at is not None:
+                # failed trial call, wait for another cool-down
+                self._opened_at = now
+                return False
+            if self._failures >= self._failure_threshold:
+                self._opened_at = now
+                return True
+            return False
+
+
 @dataclass
 class StreamableHttpServerParameters:
     url: str
@@ -138,15 +378,40 @@ class MCPServerImpl(MCPServer):
         stdio_params: StdioServerParameters = None,
         streamable_http_params: StreamableHttpServerParameters = None,
         auto_approve_tools: list[str] = [],
+        config_hash: str = None,
+        result_cache_config: dict = None,
+        call_config: dict = None,
     ):
         self._name: str = name
+        self._config_hash = config_hash
+        # cacheTtl, maxEntries and per tool overrides in toolCache, see create_mcp_server
+        self._result_cache_config: dict = result_cache_config or {}
+        self._result_caches: dict[str, MCPToolResultCache] = {}
+        # timeout, toolTimeouts and maxConcurrentCalls, see create_mcp_server
+        self._call_config: dict = call_config or {}
+        self._call_semaphore: asyncio.Semaphore = None
+        self._circuit_breaker = _CircuitBreaker()
         self._stdio_params: StdioServerParameters = stdio_params
         self._streamable_http_params: StreamableHttpServerParameters = streamable_http_params
         self._auto_approve_tools: set[str] = set(auto_approve_tools)
         self._tried_to_get_tool_list = False
         self._mcp_tools = []
-        self._session = None
-        self._client = None
+        self._tools: list[MCPTool] = []
+        self._tools_by_name: dict[str, MCPTool] = {}
+        self._tools_version = 0
+        # sessions are only used on the MCP event loop
+        self._sessions: list[_MCPSession] = []
+        self._max_sessions = 1 if stdio_params is not None else MCP_HTTP_POOL_SIZE
+        self._session_lock: asyncio.Lock = None
+        self._connect_failures = 0
+        self._next_connect_time = 0
+        self._keepalive_task: asyncio.Task = None
+        self._tool_list_refresh_task: asyncio.Task = None
+        self._closed = False
+        # emitted with the server when it notifies that its tool list changed
+        self.tool_list_changed_signal = SignalImpl()
+        # emitted with the server when its circuit opens or closes
+        self.circuit_state_changed_signal = SignalImpl()
 
     @property
     def name(self) -> str:
@@ -159,62 +424,306 @@ class MCPServerImpl(MCPServer):
                     command=self._stdio_params.command,
                     args=self._stdio_params.args,
                     env=self._stdio_params.env,
-                )
+                ),
+                message_handler=self._handle_message,
             )
         elif self._streamable_http_params is not None:
             return Client(
                 transport=StreamableHttpTransport(
                     url=self._streamable_http_params.url,
                     headers=self._streamable_http_params.headers,
-                )
+                ),
+                message_handler=self._handle_message,
             )
 
-    async def get_client(self) -> Client:
+    async def _handle_message(self, message) -> None:
+        # notifications are wrapped in ServerNotification
+        notification = getattr(message, "root", message)
+        if not isinstance(notification, ToolListChangedNotification) or self._closed:
+            return
+        if self._tool_list_refresh_task is None or self._tool_list_refresh_task.done():
+            # tools are listed outside of the session's message handling
+            self._tool_list_refresh_task = asyncio.create_task(self._refresh_tool_list())
+
+    async def _refresh_tool_list(self) -> None:
+        await asyncio.sleep(MCP_TOOL_LIST_REFRESH_DELAY)
+        if not self._closed:
+            log.info(f"MCP server '{self.name}' tool list changed")
+            self.tool_list_changed_signal.emit(self)
+
+    async def _open_session(self) -> _MCPSession:
         if self._stdio_params is None and self._streamable_http_params is None:
             raise ValueError(
                 "Failed to create MCP client. Either stdio_params or sse_params must be provided"
             )
-        if self._client is None:
-            self._client = self._create_client()
-        else:
-            try:
-                async with self._client:
-                    await self._client.ping()
-            except Exception as e:
-                self._client = self._create_client()
-        return self._client
-
-    async def update_tool_list(self):
-        async with await self.get_client() as client:
-            self._mcp_tools = await client.list_tools()
+        wait_time = self._next_connect_time - time.monotonic()
+        if wait_time > 0:
+            raise ConnectionError(
+                f"MCP server '{self.name}' is unavailable, retrying in {wait_time:.0f} seconds"
+            )
 
-    async def call_tool(self, tool_name: str, tool_args: dict):
+        session = _MCPSession(self._create_client())
         try:
-            async with await self.get_client() as client:
-                result = await client.call_tool(tool_name, tool_args)
-                return result
+            await session.open(MCP_CONNECT_TIMEOUT)
         except Exception as e:
-            log.error(f"Error calling tool '{tool_name}' on server '{self.name}': {e}")
-            return None
+            # back off exponentially until the server is reachable again
+            self._connect_failures += 1
+            delay = min(
+                MCP_RECONNECT_BASE_DELAY * 2 ** (self._connect_failures - 1),
+                MCP_RECONNECT_MAX_DELAY,
+            )
+            self._next_connect_time = time.monotonic() + delay
+            raise ConnectionError(f"Failed to connect to MCP server '{self.name}': {e}")
+
+        self._connect_failures = 0
+        self._next_connect_time = 0
+        self._sessions.append(session)
+        if self._keepalive_task is None or self._keepalive_task.done():
+            self._keepalive_task = asyncio.create_task(self._keepalive())
+        return session
+
+    async def _acquire_session(self) -> _MCPSession:
+        if self._closed:
+            raise ConnectionError(f"MCP server '{self.name}' is closed")
+        if self._session_lock is None:
+            self._session_lock = asyncio.Lock()
+
+        async with self._session_lock:
+            self._sessions = [session for session in self._sessions if session.connected]
+            idle_sessions = [session for session in self._sessions if session.active_calls == 0]
+            if len(idle_sessions) > 0:
+                session = idle_sessions[0]
+            elif len(self._sessions) < self._max_sessions:
+                session = await self._open_session()
+            else:
+                session = min(self._sessions, key=lambda session: session.active_calls)
+            session.active_calls += 1
+            session.last_used = time.monotonic()
+            return session
+
+    async def _drop_session(self, session: _MCPSession) -> None:
+        if session in self._sessions:
+            self._sessions.remove(session)
+        await session.close()
+
+    async def _call_with_session(self, call):
+        session = await self._acquire_session()
+        try:
+            return await call(session.client)
+        except Exception:
+            # drop the session if the failure broke the connection
+            if not session.connected or not await session.ping():
+                await self._drop_session(session)
+            raise
+        finally:
+            session.active_calls -= 1
+            session.last_used = time.monotonic()
+
+    async def _keepalive(self) -> None:
+        while not self._closed:
+            await asyncio.sleep(MCP_KEEPALIVE_INTERVAL)
+            now = time.monotonic()
+            for session in list(self._sessions):
+                if session.active_calls > 0:
+                    continue
+                if not session.connected or not await session.ping():
+                    log.info(f"MCP server '{self.name}' session is lost, reconnecting")
+                    await self._drop_session(session)
+                elif len(self._sessions) > 1 and now - session.last_used > MCP_SESSION_IDLE_TIMEOUT:
+                    await self._drop_session(session)
+
+            # reconnect in the background, so that the next call does not wait for it
+            if len(self._sessions) == 0 and time.monotonic() >= self._next_connect_time:
+                async with self._session_lock:
+                    if len(self._sessions) == 0 and not self._closed:
+                        try:
+                            await self._open_session()
+                        except ConnectionError as e:
+                            log.debug(str(e))
+
+    async def _close(self) -> None:
+        self._closed = True
+        if self._keepalive_task is not None:
+            self._keepalive_task.cancel()
+        if self._tool_list_refresh_task is not None:
+            self._tool_list_refresh_task.cancel()
+        sessions = self._sessions
+        self._sessions = []
+        for session in sessions:
+            await session.close()
+
+    async def connect(self):
+        async def _connect():
+            session = await self._acquire_session()
+            session.active_calls -= 1
+
+        await _run_on_mcp_event_loop(_connect())
+
+    async def disconnect(self):
+        await _run_on_mcp_event_loop(self._close())
+
+    def close(self) -> concurrent.futures.Future:
+        """
+        Closes the server's sessions without waiting for them.
+        """
+        return get_mcp_event_loop().submit(self._close())
 
-    # TODO: optimize this
-    def get_tools(self) -> list[Tool]:
-        return [
+    @property
+    def config_hash(self) -> str:
+        return self._config_hash
+
+    @property
+    def tool_definitions(self) -> list:
+        """
+        Tool definitions as listed by the server.
+        """
+        return self._mcp_tools
+
+    def set_tool_definitions(self, tool_definitions: list) -> None:
+        self._mcp_tools = tool_definitions
+        self._update_tools()
+
+    async def update_tool_list(self):
+        self.set_tool_definitions(
+            await _run_on_mcp_event_loop(
+                self._call_with_session(lambda client: client.list_tools())
+            )
+        )
+
+    def _update_tools(self):
+        tools = [
             MCPTool(
                 self,
                 tool.name,
                 tool.description,
                 tool.inputSchema,
                 auto_approve=(tool.name in self._auto_approve_tools),
+                # servers declare tools without side effects as read only
+                concurrency_safe=(
+                    getattr(getattr(tool, "annotations", None), "readOnlyHint", None) is True
+                ),
             )
             for tool in self._mcp_tools
         ]
+        tools_by_name = {}
+        for tool in tools:
+            tools_by_name.setdefault(tool.name, tool)
+        # replaced at once, so that readers on other threads see a consistent list
+        self._tools, self._tools_by_name = tools, tools_by_name
+        self._tools_version += 1
+
+    @property
+    def tools_version(self) -> int:
+        return self._tools_version
+
+    def _get_result_cache(self, tool_name: str) -> MCPToolResultCache:
+        cache = self._result_caches.get(tool_name)
+        if cache is not None:
+            return cache
+
+        tool_config = self._result_cache_config.get("toolCache", {}).get(tool_name, {})
+        ttl = tool_config.get("cacheTtl", self._result_cache_config.get("cacheTtl", 0))
+        max_entries = tool_config.get(
+            "maxEntries",
+            self._result_cache_config.get("maxEntries", DEFAULT_RESULT_CACHE_MAX_ENTRIES),
+        )
+        try:
+            cache = MCPToolResultCache(float(ttl), int(max_entries))
+        except (TypeError, ValueError):
+            log.error(f"Invalid result cache configuration for MCP tool '{tool_name}'")
+            cache = MCPToolResultCache(0)
+
+        return self._result_caches.setdefault(tool_name, cache)
+
+    def _get_call_timeout(self, tool_name: str) -> float:
+        timeout = self._call_config.get("toolTimeouts", {}).get(
+            tool_name, self._call_config.get("timeout", MCP_TOOL_TIMEOUT)
+        )
+        try:
+            return float(timeout)
+        except (TypeError, ValueError):
+            log.error(f"Invalid timeout configuration for MCP tool '{tool_name}'")
+            return MCP_TOOL_TIMEOUT
+
+    async def _call_tool_in_slot(self, tool_name: str, tool_args: dict):
+        if self._call_semaphore is None:
+            max_calls = self._call_config.get("maxConcurrentCalls", MCP_MAX_CONCURRENT_CALLS)
+            try:
+                max_calls = max(int(max_calls), 1)
+            except (TypeError, ValueError):
+                log.error(f"Invalid maxConcurrentCalls configuration for MCP server '{self.name}'")
+                max_calls = MCP_MAX_CONCURRENT_CALLS
+            self._call_semaphore = asyncio.Semaphore(max_calls)
+
+        async with self._call_semaphore:
+            return await self._call_with_session(
+                lambda client: client.call_tool(tool_name, tool_args)
+            )
+
+    def _record_call_outcome(self, success: bool) -> None:
+        if success:
+            changed = self._circuit_breaker.record_success()
+        else:
+            changed = self._circuit_breaker.record_failure()
+        if changed:
+            state = self._circuit_breaker.state
+            log.info(f"MCP server '{self.name}' circuit is {state.value}")
+            self.circuit_state_changed_signal.emit(self)
+
+    @property
+    def circuit_state(self) -> CircuitState:
+        return self._circuit_breaker.state
+
+    async def call_tool(self, tool_name: str, tool_args: dict):
+        cache = self._get_result_cache(tool_name)
+        result = cache.get(tool_args)
+        if result is not None:
+            return result
+
+        if not self._circuit_breaker.allow_call():
+            log.error(
+                f"MCP server '{self.name}' is unavailable after repeated failures, not calling tool '{tool_name}' for {self._circuit_breaker.retry_in:.0f} seconds"
+            )
+            return None
+
+        timeout = self._get_call_timeout(tool_name)
+        try:
+            result = await _run_on_mcp_event_loop(
+                asyncio.wait_for(self._call_tool_in_slot(tool_name, tool_args), timeout)
+            )
+        except asyncio.TimeoutError:
+            log.error(
+                f"Calling tool '{tool_name}' on server '{self.name}' timed out after {timeout} seconds"
+            )
+            self._record_call_outcome(False)
+            return None
+        except ToolError as e:
+            # the tool reported an error, the server itself is working
+            log.error(f"Error calling tool '{tool_name}' on server '{self.name}': {e}")
+            self._record_call_outcome(True)
+            return None
+        except Exception as e:
+            log.error(f"Error calling tool '{tool_name}' on server '{self.name}': {e}")
+            self._record_call_outcome(False)
+            return None
+
+        self._record_call_outcome(True)
+        cache.put(tool_args, result)
+        return result
+
+    @property
+    def result_cache_metrics(self) -> dict:
+        return {
+            tool_name: cache.metrics
+            for tool_name, cache in list(self._result_caches.items())
+            if cache.enabled
+        }
+
+    def get_tools(self) -> list[Tool]:
+        return list(self._tools)
 
     def get_tool(self, tool_name: str) -> Tool:
-        for tool in self.get_tools():
-            if tool.name == tool_name:
-                return tool
-        return None
+        return self._tools_by_name.get(tool_name)
 
 
 class MCPChatParticipant(BaseChatParticipant):
@@ -225,6 +734,8 @@ class MCPChatParticipant(BaseChatParticipant):
         self._servers = servers
         self._tools_updated = False
         self._nbi_tools = nbi_tools
+        self._tool_registry: ToolRegistry = None
+        self._tool_registry_version = None
 
     @property
     def id(self) -> str:
@@ -257,6 +768,14 @@ class MCPChatParticipant(BaseChatParticipant):
                 mcp_tools.append(tool)
         return mcp_tools
 
+    def get_tool_registry(self, request: ChatRequest) -> ToolRegistry:
+        tools_version = tuple(server.tools_version for server in self._servers)
+        tool_registry = self._tool_registry
+        if tool_registry is None or self._tool_registry_version != tools_version:
+            tool_registry = ToolRegistry(self.tools)
+            self._tool_registry, self._tool_registry_version = tool_registry, tools_version
+        return tool_registry
+
     @property
     def servers(self) -> list[MCPServer]:
         return self._servers
@@ -279,14 +798,111 @@ class MCPChatParticipant(BaseChatParticipant):
             await self.handle_chat_request_with_tools(request, response, options)
 
 
+def mcp_server_config_hash(server_config: dict) -> str:
+    return hashlib.sha256(
+        json.dumps(server_config, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def _tool_definition_to_dict(tool) -> dict:
+    if hasattr(tool, "model_dump"):
+        return tool.model_dump(mode="json", exclude_none=True)
+    return {
+        "name": tool.name,
+        "description": tool.description,
+        "inputSchema": tool.inputSchema,
+    }
+
+
+class MCPToolCatalog:
+    """
+    Last known tool lists of MCP servers, persisted to disk and keyed by a hash of
+    the server config. Used to show tools right away at startup while servers are
+    still being discovered.
+    """
+
+    def __init__(self, file_path: str = None):
+        self._file_path = file_path
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict] = {}
+        self._load()
+
+    def _load(self) -> None:
+        if self._file_path is None or not os.path.exists(self._file_path):
+            return
+        try:
+            with open(self._file_path, "r") as file:
+                catalog = json.load(file)
+            self._entries = catalog.get("servers", {})
+        except Exception as e:
+            log.warning(f"Failed to load MCP tool catalog from {self._file_path}: {e}")
+
+    def get(self, config_hash: str) -> Union[list, None]:
+        with self._lock:
+            entry = self._entries.get(config_hash)
+        if entry is None:
+            return None
+        try:
+            return [MCPToolDefinition.model_validate(tool) for tool in entry["tools"]]
+        except Exception as e:
+            log.warning(f"Invalid MCP tool catalog entry for server '{entry.get('name')}': {e}")
+            return None
+
+    def put(self, config_hash: str, server_name: str, tools: list) -> None:
+        with self._lock:
+            self._entries[config_hash] = {
+                "name": server_name,
+                "updated": time.time(),
+                "tools": [_tool_definition_to_dict(tool) for tool in tools],
+            }
+
+    def save(self, keep_config_hashes: set[str] = None) -> None:
+        """
+        Writes the catalog to disk, dropping servers not in keep_config_hashes.
+        """
+        if self._file_path is None:
+            return
+        with self._lock:
+            if keep_config_hashes is not None:
+                self._entries = {
+                    config_hash: entry
+                    for config_hash, entry in self._entries.items()
+                    if config_hash in keep_config_hashes
+                }
+            content = json.dumps({"servers": self._entries})
+        try:
+            os.makedirs(os.path.dirname(self._file_path), exist_ok=True)
+            tmp_file_path = f"{self._file_path}.tmp"
+            with open(tmp_file_path, "w") as file:
+                file.write(content)
+            os.replace(tmp_file_path, self._file_path)
+        except Exception as e:
+            log.warning(f"Failed to save MCP tool catalog to {self._file_path}: {e}")
+
+
 class MCPManager:
-    def __init__(self, mcp_config: dict):
+    def __init__(self, mcp_config: dict, tool_catalog_file: str = None):
+        # incremented when servers are recreated from config
+        self._generation = 0
+        self._tool_catalog = MCPToolCatalog(tool_catalog_file)
+        # emitted when discovered tools differ from the ones shown before
+        self.tools_changed_signal = SignalImpl()
+        self._mcp_servers: list[MCPServer] = []
+        # servers by name and config hash, reused across config reloads
+        self._servers_by_key: dict[tuple[str, str], MCPServer] = {}
+        self._previous_servers_by_key: dict[tuple[str, str], MCPServer] = {}
         self.update_mcp_servers(mcp_config)
 
     def update_mcp_servers(self, mcp_config):
-        # TODO: dont reuse servers, recreate with same config
+        """
+        Reconciles servers with the config. Servers with unchanged config keep their
+        sessions and tools, only added or changed servers are started and only removed
+        or changed servers are stopped.
+        """
         servers_config = mcp_config.get("mcpServers", {})
         participants_config = mcp_config.get("participants", {})
+        self._previous_servers_by_key = self._servers_by_key
+        self._servers_by_key = {}
         self._mcp_participants: list[MCPChatParticipant] = []
         self._mcp_servers: list[MCPServer] = []
 
@@ -332,8 +948,44 @@ class MCPManager:
             )
             self._mcp_servers += unused_servers
 
-        thread = threading.Thread(target=self.init_tool_lists, args=())
-        thread.start()
+        # servers shared by participants are listed once
+        self._mcp_servers = list({id(server): server for server in self._mcp_servers}.values())
+        self._mcp_servers_by_name: dict[str, MCPServer] = {}
+        for server in self._mcp_servers:
+            self._mcp_servers_by_name.setdefault(server.name, server)
+        self._generation += 1
+
+        previous_servers_by_key = self._previous_servers_by_key
+        self._previous_servers_by_key = {}
+        removed_servers = [
+            server
+            for key, server in previous_servers_by_key.items()
+            if key not in self._servers_by_key
+        ]
+        added_servers = [
+            server
+            for key, server in self._servers_by_key.items()
+            if key not in previous_servers_by_key
+        ]
+        if len(removed_servers) > 0 or len(added_servers) > 0:
+            log.info(
+                f"Reconciled MCP servers, {len(added_servers)} started, {len(removed_servers)} stopped"
+            )
+
+        # sessions of removed or changed servers are no longer used
+        for server in removed_servers:
+            server.tool_list_changed_signal.disconnect(self._on_server_tool_list_changed)
+            server.circuit_state_changed_signal.disconnect(self._on_server_circuit_state_changed)
+            server.close()
+
+        # unchanged servers are listed again only if they have no tools yet
+        servers_to_discover = added_servers + [
+            server
+            for key, server in self._servers_by_key.items()
+            if key in previous_servers_by_key and len(server.tool_definitions) == 0
+        ]
+        if len(servers_to_discover) > 0:
+            get_mcp_event_loop().submit(self.init_tool_lists_async(servers_to_discover))
 
     def create_servers(self, server_names: list[str], servers_config: dict):
         servers = []
@@ -349,17 +1001,44 @@ class MCPManager:
                 )
                 continue
 
+            key = (server_name, mcp_server_config_hash(server_config))
+            mcp_server = self._servers_by_key.get(key) or self._previous_servers_by_key.get(key)
+            if mcp_server is not None:
+                self._servers_by_key[key] = mcp_server
+                servers.append(mcp_server)
+                continue
+
             mcp_server = self.create_mcp_server(server_name, server_config)
             if mcp_server is None:
                 log.error(f"Failed to create MCP server '{server_name}'")
                 continue
 
+            # show last known tools until the server is discovered
+            cached_tools = self._tool_catalog.get(mcp_server.config_hash)
+            if cached_tools is not None:
+                mcp_server.set_tool_definitions(cached_tools)
+            mcp_server.tool_list_changed_signal.connect(self._on_server_tool_list_changed)
+            mcp_server.circuit_state_changed_signal.connect(self._on_server_circuit_state_changed)
+
+            self._servers_by_key[key] = mcp_server
             servers.append(mcp_server)
 
         return servers
 
     def create_mcp_server(self, server_name: str, server_config: dict):
         auto_approve_tools = server_config.get("autoApprove", [])
+        config_hash = mcp_server_config_hash(server_config)
+        # results of idempotent tools can be cached, it is disabled unless cacheTtl is set
+        result_cache_config = {
+            key: server_config[key]
+            for key in ("cacheTtl", "maxEntries", "toolCache")
+            if key in server_config
+        }
+        call_config = {
+            key: server_config[key]
+            for key in ("timeout", "toolTimeouts", "maxConcurrentCalls")
+            if key in server_config
+        }
 
         if "command" in server_config:
             command = server_config["command"]
@@ -374,6 +1053,9 @@ class MCPManager:
                 server_name,
                 stdio_params=StdioServerParameters(command=command, args=args, env=server_env),
                 auto_approve_tools=auto_approve_tools,
+                config_hash=config_hash,
+                result_cache_config=result_cache_config,
+                call_config=call_config,
             )
         elif "url" in server_config:
             server_url = server_config["url"]
@@ -385,6 +1067,9 @@ class MCPManager:
                     url=server_url, headers=headers
                 ),
                 auto_approve_tools=auto_approve_tools,
+                config_hash=config_hash,
+                result_cache_config=result_cache_config,
+                call_config=call_config,
             )
 
         log.error(f"Invalid MCP server configuration for: {server_name}")
@@ -393,21 +1078,78 @@ class MCPManager:
     def get_mcp_participants(self):
         return self._mcp_participants
 
-    async def init_tool_lists_async(self):
-        for server in self._mcp_servers:
-            try:
-                await server.update_tool_list()
-            except Exception as e:
-                log.error(f"Error initializing tool list for server {server.name}: {e}")
+    async def _discover_tools(self, server: MCPServer) -> bool:
+        """
+        Updates the tool list of the server. Returns whether the tools changed.
+        """
+        previous_tools = [_tool_definition_to_dict(tool) for tool in server.tool_definitions]
+        try:
+            await asyncio.wait_for(server.update_tool_list(), MCP_DISCOVERY_TIMEOUT)
+        except asyncio.TimeoutError:
+            log.error(
+                f"Timed out initializing tool list for server {server.name} after {MCP_DISCOVERY_TIMEOUT} seconds"
+            )
+            return False
+        except Exception as e:
+            log.error(f"Error initializing tool list for server {server.name}: {e}")
+            return False
+
+        if server.config_hash is not None:
+            self._tool_catalog.put(server.config_hash, server.name, server.tool_definitions)
+        return previous_tools != [
+            _tool_definition_to_dict(tool) for tool in server.tool_definitions
+        ]
+
+    async def init_tool_lists_async(self, servers: list[MCPServer] = None):
+        """
+        Discovers tools of all servers concurrently and saves them to the tool catalog.
+        """
+        servers = servers if servers is not None else self._mcp_servers
+        changed = await asyncio.gather(*[self._discover_tools(server) for server in servers])
+        self._tool_catalog.save(
+            set(server.config_hash for server in self._mcp_servers if server.config_hash)
+        )
+        if any(changed):
+            self.tools_changed_signal.emit()
+
+    def _on_server_tool_list_changed(self, server: MCPServer) -> None:
+        if server in self._mcp_servers:
+            get_mcp_event_loop().submit(self.init_tool_lists_async([server]))
+
+    def _on_server_circuit_state_changed(self, server: MCPServer) -> None:
+        # capabilities report the circuit state of servers
+        if server in self._mcp_servers:
+            self.tools_changed_signal.emit()
 
     def init_tool_lists(self):
-        asyncio.run(self.init_tool_lists_async())
+        get_mcp_event_loop().submit(self.init_tool_lists_async()).result()
+
+    def shutdown(self, timeout: float = MCP_CLOSE_TIMEOUT):
+        """
+        Closes sessions of all servers and stops the MCP event loop.
+        """
+        futures = [server.close() for server in self._mcp_servers]
+        concurrent.futures.wait(futures, timeout)
+        stop_mcp_event_loop(timeout)
 
     def get_mcp_servers(self):
         return self._mcp_servers
 
-    def get_mcp_server(self, server_name: str):
+    @property
+    def tool_result_cache_metrics(self) -> dict:
+        metrics = {}
         for server in self._mcp_servers:
-            if server.name == server_name:
-                return server
-        return None
+            server_metrics = server.result_cache_metrics
+            if len(server_metrics) > 0:
+                metrics[server.name] = server_metrics
+        return metrics
+
+    def get_mcp_server(self, server_name: str):
+        return self._mcp_servers_by_name.get(server_name)
+
+    @property
+    def tools_version(self) -> tuple:
+        return (
+            self._generation,
+            tuple(server.tools_version for server in self._mcp_servers),
+        )
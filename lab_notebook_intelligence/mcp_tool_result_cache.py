@@ -0,0 +1,157 @@
+# Copyright (c) Mehmet Bektas <mbektasgh@outlook.com>
+
+import copy
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Union
+
+DEFAULT_RESULT_CACHE_MAX_ENTRIES = 64
+
+
+def canonical_arguments(tool_args: dict) -> str:
+    """
+    JSON of tool call arguments that is the same for equal arguments regardless of
+    key order.
+    """
+    return json.dumps(
+        tool_args, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+    )
+
+
+def _image_key(content) -> Union[bytes, None]:
+    data = getattr(content, "data", None)
+    if getattr(content, "type", None) != "image" or not isinstance(data, str):
+        return None
+    hash = hashlib.blake2b(digest_size=16)
+    hash.update(str(getattr(content, "mimeType", "")).encode("utf-8"))
+    hash.update(b"\0")
+    hash.update(data.encode("utf-8"))
+    return hash.digest()
+
+
+def is_cacheable_result(result) -> bool:
+    if result is None:
+        return False
+    # mcp results use isError, fastmcp results use is_error
+    return not (getattr(result, "isError", False) or getattr(result, "is_error", False))
+
+
+@dataclass
+class _CacheEntry:
+    result: Any
+    image_keys: list[bytes]
+    expires_at: float
+
+
+class MCPToolResultCache:
+    """
+    LRU cache of MCP tool call results with TTL expiry, keyed by the canonical JSON
+    of the call arguments. Image contents are stored by reference and shared by all
+    entries that return the same image.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = DEFAULT_RESULT_CACHE_MAX_ENTRIES):
+        self._ttl = ttl
+        self._max_entries = max(0, max_entries)
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, _CacheEntry] = OrderedDict()
+        # image key -> [image content, number of entries referencing it]
+        self._images: dict[bytes, list] = {}
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._ttl > 0 and self._max_entries > 0
+
+    def _remove_entry(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for image_key in entry.image_keys:
+            image = self._images.get(image_key)
+            if image is None:
+                continue
+            image[1] -= 1
+            if image[1] <= 0:
+                del self._images[image_key]
+
+    def get(self, tool_args: dict) -> Any:
+        if not self.enabled:
+            return None
+
+        key = canonical_arguments(tool_args)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return entry.result
+                self._remove_entry(key)
+            self._misses += 1
+            return None
+
+    def put(self, tool_args: dict, result) -> None:
+        if not self.enabled or not is_cacheable_result(result):
+            return
+
+        key = canonical_arguments(tool_args)
+        contents = getattr(result, "content", None)
+        content_image_keys = (
+            [_image_key(content) for content in contents] if isinstance(contents, list) else []
+        )
+
+        with self._lock:
+            self._remove_entry(key)
+            image_keys = []
+            shared_contents = list(contents) if isinstance(contents, list) else None
+            for i, image_key in enumerate(content_image_keys):
+                if image_key is None:
+                    continue
+                image = self._images.get(image_key)
+                if image is None:
+                    image = [shared_contents[i], 0]
+                    self._images[image_key] = image
+                image[1] += 1
+                shared_contents[i] = image[0]
+                image_keys.append(image_key)
+
+            if len(image_keys) > 0:
+                # shallow copy, so that only the content list refers to shared images
+                result = copy.copy(result)
+                result.content = shared_contents
+
+            self._entries[key] = _CacheEntry(
+                result=result,
+                image_keys=image_keys,
+                expires_at=time.monotonic() + self._ttl,
+            )
+            while len(self._entries) > self._max_entries:
+                self._remove_entry(next(iter(self._entries)))
+                self._evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._images.clear()
+
+    @property
+    def metrics(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "max_entries": self._max_entries,
+                "ttl": self._ttl,
+                "entries": len(self._entries),
+                "images": len(self._images),
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": self._hits / lookups if lookups > 0 else 0,
+            }
@@ -0,0 +1,294 @@
+# Copyright (c) Mehmet Bektas <mbektasgh@outlook.com>
+
+import re
+import threading
+from dataclasses import dataclass
+
+from lab_notebook_intelligence.context_budget import (
+    APPROXIMATE_CHARS_PER_TOKEN,
+    get_token_counter,
+)
+
+# outputs are condensed before the model is known, they are measured approximately
+TOKEN_COUNTER_MODEL = "gpt-4o"
+# token budget of a single output item (stream, result, error)
+DEFAULT_ITEM_TOKEN_BUDGET = 1024
+# token budget of all outputs of a cell
+DEFAULT_OUTPUT_TOKEN_BUDGET = 3072
+# long streams keep this many lines from their beginning and end
+STREAM_HEAD_LINES = 20
+STREAM_TAIL_LINES = 40
+# tracebacks keep the first and the last frames
+TRACEBACK_HEAD_FRAMES = 2
+TRACEBACK_TAIL_FRAMES = 4
+# runs of base64 characters at least this long are treated as binary data
+MIN_BASE64_LENGTH = 256
+# larger outputs are measured by length for the metrics instead of tokenized
+MAX_EXACT_COUNT_LENGTH = 64 * 1024
+# mime types shown as text, in order of preference
+TEXT_MIME_TYPES = (
+    "text/plain",
+    "text/markdown",
+    "text/latex",
+    "application/json",
+    "text/html",
+)
+
+_ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;?]*[A-Za-z]")
+_BASE64_RUN = re.compile(r"[A-Za-z0-9+/]{%d,}={0,2}" % MIN_BASE64_LENGTH)
+_HTML_TAG = re.compile(r"<[^>]+>")
+_TRACEBACK_START = re.compile(r"Traceback \(most recent call last\)")
+# frame headers of IPython (Cell In[1], line 2 / File ~/a.py:3, in f) and Python tracebacks
+_FRAME_HEADER = re.compile(r"^(Cell In\[\d+\], line \d+|File .+:\d+, in |\s*File \".+\", line \d+)")
+# IPython marks the failing line of a frame with an arrow
+_FRAME_ARROW = re.compile(r"^-*> ?\d+")
+_PYTHON_FRAME_HEADER = re.compile(r"^\s*File \".+\", line \d+")
+
+
+class OutputCondenserStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.outputs = 0
+        self.condensed = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+
+    def record(self, tokens_in: int, tokens_out: int, condensed: bool) -> None:
+        with self._lock:
+            self.outputs += 1
+            if condensed:
+                self.condensed += 1
+            self.tokens_in += tokens_in
+            self.tokens_out += tokens_out
+
+    @property
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "outputs": self.outputs,
+                "condensed": self.condensed,
+                "tokens_in": self.tokens_in,
+                "tokens_out": self.tokens_out,
+                "tokens_saved": self.tokens_in - self.tokens_out,
+            }
+
+
+output_condenser_stats = OutputCondenserStats()
+
+
+@dataclass
+class CondensedOutput:
+    text: str
+    # whether anything was left out of the text
+    condensed: bool
+
+
+def _join_text(text) -> str:
+    if isinstance(text, list):
+        return "".join(text)
+    return text if isinstance(text, str) else ""
+
+
+def _format_size(length: int) -> str:
+    if length >= 1024 * 1024:
+        return f"{length / (1024 * 1024):.1f} MB"
+    if length >= 1024:
+        return f"{length / 1024:.1f} KB"
+    return f"{length} bytes"
+
+
+def _clean_text(text: str) -> tuple[str, bool]:
+    """
+    Removes terminal escapes, collapses carriage return progress updates to their
+    final state and replaces inline binary data. Returns the text and whether binary
+    data was replaced.
+    """
+    text = _ANSI_ESCAPE.sub("", text)
+    if "\r" in text:
+        text = "\n".join(line.split("\r")[-1] for line in text.replace("\r\n", "\n").split("\n"))
+    return _BASE64_RUN.subn(lambda m: f"[base64 data, {_format_size(len(m.group(0)))}]", text)
+
+
+def _head_tail_lines(
+    text: str, head: int = STREAM_HEAD_LINES, tail: int = STREAM_TAIL_LINES
+) -> tuple[str, bool]:
+    lines = text.split("\n")
+    if len(lines) <= head + tail:
+        return text, False
+    omitted = len(lines) - head - tail
+    return "\n".join(lines[:head] + [f"... ({omitted} lines omitted) ..."] + lines[-tail:]), True
+
+
+def _is_traceback_content(line: str) -> bool:
+    stripped = line.strip()
+    return stripped != "" and set(stripped) != {"-"}
+
+
+def summarize_traceback(lines: list[str]) -> list[str]:
+    """
+    Reduces a traceback to its frame locations, the failing line of each frame and the
+    exception. Only the first and the last frames are kept for deep tracebacks.
+    """
+    frames: list[list[str]] = []
+    preamble: list[str] = []
+    exception_line = None
+    previous_was_python_header = False
+    for line in lines:
+        stripped = line.rstrip()
+        if stripped.strip() == "" or set(stripped.strip()) == {"-"}:
+            previous_was_python_header = False
+            continue
+        if _FRAME_HEADER.match(stripped):
+            frames.append([stripped])
+            previous_was_python_header = _PYTHON_FRAME_HEADER.match(stripped) is not None
+        elif len(frames) > 0 and (previous_was_python_header or _FRAME_ARROW.match(stripped)):
+            # the source line of a Python frame or the arrow line of an IPython frame
+            frames[-1].append(stripped)
+            previous_was_python_header = False
+        elif len(frames) == 0 and len(preamble) == 0:
+            preamble.append(stripped)
+        else:
+            previous_was_python_header = False
+        if not line.startswith((" ", "-", "\t")) and not _FRAME_HEADER.match(stripped):
+            exception_line = stripped
+
+    if len(frames) > TRACEBACK_HEAD_FRAMES + TRACEBACK_TAIL_FRAMES:
+        omitted = len(frames) - TRACEBACK_HEAD_FRAMES - TRACEBACK_TAIL_FRAMES
+        frames = (
+            frames[:TRACEBACK_HEAD_FRAMES]
+            + [[f"... ({omitted} frames omitted) ..."]]
+            + frames[-TRACEBACK_TAIL_FRAMES:]
+        )
+
+    summary = preamble + [line for frame in frames for line in frame]
+    if exception_line is not None and exception_line not in summary[-1:]:
+        summary.append(exception_line)
+    return summary
+
+
+def _summarize_traceback_text(lines: list[str]) -> tuple[list[str], bool]:
+    summary = summarize_traceback(lines)
+    omitted = sum(1 for line in lines if _is_traceback_content(line)) > len(summary)
+    return summary, omitted
+
+
+def _condense_error(output: dict) -> tuple[str, bool]:
+    header = f"{output.get('ename', '')}: {output.get('evalue', '')}"
+    traceback = output.get("traceback")
+    if not isinstance(traceback, list):
+        return header, False
+    text, replaced = _clean_text("\n".join(traceback))
+    summary, omitted = _summarize_traceback_text(text.split("\n"))
+    # the exception is the last line of a traceback
+    if len(summary) == 0 or summary[-1] != header:
+        summary.append(header)
+    return "\n".join(summary), replaced or omitted
+
+
+def _condense_data(data: dict) -> tuple[str, bool]:
+    parts = []
+    omitted = False
+    for mime_type in TEXT_MIME_TYPES:
+        value = data.get(mime_type)
+        if value is None:
+            continue
+        text = _join_text(value) if mime_type != "application/json" else str(value)
+        if mime_type == "text/html":
+            text = _HTML_TAG.sub("", text)
+        text, replaced = _clean_text(text)
+        text, lines_omitted = _head_tail_lines(text)
+        parts.append(text)
+        omitted = replaced > 0 or lines_omitted
+        break
+
+    # binary and other rich outputs are described instead of sent, they are not part
+    # of the full output either
+    for mime_type, value in data.items():
+        if mime_type in TEXT_MIME_TYPES:
+            continue
+        length = len(_join_text(value)) if not isinstance(value, dict) else len(str(value))
+        parts.append(f"[{mime_type} output, {_format_size(length)}]")
+    return "\n".join(parts), omitted
+
+
+def _condense_text_traceback(text: str) -> tuple[str, bool]:
+    match = _TRACEBACK_START.search(text)
+    if match is None:
+        return text, False
+    start = text.rfind("\n", 0, match.start()) + 1
+    summary, omitted = _summarize_traceback_text(text[start:].split("\n"))
+    return text[:start] + "\n".join(summary), omitted
+
+
+def _fit(text: str, max_tokens: int) -> tuple[str, bool]:
+    fitted = get_token_counter(TOKEN_COUNTER_MODEL).truncate(text, max_tokens)
+    return fitted, fitted != text
+
+
+def _record(original: str, condensed: str, omitted: bool) -> CondensedOutput:
+    """
+    Records the condensing of an output. omitted tells whether anything was left out of
+    the condensed text, rather than only reformatted.
+    """
+    counter = get_token_counter(TOKEN_COUNTER_MODEL)
+    if len(original) <= MAX_EXACT_COUNT_LENGTH:
+        tokens_in = counter.count(original)
+    else:
+        tokens_in = len(original) // APPROXIMATE_CHARS_PER_TOKEN
+    tokens_out = counter.count(condensed) if condensed != original else tokens_in
+    output_condenser_stats.record(tokens_in, tokens_out, omitted)
+    return CondensedOutput(text=condensed, condensed=omitted)
+
+
+def condense_outputs(
+    outputs: list[dict],
+    item_token_budget: int = DEFAULT_ITEM_TOKEN_BUDGET,
+    token_budget: int = DEFAULT_OUTPUT_TOKEN_BUDGET,
+) -> CondensedOutput:
+    """
+    Condenses outputs in nbformat layout for the model. Binary payloads are replaced
+    with descriptions, long streams keep their first and last lines, tracebacks are
+    reduced to their frames and each item is fit to item_token_budget tokens.
+    """
+    original_parts = []
+    parts = []
+    omitted = False
+    for output in outputs:
+        output_type = output.get("output_type")
+        if output_type == "stream":
+            original = _join_text(output.get("text"))
+            cleaned, replaced = _clean_text(original)
+            condensed, lines_omitted = _head_tail_lines(cleaned)
+            item_omitted = replaced > 0 or lines_omitted
+        elif output_type in ("execute_result", "display_data"):
+            data = output.get("data") if isinstance(output.get("data"), dict) else {}
+            original = "\n".join(_join_text(value) for value in data.values())
+            condensed, item_omitted = _condense_data(data)
+        elif output_type == "error":
+            traceback = output.get("traceback")
+            original = "\n".join(traceback) if isinstance(traceback, list) else ""
+            condensed, item_omitted = _condense_error(output)
+        else:
+            continue
+        original_parts.append(original.strip("\n"))
+        condensed, truncated = _fit(condensed.strip("\n"), item_token_budget)
+        parts.append(condensed)
+        omitted = omitted or item_omitted or truncated
+
+    condensed, truncated = _fit("\n".join(parts), token_budget)
+    return _record("\n".join(original_parts), condensed, omitted or truncated)
+
+
+def condense_output_text(
+    text: str,
+    item_token_budget: int = DEFAULT_OUTPUT_TOKEN_BUDGET,
+) -> CondensedOutput:
+    """
+    Condenses cell output that is already rendered as text, e.g. by the frontend.
+    """
+    text = text or ""
+    condensed, replaced = _clean_text(text)
+    condensed, frames_omitted = _condense_text_traceback(condensed)
+    condensed, lines_omitted = _head_tail_lines(condensed)
+    condensed, truncated = _fit(condensed, item_token_budget)
+    return _record(text, condensed, replaced > 0 or frames_omitted or lines_omitted or truncated)
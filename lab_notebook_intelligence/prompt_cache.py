@@ -0,0 +1,139 @@
+# Copyright (c) Mehmet Bektas <mbektasgh@outlook.com>
+
+import threading
+from typing import Any
+
+# Anthropic prompt caching breakpoint, passed through by LiteLLM
+CACHE_CONTROL = {"type": "ephemeral"}
+# keeps Ollama models loaded between agent rounds, so that the prompt prefix
+# evaluated in the previous round is reused
+OLLAMA_KEEP_ALIVE = "30m"
+_CACHE_CONTROL_MODEL_PREFIXES = ("anthropic/", "bedrock/", "vertex_ai/", "claude")
+
+
+def _sorted_json(value: Any) -> Any:
+    """
+    Copy of a JSON value with object keys in sorted order, so that it serializes to
+    the same bytes regardless of how it was built.
+    """
+    if isinstance(value, dict):
+        return {key: _sorted_json(value[key]) for key in sorted(value.keys())}
+    if isinstance(value, list):
+        return [_sorted_json(item) for item in value]
+    return value
+
+
+def _tool_name(schema: dict) -> str:
+    function = schema.get("function")
+    return function.get("name", "") if isinstance(function, dict) else ""
+
+
+def canonical_tool_schemas(schemas: list[dict]) -> list[dict]:
+    """
+    Tool schemas in name order with sorted keys. Providers cache prompts by prefix and
+    tools are part of the prefix, so the same tool selection has to produce the same
+    bytes in every request and round.
+    """
+    return [_sorted_json(schema) for schema in sorted(schemas, key=_tool_name)]
+
+
+def assemble_system_prompt(preamble: str, instructions: list[tuple[str, str]]) -> str:
+    """
+    System prompt made of a preamble and toolset instructions keyed by toolset id.
+    Instructions are ordered by key so that the prompt does not depend on the order
+    toolsets were selected in.
+    """
+    parts = [preamble] if preamble else []
+    parts += [text.strip() for _, text in sorted(instructions, key=lambda item: item[0])]
+    return "\n\n".join(part for part in parts if part) + "\n"
+
+
+def supports_cache_control(model_id: str) -> bool:
+    model_id = (model_id or "").lower()
+    return model_id.startswith(_CACHE_CONTROL_MODEL_PREFIXES) and "claude" in model_id
+
+
+def _with_cache_control(message: dict) -> dict:
+    content = message.get("content")
+    if isinstance(content, str) and content != "":
+        content = [{"type": "text", "text": content, "cache_control": CACHE_CONTROL}]
+    elif isinstance(content, list) and len(content) > 0 and isinstance(content[-1], dict):
+        content = content[:-1] + [{**content[-1], "cache_control": CACHE_CONTROL}]
+    else:
+        return message
+    return {**message, "content": content}
+
+
+def add_cache_control(
+    messages: list[dict], tools: list[dict] = None
+) -> tuple[list[dict], list[dict]]:
+    """
+    Marks cache breakpoints after the tools, the system prompt and the latest message,
+    so that the next round of a request only pays for the messages added since. The
+    inputs are not modified.
+    """
+    if tools:
+        tools = tools[:-1] + [{**tools[-1], "cache_control": CACHE_CONTROL}]
+
+    messages = list(messages)
+    if len(messages) > 0 and messages[0].get("role") == "system":
+        messages[0] = _with_cache_control(messages[0])
+    # assistant messages with only tool calls have no content to mark
+    for i in range(len(messages) - 1, 0, -1):
+        marked = _with_cache_control(messages[i])
+        if marked is not messages[i]:
+            messages[i] = marked
+            break
+
+    return messages, tools
+
+
+def _usage_value(usage: dict, *keys: str) -> int:
+    value = usage
+    for key in keys:
+        if not isinstance(value, dict):
+            return 0
+        value = value.get(key)
+    return value if isinstance(value, int) else 0
+
+
+class PromptCacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.cache_write_tokens = 0
+
+    def record(self, completion: Any) -> None:
+        """
+        Records prompt token usage of a completion response in OpenAI format.
+        Anthropic cache reads and writes are reported by LiteLLM in extra fields.
+        """
+        usage = completion.get("usage") if isinstance(completion, dict) else None
+        if not isinstance(usage, dict):
+            return
+        cached_tokens = _usage_value(usage, "prompt_tokens_details", "cached_tokens")
+        if cached_tokens == 0:
+            cached_tokens = _usage_value(usage, "cache_read_input_tokens")
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += _usage_value(usage, "prompt_tokens")
+            self.cached_tokens += cached_tokens
+            self.cache_write_tokens += _usage_value(usage, "cache_creation_input_tokens")
+
+    @property
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_tokens": self.cached_tokens,
+                "cache_write_tokens": self.cache_write_tokens,
+                "cached_ratio": (
+                    self.cached_tokens / self.prompt_tokens if self.prompt_tokens > 0 else 0
+                ),
+            }
+
+
+prompt_cache_stats = PromptCacheStats()
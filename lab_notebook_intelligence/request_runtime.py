@@ -0,0 +1,390 @@
+# Copyright (c) Mehmet Bektas <mbektasgh@outlook.com>
+
+import asyncio
+import concurrent.futures
+import contextlib
+import contextvars
+import logging
+import math
+import threading
+import weakref
+from typing import Any, Callable, Coroutine, Union
+
+log = logging.getLogger(__name__)
+
+DEFAULT_NUM_EVENT_LOOPS = 1
+DEFAULT_MAX_CONCURRENT_REQUESTS = 32
+DEFAULT_MAX_QUEUED_REQUESTS = 128
+DEFAULT_EXECUTOR_MAX_WORKERS = 8
+
+# called with an event loop before it is closed, to close resources bound to the loop
+# such as pooled async HTTP clients
+_loop_cleanups: list[Callable[[asyncio.AbstractEventLoop], Coroutine]] = []
+
+
+def add_loop_cleanup(cleanup: Callable[[asyncio.AbstractEventLoop], Coroutine]) -> None:
+    _loop_cleanups.append(cleanup)
+
+
+async def _run_loop_cleanups(loop: asyncio.AbstractEventLoop) -> None:
+    for cleanup in list(_loop_cleanups):
+        try:
+            await cleanup(loop)
+        except Exception as e:
+            log.debug(f"Failed to clean up resources of event loop: {e}")
+
+
+class LoopBoundClients:
+    """
+    Async clients shared by the requests of an event loop, one per loop and client
+    configuration. Connections of async clients are bound to the loop they were opened
+    on, so clients are not shared across loops. They are closed before their loop is.
+    """
+
+    def __init__(
+        self,
+        create: Callable[..., Any],
+        close: Callable[[Any], Coroutine],
+    ):
+        self._create = create
+        self._close = close
+        self._lock = threading.Lock()
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]" = (
+            weakref.WeakKeyDictionary()
+        )
+        add_loop_cleanup(self._close_loop_clients)
+
+    def get(self, **config) -> Any:
+        """
+        Client of the running loop created with config as keyword arguments.
+        """
+        loop = asyncio.get_running_loop()
+        key = tuple(sorted(config.items()))
+        with self._lock:
+            clients = self._clients.setdefault(loop, {})
+            client = clients.get(key)
+            if client is None:
+                client = self._create(**config)
+                clients[key] = client
+            return client
+
+    async def _close_loop_clients(self, loop: asyncio.AbstractEventLoop) -> None:
+        with self._lock:
+            clients = self._clients.pop(loop, {})
+        for client in clients.values():
+            try:
+                await self._close(client)
+            except Exception as e:
+                log.debug(f"Failed to close async client: {e}")
+
+
+def run_in_new_loop(coro: Coroutine) -> Any:
+    """
+    Runs the coroutine to completion on a new event loop in the calling thread, for
+    code that may block its loop. It runs outside of the context of the current
+    request, so it does not touch the request's concurrency slot, and resources bound
+    to the loop are cleaned up before the loop is closed.
+    """
+
+    async def _run():
+        try:
+            return await coro
+        finally:
+            await _run_loop_cleanups(asyncio.get_running_loop())
+
+    return contextvars.Context().run(asyncio.run, _run())
+
+
+class EventLoopThread:
+    """
+    Long-lived asyncio event loop running on a dedicated daemon thread.
+    Coroutines can be submitted to it from any thread.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        executor: concurrent.futures.Executor = None,
+    ):
+        self._name = name
+        self._loop = asyncio.new_event_loop()
+        if executor is not None:
+            self._loop.set_default_executor(executor)
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self._loop
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread.is_alive() and self._loop.is_running()
+
+    def start(self) -> None:
+        self._thread.start()
+        self._started.wait()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._loop.call_soon(self._started.set)
+        try:
+            self._loop.run_forever()
+        finally:
+            try:
+                pending = asyncio.all_tasks(self._loop)
+                for task in pending:
+                    task.cancel()
+                if len(pending) > 0:
+                    self._loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+                self._loop.run_until_complete(_run_loop_cleanups(self._loop))
+                self._loop.run_until_complete(self._loop.shutdown_asyncgens())
+            finally:
+                self._loop.close()
+
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def call_soon(self, callback, *args) -> None:
+        self._loop.call_soon_threadsafe(callback, *args)
+
+    def stop(self, timeout: float = 5) -> None:
+        if not self._thread.is_alive():
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+
+
+class _RequestSlot:
+    """
+    Concurrency slot held by a running request. The slot is given back while the
+    request waits on the user, so that requests left waiting for a confirmation in
+    open tabs do not keep other requests from being admitted.
+    """
+
+    def __init__(self, runtime: "RequestRuntime", semaphore: asyncio.Semaphore):
+        self._runtime = runtime
+        self._semaphore = semaphore
+        self._held = False
+        self._waiters = 0
+
+    @property
+    def held(self) -> bool:
+        return self._held
+
+    async def acquire(self) -> None:
+        await self._semaphore.acquire()
+        self._held = True
+
+    def release(self) -> None:
+        if self._held:
+            self._held = False
+            self._semaphore.release()
+
+    def suspend(self) -> None:
+        self._waiters += 1
+        if self._waiters == 1:
+            self._runtime._on_request_suspended()
+        self.release()
+
+    async def resume(self, reacquire: bool = True) -> None:
+        self._waiters -= 1
+        if self._waiters > 0:
+            return
+        self._runtime._on_request_resumed()
+        if reacquire and not self._held:
+            await self.acquire()
+            # another wait on the user started while the slot was reacquired
+            if self._waiters > 0:
+                self.release()
+
+
+_current_slot: contextvars.ContextVar = contextvars.ContextVar("nbi_request_slot", default=None)
+
+
+@contextlib.asynccontextmanager
+async def waiting_on_user():
+    """
+    Gives back the concurrency slot of the current request while the block waits on
+    the user and takes it back afterwards. No-op outside of the request runtime.
+    """
+    slot: _RequestSlot = _current_slot.get()
+    if slot is None:
+        yield
+        return
+    slot.suspend()
+    try:
+        yield
+    except asyncio.CancelledError:
+        # the request is being torn down, it does not need the slot back
+        await slot.resume(reacquire=False)
+        raise
+    except BaseException:
+        await slot.resume()
+        raise
+    else:
+        await slot.resume()
+
+
+class _LoopState:
+    def __init__(self, loop_thread: EventLoopThread, max_concurrency: int):
+        self.loop_thread = loop_thread
+        # created lazily on the loop's thread
+        self.semaphore: asyncio.Semaphore = None
+        self.max_concurrency = max_concurrency
+        self.admitted = 0
+
+
+class RequestRuntime:
+    """
+    Shared runtime that all websocket requests are submitted to. Requests run as tasks on
+    a small, fixed set of event loops and blocking calls made from them are offloaded to a
+    bounded thread pool, so the number of threads stays flat regardless of load.
+
+    Requests beyond the concurrency limit wait in a queue. Once the queue is full new
+    requests are rejected (admission control) instead of piling up.
+    """
+
+    def __init__(
+        self,
+        num_event_loops: int = DEFAULT_NUM_EVENT_LOOPS,
+        max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
+        max_queued_requests: int = DEFAULT_MAX_QUEUED_REQUESTS,
+        executor_max_workers: int = DEFAULT_EXECUTOR_MAX_WORKERS,
+    ):
+        self._num_event_loops = max(1, num_event_loops)
+        self._max_concurrent_requests = max(1, max_concurrent_requests)
+        self._max_queued_requests = max(0, max_queued_requests)
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, executor_max_workers),
+            thread_name_prefix="nbi-request-worker",
+        )
+        per_loop_concurrency = math.ceil(self._max_concurrent_requests / self._num_event_loops)
+        self._loops: list[_LoopState] = [
+            _LoopState(
+                EventLoopThread(f"nbi-request-loop-{i}", self._executor), per_loop_concurrency
+            )
+            for i in range(self._num_event_loops)
+        ]
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._waiting_on_user = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._max_queue_depth = 0
+        self._started = False
+
+    def start(self) -> None:
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for loop_state in self._loops:
+            loop_state.loop_thread.start()
+        log.info(
+            f"Request runtime started with {self._num_event_loops} event loop(s), "
+            f"max {self._max_concurrent_requests} concurrent and {self._max_queued_requests} queued requests"
+        )
+
+    def stop(self) -> None:
+        with self._lock:
+            if not self._started:
+                return
+            self._started = False
+        for loop_state in self._loops:
+            loop_state.loop_thread.stop()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    @property
+    def executor(self) -> concurrent.futures.Executor:
+        return self._executor
+
+    @property
+    def event_loops(self) -> list[asyncio.AbstractEventLoop]:
+        return [loop_state.loop_thread.loop for loop_state in self._loops]
+
+    def submit(self, coro: Coroutine) -> Union[concurrent.futures.Future, None]:
+        """
+        Schedule the coroutine on the runtime. Returns a future for the result, or None if
+        the request was rejected because the runtime is saturated.
+        """
+        with self._lock:
+            capacity = self._max_concurrent_requests + self._max_queued_requests
+            if not self._started or self._queued + self._running >= capacity:
+                self._rejected += 1
+                coro.close()
+                return None
+            self._submitted += 1
+            self._queued += 1
+            self._max_queue_depth = max(self._max_queue_depth, self._queued)
+            # dispatch to the least loaded loop
+            loop_state = min(self._loops, key=lambda state: state.admitted)
+            loop_state.admitted += 1
+
+        return loop_state.loop_thread.submit(self._run_request(loop_state, coro))
+
+    async def _run_request(self, loop_state: _LoopState, coro: Coroutine) -> Any:
+        if loop_state.semaphore is None:
+            loop_state.semaphore = asyncio.Semaphore(loop_state.max_concurrency)
+
+        slot = _RequestSlot(self, loop_state.semaphore)
+        started = False
+        try:
+            await slot.acquire()
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+            started = True
+            _current_slot.set(slot)
+            result = await coro
+            with self._lock:
+                self._completed += 1
+            return result
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.error(f"Error while running request: {e}")
+            with self._lock:
+                self._failed += 1
+        finally:
+            slot.release()
+            with self._lock:
+                if started:
+                    self._running -= 1
+                else:
+                    self._queued -= 1
+                    coro.close()
+                loop_state.admitted -= 1
+
+    def _on_request_suspended(self) -> None:
+        with self._lock:
+            self._waiting_on_user += 1
+
+    def _on_request_resumed(self) -> None:
+        with self._lock:
+            self._waiting_on_user -= 1
+
+    @property
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "event_loops": self._num_event_loops,
+                "max_concurrent_requests": self._max_concurrent_requests,
+                "max_queued_requests": self._max_queued_requests,
+                "executor_max_workers": self._executor._max_workers,
+                "running": self._running,
+                "waiting_on_user": self._waiting_on_user,
+                "queued": self._queued,
+                "max_queue_depth": self._max_queue_depth,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+            }
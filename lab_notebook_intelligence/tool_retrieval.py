@@ -0,0 +1,180 @@
+# Copyright (c) Mehmet Bektas <mbektasgh@outlook.com>
+
+import math
+import re
+import threading
+from collections import Counter
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# tool names are repeated in their document to weigh them over descriptions
+NAME_WEIGHT = 2
+# number of recent chat messages added to the prompt when scoring tools
+QUERY_HISTORY_MESSAGES = 4
+
+_WORD = re.compile(r"[A-Za-z][a-z]+|[A-Z]+(?![a-z])|[0-9]+")
+_STOP_WORDS = frozenset(
+    [
+        "a",
+        "an",
+        "and",
+        "are",
+        "as",
+        "at",
+        "be",
+        "by",
+        "for",
+        "from",
+        "in",
+        "is",
+        "it",
+        "of",
+        "on",
+        "or",
+        "that",
+        "the",
+        "this",
+        "to",
+        "with",
+    ]
+)
+
+
+def _stem(word: str) -> str:
+    # plurals match their singular, e.g. files and file
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lowercase words of text. Identifiers like read_file and readFile are split into
+    their words.
+    """
+    return [
+        _stem(word)
+        for word in (match.lower() for match in _WORD.findall(text or ""))
+        if word not in _STOP_WORDS
+    ]
+
+
+def _schema_terms(schema: dict) -> list[str]:
+    function = schema.get("function", {})
+    terms = tokenize(function.get("name", "")) * NAME_WEIGHT
+    terms += tokenize(function.get("description", ""))
+    parameters = function.get("parameters", {})
+    properties = parameters.get("properties", {}) if isinstance(parameters, dict) else {}
+    if isinstance(properties, dict):
+        for name, property in properties.items():
+            terms += tokenize(name)
+            if isinstance(property, dict):
+                terms += tokenize(property.get("description", ""))
+    return terms
+
+
+class ToolSearchIndex:
+    """
+    BM25 index over tool names, descriptions and parameters, used to send the model
+    only the tool schemas relevant to a request.
+    """
+
+    def __init__(self, schemas: list[dict]):
+        self._schemas = schemas
+        self._names = [schema.get("function", {}).get("name", "") for schema in schemas]
+        self._term_counts = [Counter(_schema_terms(schema)) for schema in schemas]
+        self._lengths = [sum(counts.values()) for counts in self._term_counts]
+        self._average_length = sum(self._lengths) / max(len(self._lengths), 1)
+        document_frequency = Counter()
+        for counts in self._term_counts:
+            document_frequency.update(counts.keys())
+        documents = len(schemas)
+        self._idf = {
+            term: math.log(1 + (documents - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in document_frequency.items()
+        }
+
+    def scores(self, query: str) -> list[float]:
+        query_terms = set(tokenize(query))
+        scores = []
+        for counts, length in zip(self._term_counts, self._lengths):
+            score = 0
+            for term in query_terms:
+                frequency = counts.get(term, 0)
+                if frequency == 0:
+                    continue
+                normalization = BM25_K1 * (
+                    1 - BM25_B + BM25_B * length / max(self._average_length, 1)
+                )
+                score += self._idf[term] * frequency * (BM25_K1 + 1) / (frequency + normalization)
+            scores.append(score)
+        return scores
+
+    def select(self, query: str, top_k: int, keep: set[str] = set()) -> list[dict]:
+        """
+        Schemas of the top_k tools that match the query best and of the tools in keep,
+        in their original order. All schemas are returned if there are no more than
+        top_k tools besides the kept ones or none of them matches the query.
+        """
+        candidates = sum(1 for name in self._names if name not in keep)
+        if top_k <= 0 or candidates <= top_k:
+            return self._schemas
+        scores = self.scores(query)
+        ranked = [
+            i
+            for i in sorted(range(len(scores)), key=lambda i: (-scores[i], i))
+            if scores[i] > 0 and self._names[i] not in keep
+        ]
+        if len(ranked) == 0:
+            return self._schemas
+        selected = set(ranked[:top_k])
+        return [
+            schema
+            for i, schema in enumerate(self._schemas)
+            if i in selected or self._names[i] in keep
+        ]
+
+
+def tool_query(prompt: str, chat_history: list[dict]) -> str:
+    """
+    Text that tools are scored against: the prompt and the latest chat messages.
+    """
+    recent = [
+        message["content"]
+        for message in chat_history[-QUERY_HISTORY_MESSAGES:]
+        if message.get("role") in ("user", "assistant") and isinstance(message.get("content"), str)
+    ]
+    return "\n".join([prompt or ""] + recent)
+
+
+class ToolRetrievalStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.rounds = 0
+        self.pruned_rounds = 0
+        self.tools_available = 0
+        self.tools_sent = 0
+        self.tokens_saved = 0
+
+    def record(self, tools_available: int, tools_sent: int, tokens_saved: int) -> None:
+        with self._lock:
+            self.rounds += 1
+            if tools_sent < tools_available:
+                self.pruned_rounds += 1
+            self.tools_available += tools_available
+            self.tools_sent += tools_sent
+            self.tokens_saved += tokens_saved
+
+    @property
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "rounds": self.rounds,
+                "pruned_rounds": self.pruned_rounds,
+                "tools_available": self.tools_available,
+                "tools_sent": self.tools_sent,
+                "tokens_saved": self.tokens_saved,
+            }
+
+
+tool_retrieval_stats = ToolRetrievalStats()
@@ -2,7 +2,9 @@
 
 import asyncio
 import base64
+import hashlib
 import os
+import threading
 
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
@@ -38,35 +40,116 @@ def extract_llm_generated_code(code: str) -> str:
     return "\n".join(lines)
 
 
-def encrypt_with_password(password: str, data: bytes) -> bytes:
-    salt = os.urandom(16)
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=32,
-        salt=salt,
-        iterations=1200000,
-    )
-    key = base64.urlsafe_b64encode(kdf.derive(password.encode()))
-    f = Fernet(key)
-    encrypted_data = f.encrypt(data)
+KDF_ITERATIONS = 1200000
+SALT_LENGTH = 16
+
+
+def _sha256(data: bytes) -> bytes:
+    return hashlib.sha256(data).digest()
+
+
+class CredentialVault:
+    """
+    In-memory cache for password based encryption. PBKDF2 key derivation is
+    deliberately slow, so derived keys are cached per password and salt, and
+    the latest secret of each password is cached by its ciphertext hash.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._derived_keys: dict[tuple[bytes, bytes], bytes] = {}
+        # salt reused for encryption so that its derived key can be reused
+        self._encryption_salts: dict[bytes, bytes] = {}
+        # password hash to ciphertext hash and plaintext, re-encrypting or refreshing
+        # a secret replaces the entry instead of keeping old plaintexts in memory
+        self._secrets: dict[bytes, tuple[bytes, bytes]] = {}
+        self._kdf_invocations = 0
+        self._secret_cache_hits = 0
+
+    def _derive_key(self, password: str, salt: bytes) -> bytes:
+        cache_key = (_sha256(password.encode()), salt)
+        with self._lock:
+            key = self._derived_keys.get(cache_key)
+            if key is not None:
+                return key
+
+        kdf = PBKDF2HMAC(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=salt,
+            iterations=KDF_ITERATIONS,
+        )
+        key = base64.urlsafe_b64encode(kdf.derive(password.encode()))
+
+        with self._lock:
+            self._kdf_invocations += 1
+            self._derived_keys[cache_key] = key
+            self._encryption_salts.setdefault(cache_key[0], salt)
+
+        return key
+
+    def encrypt(self, password: str, data: bytes) -> bytes:
+        with self._lock:
+            salt = self._encryption_salts.get(_sha256(password.encode()))
+        if salt is None:
+            salt = os.urandom(SALT_LENGTH)
+        f = Fernet(self._derive_key(password, salt))
+        encrypted_data_with_salt = salt + f.encrypt(data)
+
+        with self._lock:
+            self._secrets[_sha256(password.encode())] = (_sha256(encrypted_data_with_salt), data)
+
+        return encrypted_data_with_salt
+
+    def decrypt(self, password: str, encrypted_data_with_salt: bytes) -> bytes:
+        password_hash = _sha256(password.encode())
+        ciphertext_hash = _sha256(encrypted_data_with_salt)
+        with self._lock:
+            cached = self._secrets.get(password_hash)
+            if cached is not None and cached[0] == ciphertext_hash:
+                self._secret_cache_hits += 1
+                return cached[1]
+
+        salt = encrypted_data_with_salt[:SALT_LENGTH]
+        encrypted_data = encrypted_data_with_salt[SALT_LENGTH:]
+        f = Fernet(self._derive_key(password, salt))
+        data = f.decrypt(encrypted_data)
+
+        with self._lock:
+            self._secrets[password_hash] = (ciphertext_hash, data)
+
+        return data
+
+    def clear(self) -> None:
+        with self._lock:
+            self._derived_keys.clear()
+            self._encryption_salts.clear()
+            self._secrets.clear()
+
+    @property
+    def kdf_invocations(self) -> int:
+        return self._kdf_invocations
+
+    @property
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "kdf_invocations": self._kdf_invocations,
+                "secret_cache_hits": self._secret_cache_hits,
+                "cached_derived_keys": len(self._derived_keys),
+                "cached_secrets": len(self._secrets),
+            }
+
+
+credential_vault = CredentialVault()
+
 
-    return salt + encrypted_data
+def encrypt_with_password(password: str, data: bytes) -> bytes:
+    return credential_vault.encrypt(password, data)
 
 
 def decrypt_with_password(password: str, encrypted_data_with_salt: bytes) -> bytes:
-    salt = encrypted_data_with_salt[:16]
-    encrypted_data = encrypted_data_with_salt[16:]
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=32,
-        salt=salt,
-        iterations=1200000,
-    )
-    key = base64.urlsafe_b64encode(kdf.derive(password.encode()))
-    f = Fernet(key)
-    decrypted_data = f.decrypt(encrypted_data)
-
-    return decrypted_data
+    return credential_vault.decrypt(password, encrypted_data_with_salt)
 
 
 class ThreadSafeWebSocketConnector:
@@ -0,0 +1,143 @@
+# Copyright (c) Mehmet Bektas <mbektasgh@outlook.com>
+
+import json
+import logging
+import threading
+from enum import Enum
+
+from tornado import ioloop
+from tornado.websocket import WebSocketClosedError, WebSocketHandler
+
+from lab_notebook_intelligence.api import BackendMessageType, ResponseStreamDataType
+
+log = logging.getLogger(__name__)
+
+COMPACT_PROTOCOL = "compact"
+FLUSH_INTERVAL = 0.016
+FLUSH_SIZE = 1024
+
+
+class CompactMessageType(str, Enum):
+    # LLM content delta, [type, id, participant, text]
+    ContentDelta = "c"
+    # markdown part delta, [type, id, participant, text]
+    MarkdownPartDelta = "p"
+    # any other message in its regular format, [type, message]
+    Message = "m"
+    # end of stream, [type, id, participant]
+    StreamEnd = "e"
+
+
+def _compact_entry(message: dict) -> list:
+    message_type = message.get("type")
+    if message_type == BackendMessageType.StreamEnd:
+        return [CompactMessageType.StreamEnd, message["id"], message.get("participant")]
+
+    if message_type == BackendMessageType.StreamMessage:
+        choices = message.get("data", {}).get("choices")
+        if isinstance(choices, list) and len(choices) == 1:
+            delta = choices[0].get("delta")
+            if isinstance(delta, dict):
+                nbi_content = delta.get("nbiContent")
+                if nbi_content is None:
+                    content = delta.get("content")
+                    if isinstance(content, str) and set(delta.keys()) <= {"content", "role"}:
+                        return [
+                            CompactMessageType.ContentDelta,
+                            message["id"],
+                            message.get("participant"),
+                            content,
+                        ]
+                elif nbi_content.get("type") == ResponseStreamDataType.MarkdownPart and isinstance(
+                    nbi_content.get("content"), str
+                ):
+                    return [
+                        CompactMessageType.MarkdownPartDelta,
+                        message["id"],
+                        message.get("participant"),
+                        nbi_content["content"],
+                    ]
+
+    return [CompactMessageType.Message, message]
+
+
+class WebsocketStreamWriter:
+    """
+    Writes messages to a websocket from any thread. Writes are handed over to the
+    IO loop that owns the websocket.
+
+    With the compact protocol, consecutive text deltas of a message are merged and
+    messages are sent in batches, flushed every FLUSH_INTERVAL seconds or once
+    FLUSH_SIZE bytes of text are pending. Other messages flush the batch right away
+    to keep their latency low.
+    """
+
+    def __init__(self, websocket_handler: WebSocketHandler, compact: bool = False):
+        self._websocket_handler = websocket_handler
+        self._compact = compact
+        self._io_loop = ioloop.IOLoop.current()
+        self._owner_thread_id = threading.get_ident()
+        self._pending: list[list] = []
+        self._pending_size = 0
+        self._flush_handle = None
+        self._closed = False
+
+    @property
+    def compact(self) -> bool:
+        return self._compact
+
+    def write_message(self, message: dict) -> None:
+        if threading.get_ident() == self._owner_thread_id:
+            self._write_message(message)
+        else:
+            self._io_loop.add_callback(self._write_message, message)
+
+    def _write_message(self, message: dict) -> None:
+        if self._closed:
+            return
+        if not self._compact:
+            self._send(message)
+            return
+
+        entry = _compact_entry(message)
+        if entry[0] in (CompactMessageType.ContentDelta, CompactMessageType.MarkdownPartDelta):
+            last = self._pending[-1] if len(self._pending) > 0 else None
+            if last is not None and last[:3] == entry[:3]:
+                last[3] += entry[3]
+            else:
+                self._pending.append(entry)
+            self._pending_size += len(entry[3])
+            if self._pending_size >= FLUSH_SIZE:
+                self.flush()
+            elif self._flush_handle is None:
+                self._flush_handle = self._io_loop.call_later(FLUSH_INTERVAL, self.flush)
+        else:
+            self._pending.append(entry)
+            self.flush()
+
+    def flush(self) -> None:
+        if self._flush_handle is not None:
+            self._io_loop.remove_timeout(self._flush_handle)
+            self._flush_handle = None
+        if len(self._pending) == 0:
+            return
+        pending = self._pending
+        self._pending = []
+        self._pending_size = 0
+        self._send(pending)
+
+    def _send(self, message) -> None:
+        try:
+            self._websocket_handler.write_message(json.dumps(message))
+        except WebSocketClosedError:
+            self.close()
+        except Exception as e:
+            log.error(f"Failed to write websocket message: {e}")
+
+    def close(self) -> None:
+        self._closed = True
+        self._pending = []
+        self._pending_size = 0
+        if self._flush_handle is not None:
+            self._io_loop.remove_timeout(self._flush_handle)
+            self._flush_handle = None
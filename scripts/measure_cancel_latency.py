@@ -0,0 +1,326 @@
+# Copyright (c) Mehmet Bektas <mbektasgh@outlook.com>
+
+"""
+Measures how fast a cancelled chat request is aborted, for each LLM provider.
+
+A local fake server streams a completion slowly. Each provider's async chat
+completion is started against it and its cancel token is cancelled mid-stream.
+The request task has to end and the upstream connection has to be closed within
+the bound, otherwise the script fails.
+
+    python scripts/measure_cancel_latency.py [--bound 1.0] [--provider ollama]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import select
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# litellm fetches its model cost map over the network unless told otherwise
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+# the fake server is local, proxies configured for the upstream APIs must not be used
+os.environ["NO_PROXY"] = ",".join(
+    filter(None, [os.environ.get("NO_PROXY"), "127.0.0.1", "localhost"])
+)
+os.environ["no_proxy"] = os.environ["NO_PROXY"]
+
+from lab_notebook_intelligence.api import CancelToken, ChatResponse, SignalImpl
+
+MODEL_ID = "fake-model"
+# seconds between streamed chunks and the total length of a stream
+CHUNK_INTERVAL = 0.2
+STREAM_DURATION = 30
+# chunks received before the request is cancelled
+CANCEL_AFTER_CHUNKS = 3
+FIRST_CHUNKS_TIMEOUT = 10
+DEFAULT_BOUND = 1.0
+
+
+def _sse_chunk(index: int) -> bytes:
+    chunk = {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion.chunk",
+        "created": 0,
+        "model": MODEL_ID,
+        "choices": [
+            {
+                "index": 0,
+                "delta": {"role": "assistant", "content": f"token{index} "},
+                "finish_reason": None,
+            }
+        ],
+    }
+    return f"data: {json.dumps(chunk)}\n\n".encode()
+
+
+def _ndjson_chunk(index: int) -> bytes:
+    chunk = {
+        "model": MODEL_ID,
+        "created_at": "2025-01-01T00:00:00Z",
+        "message": {"role": "assistant", "content": f"token{index} "},
+        "done": False,
+    }
+    return f"{json.dumps(chunk)}\n".encode()
+
+
+class _SlowStreamHandler(BaseHTTPRequestHandler):
+    """
+    Streams chat completion chunks in OpenAI server-sent event format, or in Ollama's
+    newline delimited JSON format for /api/chat, and records when the client closes
+    the connection.
+    """
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        ollama = self.path.rstrip("/").endswith("/api/chat")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson" if ollama else "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.server.stream_started.set()
+
+        deadline = time.monotonic() + STREAM_DURATION
+        index = 0
+        try:
+            while time.monotonic() < deadline:
+                self.wfile.write(_ndjson_chunk(index) if ollama else _sse_chunk(index))
+                self.wfile.flush()
+                index += 1
+                if self._wait_for_close(CHUNK_INTERVAL):
+                    break
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.server.on_stream_closed()
+
+    def _wait_for_close(self, timeout: float) -> bool:
+        # the request body is read already, the socket only becomes readable on close
+        readable, _, _ = select.select([self.connection], [], [], timeout)
+        if len(readable) == 0:
+            return False
+        try:
+            return self.connection.recv(1, socket.MSG_PEEK) == b""
+        except (ConnectionResetError, OSError):
+            return True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeStreamingServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SlowStreamHandler)
+        self.stream_started = threading.Event()
+        self.stream_closed = threading.Event()
+        self.closed_at: float = None
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def reset(self) -> None:
+        self.stream_started.clear()
+        self.stream_closed.clear()
+        self.closed_at = None
+
+    def on_stream_closed(self) -> None:
+        self.closed_at = time.monotonic()
+        self.stream_closed.set()
+
+
+class HarnessCancelToken(CancelToken):
+    def __init__(self):
+        super().__init__()
+        self._cancellation_signal = SignalImpl()
+
+    def cancel_request(self) -> None:
+        self._cancellation_requested = True
+        self._cancellation_signal.emit()
+
+
+class RecordingResponse(ChatResponse):
+    def __init__(self, chunks_to_wait_for: int):
+        super().__init__()
+        self._loop = asyncio.get_running_loop()
+        self._chunks_to_wait_for = chunks_to_wait_for
+        self.chunks = 0
+        self.finish_calls = 0
+        self.received = asyncio.Event()
+
+    @property
+    def message_id(self) -> str:
+        return "cancel-latency"
+
+    def stream(self, data, finish: bool = False) -> None:
+        self.chunks += 1
+        if self.chunks == self._chunks_to_wait_for:
+            self._loop.call_soon_threadsafe(self.received.set)
+        if finish:
+            self.finish()
+
+    def finish(self) -> None:
+        self.finish_calls += 1
+
+
+def _openai_compatible_model(base_url: str):
+    from lab_notebook_intelligence.llm_providers.openai_compatible_llm_provider import (
+        OpenAICompatibleLLMProvider,
+    )
+
+    model = OpenAICompatibleLLMProvider().chat_models[0]
+    model.set_property_value("model_id", MODEL_ID)
+    model.set_property_value("base_url", f"{base_url}/v1")
+    model.set_property_value("api_key", "fake-key")
+    return model
+
+
+def _litellm_compatible_model(base_url: str):
+    from lab_notebook_intelligence.llm_providers.litellm_compatible_llm_provider import (
+        LiteLLMCompatibleLLMProvider,
+    )
+
+    model = LiteLLMCompatibleLLMProvider().chat_models[0]
+    model.set_property_value("model_id", f"openai/{MODEL_ID}")
+    model.set_property_value("base_url", f"{base_url}/v1")
+    model.set_property_value("api_key", "fake-key")
+    return model
+
+
+def _ollama_model(base_url: str):
+    from lab_notebook_intelligence.llm_providers.ollama_llm_provider import (
+        OllamaChatModel,
+        OllamaLLMProvider,
+    )
+
+    # the client connects to OLLAMA_HOST
+    os.environ["OLLAMA_HOST"] = base_url
+    return OllamaChatModel(OllamaLLMProvider(), MODEL_ID, MODEL_ID, 4096)
+
+
+def _github_copilot_model(base_url: str):
+    from lab_notebook_intelligence import github_copilot
+    from lab_notebook_intelligence.llm_providers.github_copilot_llm_provider import (
+        GitHubCopilotLLMProvider,
+    )
+
+    github_copilot.API_ENDPOINT = base_url
+    github_copilot.github_auth["token"] = "fake-token"
+    return GitHubCopilotLLMProvider().chat_models[0]
+
+
+PROVIDERS = {
+    "openai-compatible": _openai_compatible_model,
+    "litellm-compatible": _litellm_compatible_model,
+    "ollama": _ollama_model,
+    "github-copilot": _github_copilot_model,
+}
+
+
+async def measure(name: str, server: FakeStreamingServer, bound: float) -> list[str]:
+    """
+    Cancels a streaming chat completion of the provider mid-stream. Returns the
+    failures, an empty list if the request was aborted within bound seconds.
+    """
+    server.reset()
+    model = PROVIDERS[name](server.base_url)
+    cancel_token = HarnessCancelToken()
+    response = RecordingResponse(CANCEL_AFTER_CHUNKS)
+    task = asyncio.create_task(
+        model.acompletions(
+            [{"role": "user", "content": "Count slowly."}],
+            response=response,
+            cancel_token=cancel_token,
+        )
+    )
+
+    try:
+        await asyncio.wait_for(response.received.wait(), FIRST_CHUNKS_TIMEOUT)
+    except asyncio.TimeoutError:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return [f"no stream received within {FIRST_CHUNKS_TIMEOUT}s"]
+
+    # cancellation is requested from the websocket thread in the server
+    cancelled_at = time.monotonic()
+    await asyncio.to_thread(cancel_token.cancel_request)
+
+    failures = []
+    try:
+        await asyncio.wait_for(task, bound)
+        task_latency = time.monotonic() - cancelled_at
+    except asyncio.TimeoutError:
+        task_latency = None
+        failures.append(f"request task still running {bound}s after cancel")
+    except Exception as e:
+        task_latency = time.monotonic() - cancelled_at
+        failures.append(f"request task failed: {e!r}")
+
+    remaining = max(bound - (time.monotonic() - cancelled_at), 0)
+    if await asyncio.to_thread(server.stream_closed.wait, remaining):
+        close_latency = server.closed_at - cancelled_at
+    else:
+        close_latency = None
+        failures.append(f"upstream connection still open {bound}s after cancel")
+
+    if response.finish_calls != 1:
+        failures.append(f"response finished {response.finish_calls} times, expected once")
+
+    def _format(latency):
+        return f"{latency * 1000:.0f} ms" if latency is not None else "timeout"
+
+    print(
+        f"{name:<20} task ended: {_format(task_latency):>8}   "
+        f"connection closed: {_format(close_latency):>8}   "
+        f"chunks before abort: {response.chunks}"
+    )
+    return failures
+
+
+async def main(providers: list[str], bound: float) -> int:
+    server = FakeStreamingServer()
+    server.start()
+    failed = False
+    try:
+        for name in providers:
+            failures = await measure(name, server, bound)
+            for failure in failures:
+                print(f"  FAILED: {failure}")
+            failed = failed or len(failures) > 0
+    finally:
+        server.stop()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure time-to-abort of cancelled requests")
+    parser.add_argument(
+        "--bound",
+        type=float,
+        default=DEFAULT_BOUND,
+        help="seconds within which the request has to end and its connection close",
+    )
+    parser.add_argument(
+        "--provider",
+        action="append",
+        choices=list(PROVIDERS.keys()),
+        help="provider to measure, all providers by default",
+    )
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.provider or list(PROVIDERS.keys()), args.bound)))
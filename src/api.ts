@@ -7,13 +7,15 @@ import { UUID } from '@lumino/coreutils';
 import { Signal } from '@lumino/signaling';
 import {
   GITHUB_COPILOT_PROVIDER_ID,
+  IActiveDocumentState,
   IChatCompletionResponseEmitter,
   IChatParticipant,
   IContextItem,
   ITelemetryEvent,
   IToolSelections,
   RequestDataType,
-  BackendMessageType
+  BackendMessageType,
+  ResponseStreamDataType
 } from './tokens';
 
 export enum GitHubCopilotLoginStatus {
@@ -82,6 +84,78 @@ export class NBIConfig {
   changed = new Signal<this, void>(this);
 }
 
+const COMPACT_PROTOCOL = 'compact';
+
+enum CompactMessageType {
+  ContentDelta = 'c',
+  MarkdownPartDelta = 'p',
+  Message = 'm',
+  StreamEnd = 'e'
+}
+
+/**
+ * Expands a websocket frame into backend messages. Frames of the compact
+ * protocol are batches of entries with merged text deltas.
+ */
+function expandWebSocketMessage(frame: any): any[] {
+  if (!Array.isArray(frame)) {
+    return [frame];
+  }
+
+  const created = new Date().toISOString();
+  const messages: any[] = [];
+  for (const entry of frame) {
+    switch (entry[0]) {
+      case CompactMessageType.ContentDelta:
+        messages.push({
+          id: entry[1],
+          participant: entry[2],
+          type: BackendMessageType.StreamMessage,
+          data: {
+            choices: [{ delta: { content: entry[3], role: 'assistant' } }]
+          },
+          created
+        });
+        break;
+      case CompactMessageType.MarkdownPartDelta:
+        messages.push({
+          id: entry[1],
+          participant: entry[2],
+          type: BackendMessageType.StreamMessage,
+          data: {
+            choices: [
+              {
+                delta: {
+                  nbiContent: {
+                    type: ResponseStreamDataType.MarkdownPart,
+                    content: entry[3]
+                  },
+                  content: '',
+                  role: 'assistant'
+                }
+              }
+            ]
+          },
+          created
+        });
+        break;
+      case CompactMessageType.StreamEnd:
+        messages.push({
+          id: entry[1],
+          participant: entry[2],
+          type: BackendMessageType.StreamEnd,
+          data: {}
+        });
+        break;
+      case CompactMessageType.Message:
+        messages.push(entry[1]);
+        break;
+    }
+  }
+
+  return messages;
+}
+
 export class NBIAPI {
   static _loginStatus = GitHubCopilotLoginStatus.NotLoggedIn;
   static _deviceVerificationInfo: IDeviceVerificationInfo = {
@@ -93,6 +167,11 @@ export class NBIAPI {
   static config = new NBIConfig();
   static configChanged = this.config.changed;
   static githubLoginStatusChanged = new Signal<unknown, void>(this);
+  // set by the plugin, the server reads the active document with it
+  static getActiveDocumentState: () => IActiveDocumentState = () => ({
+    path: '',
+    dirty: true
+  });
 
   static async initialize() {
     await this.fetchCapabilities();
@@ -101,26 +180,34 @@ export class NBIAPI {
     NBIAPI.initializeWebsocket();
 
     this._messageReceived.connect((_, msg) => {
-      msg = JSON.parse(msg);
       if (msg.type === BackendMessageType.GitHubCopilotLoginStatusChange) {
         this.updateGitHubLoginStatus().then(() => {
           this.githubLoginStatusChanged.emit();
         });
+      } else if (msg.type === BackendMessageType.MCPToolsChange) {
+        // tools discovered in the background replace the cached ones
+        this.fetchCapabilities();
       }
     });
   }
 
   static async initializeWebsocket() {
     const serverSettings = ServerConnection.makeSettings();
-    const wsUrl = URLExt.join(
-      serverSettings.wsUrl,
-      'lab-notebook-intelligence',
-      'copilot'
-    );
+    const wsUrl =
+      URLExt.join(
+        serverSettings.wsUrl,
+        'lab-notebook-intelligence',
+        'copilot'
+      ) + `?protocol=${COMPACT_PROTOCOL}`;
 
     this._webSocket = new serverSettings.WebSocket(wsUrl);
+    this._webSocket.onopen = () => {
+      NBIAPI.notifyActiveDocumentChanged();
+    };
     this._webSocket.onmessage = msg => {
-      this._messageReceived.emit(msg.data);
+      for (const message of expandWebSocketMessage(JSON.parse(msg.data))) {
+        this._messageReceived.emit(message);
+      }
     };
 
     this._webSocket.onerror = msg => {
@@ -136,6 +223,19 @@ export class NBIAPI {
     };
   }
 
+  static notifyActiveDocumentChanged() {
+    if (this._webSocket?.readyState !== WebSocket.OPEN) {
+      return;
+    }
+    this._webSocket.send(
+      JSON.stringify({
+        id: UUID.uuid4(),
+        type: RequestDataType.ActiveDocumentChange,
+        data: { activeDocument: this.getActiveDocumentState() }
+      })
+    );
+  }
+
   static getLoginStatus(): GitHubCopilotLoginStatus {
     return this._loginStatus;
   }
@@ -316,7 +416,6 @@ export class NBIAPI {
     responseEmitter: IChatCompletionResponseEmitter
   ) {
     this._messageReceived.connect((_, msg) => {
-      msg = JSON.parse(msg);
       if (msg.id === messageId) {
         responseEmitter.emit(msg);
       }
@@ -332,7 +431,8 @@ export class NBIAPI {
           filename,
           additionalContext,
           chatMode,
-          toolSelections
+          toolSelections,
+          activeDocument: this.getActiveDocumentState()
         }
       })
     );
@@ -350,7 +450,6 @@ export class NBIAPI {
   ) {
     const messageId = UUID.uuid4();
     this._messageReceived.connect((_, msg) => {
-      msg = JSON.parse(msg);
       if (msg.id === messageId) {
         responseEmitter.emit(msg);
       }
@@ -402,7 +501,6 @@ export class NBIAPI {
     responseEmitter: IChatCompletionResponseEmitter
   ) {
     this._messageReceived.connect((_, msg) => {
-      msg = JSON.parse(msg);
       if (msg.id === messageId) {
         responseEmitter.emit(msg);
       }
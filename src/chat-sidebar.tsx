@@ -315,6 +315,16 @@ interface IChatMessage {
 
 const answeredForms = new Map<string, string>();
 
+function serializableUICommandResult(result: any): any {
+  result = result || 'void';
+  try {
+    JSON.stringify(result);
+  } catch (error) {
+    return 'Could not serialize the result';
+  }
+  return result;
+}
+
 function ChatResponseHTMLFrame(props: any) {
   const iframSrc = useMemo(
     () => URL.createObjectURL(new Blob([props.source], { type: 'text/html' })),
@@ -1432,19 +1442,39 @@ function SidebarComponent(props: any) {
 
             const data = {
               callback_id: response.data.callback_id,
-              result: result || 'void'
+              result: serializableUICommandResult(result),
+              activeDocument: NBIAPI.getActiveDocumentState()
             };
 
-            try {
-              JSON.stringify(data);
-            } catch (error) {
-              data.result = 'Could not serialize the result';
+            NBIAPI.sendWebSocketMessage(
+              messageId,
+              RequestDataType.RunUICommandResponse,
+              data
+            );
+          } else if (response.type === BackendMessageType.RunUICommands) {
+            // commands of a batch run in order and are answered together
+            const messageId = response.id;
+            const results = [];
+            for (const command of response.data.commands) {
+              try {
+                const result = await app.commands.execute(
+                  command.commandId,
+                  command.args
+                );
+                results.push(serializableUICommandResult(result));
+              } catch (error) {
+                results.push(`Failed to run command: ${error}`);
+              }
             }
 
             NBIAPI.sendWebSocketMessage(
               messageId,
               RequestDataType.RunUICommandResponse,
-              data
+              {
+                callback_id: response.data.callback_id,
+                result: results,
+                activeDocument: NBIAPI.getActiveDocumentState()
+              }
             );
           }
           setChatMessages([
@@ -2149,7 +2179,11 @@ function SidebarComponent(props: any) {
                 {toolConfig.mcpServers.map((mcpServer, index: number) => (
                   <div className="mode-tools-group">
                     <CheckBoxItem
-                      label={mcpServer.id}
+                      label={
+                        mcpServer.circuitState === 'open'
+                          ? `${mcpServer.id} (unavailable)`
+                          : mcpServer.id
+                      }
                       header={true}
                       checked={getMCPServerState(mcpServer.id)}
                       onClick={() => onMCPServerClicked(mcpServer.id)}
@@ -7,7 +7,11 @@ import {
 } from '@jupyterlab/application';
 
 import { IDocumentManager } from '@jupyterlab/docmanager';
-import { DocumentWidget, IDocumentWidget } from '@jupyterlab/docregistry';
+import {
+  DocumentRegistry,
+  DocumentWidget,
+  IDocumentWidget
+} from '@jupyterlab/docregistry';
 
 import { Dialog, ICommandPalette } from '@jupyterlab/apputils';
 import { IMainMenu } from '@jupyterlab/mainmenu';
@@ -15,7 +19,7 @@ import { IMainMenu } from '@jupyterlab/mainmenu';
 import { IEditorLanguageRegistry } from '@jupyterlab/codemirror';
 
 import { CodeCell } from '@jupyterlab/cells';
-import { ISharedNotebook } from '@jupyter/ydoc';
+import { ISharedCodeCell, ISharedNotebook } from '@jupyter/ydoc';
 
 import { ISettingRegistry } from '@jupyterlab/settingregistry';
 
@@ -55,6 +59,7 @@ import {
   BackendMessageType,
   GITHUB_COPILOT_PROVIDER_ID,
   IActiveDocumentInfo,
+  IActiveDocumentState,
   ICellContents,
   INotebookIntelligence,
   ITelemetryEmitter,
@@ -125,15 +130,21 @@ namespace CommandIDs {
     'lab-notebook-intelligence:get-number-of-cells';
   export const getCellOutput = 'lab-notebook-intelligence:get-cell-output';
   export const runCellAtIndex = 'lab-notebook-intelligence:run-cell-at-index';
+  export const setCellOutputsAtIndex =
+    'lab-notebook-intelligence:set-cell-outputs-at-index';
   export const getCurrentFileContent =
     'lab-notebook-intelligence:get-current-file-content';
   export const setCurrentFileContent =
     'lab-notebook-intelligence:set-current-file-content';
   export const openMCPConfigEditor =
     'lab-notebook-intelligence:open-mcp-config-editor';
+  export const scheduleSaveActiveNotebook =
+    'lab-notebook-intelligence:schedule-save-active-notebook';
 }
 
 const DOCUMENT_WATCH_INTERVAL = 1000;
+// saves requested in quick succession are written to disk once
+const NOTEBOOK_SAVE_DEBOUNCE_DELAY = 1000;
 const MAX_TOKENS = 4096;
 const githubCopilotIcon = new LabIcon({
   name: 'lab-notebook-intelligence:github-copilot-icon',
@@ -167,14 +178,35 @@ class ActiveDocumentWatcher {
 
     ActiveDocumentWatcher.activeDocumentInfo.activeWidget =
       app.shell.currentWidget;
+    ActiveDocumentWatcher.watchDirtyState(app.shell.currentWidget);
     ActiveDocumentWatcher.handleWatchDocument();
   }
 
+  /**
+   * The server reads saved documents from disk, it is notified as soon as the
+   * active document gets unsaved changes or is saved.
+   */
+  static watchDirtyState(widget: Widget) {
+    ActiveDocumentWatcher._dirtyStateModel?.stateChanged.disconnect(
+      ActiveDocumentWatcher.onModelStateChanged
+    );
+    const model = (widget as DocumentWidget)?.context?.model;
+    ActiveDocumentWatcher._dirtyStateModel = model ?? null;
+    model?.stateChanged.connect(ActiveDocumentWatcher.onModelStateChanged);
+  }
+
+  private static onModelStateChanged(_model: any, args: any) {
+    if (args.name === 'dirty') {
+      NBIAPI.notifyActiveDocumentChanged();
+    }
+  }
+
   static watchDocument(widget: Widget) {
     if (ActiveDocumentWatcher.activeDocumentInfo.activeWidget === widget) {
       return;
     }
     clearInterval(ActiveDocumentWatcher._watchTimer);
+    ActiveDocumentWatcher.watchDirtyState(widget);
     ActiveDocumentWatcher.activeDocumentInfo.activeWidget = widget;
 
     ActiveDocumentWatcher._watchTimer = setInterval(() => {
@@ -235,9 +267,22 @@ class ActiveDocumentWatcher {
       )
     ) {
       ActiveDocumentWatcher.fireActiveDocumentChangedEvent();
+      if (previousDocumentInfo.filePath !== activeDocumentInfo.filePath) {
+        NBIAPI.notifyActiveDocumentChanged();
+      }
     }
   }
 
+  static getActiveDocumentState(): IActiveDocumentState {
+    const activeWidget = ActiveDocumentWatcher.activeDocumentInfo
+      .activeWidget as DocumentWidget;
+    return {
+      path: ActiveDocumentWatcher.activeDocumentInfo.filePath,
+      // documents without a model are treated as having unsaved changes
+      dirty: activeWidget?.context?.model?.dirty ?? true
+    };
+  }
+
   private static documentInfoChanged(
     lhs: IActiveDocumentInfo,
     rhs: IActiveDocumentInfo
@@ -321,6 +366,7 @@ class ActiveDocumentWatcher {
     selection: null
   };
   private static _watchTimer: any;
+  private static _dirtyStateModel: DocumentRegistry.IModel = null;
   private static _languageRegistry: IEditorLanguageRegistry;
 }
 
@@ -1266,6 +1312,36 @@ const plugin: JupyterFrontEndPlugin<INotebookIntelligence> = {
       }
     });
 
+    const pendingNotebookSaves = new Map<
+      NotebookPanel,
+      ReturnType<typeof setTimeout>
+    >();
+
+    app.commands.addCommand(CommandIDs.scheduleSaveActiveNotebook, {
+      execute: args => {
+        if (!ensureANotebookIsActive()) {
+          return false;
+        }
+
+        const np = app.shell.currentWidget as NotebookPanel;
+        clearTimeout(pendingNotebookSaves.get(np));
+        pendingNotebookSaves.set(
+          np,
+          setTimeout(() => {
+            pendingNotebookSaves.delete(np);
+            if (np.isDisposed) {
+              return;
+            }
+            np.context.save().catch(error => {
+              console.error('Failed to save notebook:', error);
+            });
+          }, NOTEBOOK_SAVE_DEBOUNCE_DELAY)
+        );
+
+        return true;
+      }
+    });
+
     app.commands.addCommand(CommandIDs.runCellAtIndex, {
       execute: async args => {
         if (!ensureANotebookIsActive()) {
@@ -1279,6 +1355,29 @@ const plugin: JupyterFrontEndPlugin<INotebookIntelligence> = {
       }
     });
 
+    app.commands.addCommand(CommandIDs.setCellOutputsAtIndex, {
+      execute: args => {
+        if (!ensureANotebookIsActive()) {
+          return false;
+        }
+
+        const np = app.shell.currentWidget as NotebookPanel;
+        const cell = np.model.sharedModel.getCell(args.cellIndex as number);
+        if (cell?.cell_type !== 'code') {
+          return false;
+        }
+
+        // outputs of a cell run on the kernel from the server
+        const codeCell = cell as ISharedCodeCell;
+        codeCell.transact(() => {
+          codeCell.setOutputs(args.outputs as any[]);
+          codeCell.execution_count = (args.executionCount as number) ?? null;
+        });
+
+        return true;
+      }
+    });
+
     app.commands.addCommand(CommandIDs.getCurrentFileContent, {
       execute: async args => {
         if (!ensureAFileEditorIsActive()) {
@@ -1873,6 +1972,9 @@ const plugin: JupyterFrontEndPlugin<INotebookIntelligence> = {
 
     const jlabApp = app as JupyterLab;
     ActiveDocumentWatcher.initialize(jlabApp, languageRegistry);
+    NBIAPI.getActiveDocumentState = () =>
+      ActiveDocumentWatcher.getActiveDocumentState();
+    NBIAPI.notifyActiveDocumentChanged();
 
     return extensionService;
   }
@@ -13,6 +13,11 @@ export interface IActiveDocumentInfo {
   selection?: CodeEditor.IRange;
 }
 
+export interface IActiveDocumentState {
+  path: string;
+  dirty: boolean;
+}
+
 export interface IChatCompletionResponseEmitter {
   emit: (response: any) => void;
 }
@@ -25,14 +30,17 @@ export enum RequestDataType {
   GenerateCode = 'generate-code',
   CancelChatRequest = 'cancel-chat-request',
   InlineCompletionRequest = 'inline-completion-request',
-  CancelInlineCompletionRequest = 'cancel-inline-completion-request'
+  CancelInlineCompletionRequest = 'cancel-inline-completion-request',
+  ActiveDocumentChange = 'active-document-change'
 }
 
 export enum BackendMessageType {
   StreamMessage = 'stream-message',
   StreamEnd = 'stream-end',
   RunUICommand = 'run-ui-command',
-  GitHubCopilotLoginStatusChange = 'github-copilot-login-status-change'
+  RunUICommands = 'run-ui-commands',
+  GitHubCopilotLoginStatusChange = 'github-copilot-login-status-change',
+  MCPToolsChange = 'mcp-tools-change'
 }
 
 export enum ResponseStreamDataType {